@@ -1,9 +1,19 @@
 #!/usr/bin/env python3
+import argparse
+import json
 import os
+import re
 import cv2
 import numpy as np
 import random
 
+from extract_patches import file_digest
+from image_seg import IMAGE_EXTENSIONS
+
+MANIFEST_FILE = ".augment_manifest.json"
+# Files written by runs that predate the manifest
+LEGACY_AUG_NAME = re.compile(r"_aug\d+$")
+
 ############################
 # 1) Define your augmentations
 ############################
@@ -30,44 +40,55 @@ def adjust_brightness_contrast(image, brightness=30, contrast=50):
     img = np.clip(img, 0, 255)
     return np.uint8(img)
 
+def add_gaussian_noise(image, sigma=10.0, np_rng=None):
+    """Add zero-mean Gaussian noise with standard deviation sigma."""
+    noise = (np_rng or np.random).normal(0, sigma, image.shape)
+    return np.uint8(np.clip(image.astype(np.float32) + noise, 0, 255))
+
 
 ############################
 # 2) Decide how many augmented images you want per real patch
 ############################
 
-def augment_image(image):
+def augment_image(image, rng=None):
     """
     Given an input patch,
     randomly choose an augmentation or combination of augmentations.
+    rng: a random.Random to draw from (e.g. random.Random(seed) for a
+         reproducible result); defaults to the global 'random' module.
     """
+    if rng is None:
+        rng = random
+    np_rng = np.random.default_rng(rng.getrandbits(32)) if rng is not random else None
+
     # We'll pick one or two transformations randomly
     transformations = []
 
     # E.g., 50% chance to rotate
-    if random.random() < 0.5:
-        angle = random.choice([90, 180, 270])
+    if rng.random() < 0.5:
+        angle = rng.choice([90, 180, 270])
         transformations.append(("rot", angle))
 
     # 50% chance to flip horizontally
-    if random.random() < 0.5:
+    if rng.random() < 0.5:
         transformations.append(("flip_h", 1))
 
     # 30% chance to flip vertically
-    if random.random() < 0.3:
+    if rng.random() < 0.3:
         transformations.append(("flip_v", 0))
 
     # 50% chance to do brightness/contrast
-    if random.random() < 0.5:
-        brightness = random.randint(-50, 50)   # range of brightness
-        contrast = random.randint(-30, 30)    # range of contrast
+    if rng.random() < 0.5:
+        brightness = rng.randint(-50, 50)   # range of brightness
+        contrast = rng.randint(-30, 30)    # range of contrast
         transformations.append(("bri_con", (brightness, contrast)))
 
     # 30% chance for gaussian blur
-    if random.random() < 0.3:
+    if rng.random() < 0.3:
         transformations.append(("blur", (5,5)))
 
     # 30% chance for random noise
-    if random.random() < 0.3:
+    if rng.random() < 0.3:
         transformations.append(("noise", None))
 
     out_img = image.copy()
@@ -82,44 +103,155 @@ def augment_image(image):
         elif t_name == "bri_con":
             brightness, contrast = param
             out_img = adjust_brightness_contrast(out_img, brightness, contrast)
+        elif t_name == "blur":
+            out_img = cv2.GaussianBlur(out_img, param, 0)
+        elif t_name == "noise":
+            out_img = add_gaussian_noise(out_img, np_rng=np_rng)
     return out_img
 
-def main():
-    labeled_data_dir = "labeled_data"
-    # We have subfolders: 'good', 'bad', 'missing'
+############################
+# 3) Incremental, manifest-driven augmentation
+############################
+
+def load_manifest(data_dir):
+    manifest_path = os.path.join(data_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
 
-    classes = ["good", "bad", "missing"]
-    # For each class subfolder, read all images, do augmentation
+def save_manifest(data_dir, manifest):
+    # Write-then-rename so an interrupted run never leaves a truncated manifest
+    manifest_path = os.path.join(data_dir, MANIFEST_FILE)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
 
-    # We'll define how many augmented images we want per real patch
-    # Example: if we do 2 augmentations per original
-    augment_per_patch = 7
+def patch_seed(content_hash, index, base_seed=0):
+    """Seed of augmented copy 'index' of a patch; depends only on its content."""
+    return (int(content_hash[:12], 16) + 1000003 * base_seed + index) % 2**32
 
+def find_originals(data_dir, manifest, classes=None):
+    """
+    Lists '<class>/<file>' keys of the original patches in data_dir/<class>/.
+    Files the manifest records as augmentation outputs, and legacy '*_aug<i>'
+    files, are derived and never returned.
+    """
+    derived = {out for entry in manifest.values() for out in entry["outputs"]}
+    if classes is None:
+        classes = sorted(d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d)))
+    originals = []
     for cls in classes:
-        class_folder = os.path.join(labeled_data_dir, cls)
-        if not os.path.exists(class_folder):
+        class_folder = os.path.join(data_dir, cls)
+        if not os.path.isdir(class_folder):
             continue
+        for f in sorted(os.listdir(class_folder)):
+            key = f"{cls}/{f}"
+            if not f.lower().endswith(IMAGE_EXTENSIONS) or key in derived:
+                continue
+            if LEGACY_AUG_NAME.search(os.path.splitext(f)[0]):
+                continue
+            originals.append(key)
+    return originals
 
-        patch_files = [f for f in os.listdir(class_folder)
-                       if f.lower().endswith((".png", ".jpg"))]
+def _remove_outputs(data_dir, outputs):
+    for out in outputs:
+        out_path = os.path.join(data_dir, *out.split("/"))
+        if os.path.exists(out_path):
+            os.remove(out_path)
 
-        for patch_file in patch_files:
-            patch_path = os.path.join(class_folder, patch_file)
-            img = cv2.imread(patch_path)
-            if img is None:
-                print(f"Could not read {patch_path}")
+def augment_dataset(data_dir="labeled_data", augment_per_patch=7, classes=None, base_seed=0,
+                    regenerate=False, save_every=100):
+    """
+    Writes augment_per_patch augmented copies next to every original patch and
+    records them in data_dir/.augment_manifest.json:
+        "<class>/<file>": {"sha1", "size", "mtime_ns", "base_seed", "seeds", "outputs"}
+    A rerun only augments originals that are new, whose content changed or
+    that were augmented with another base_seed; derived files are never
+    augmented again. Originals that were deleted or moved to another class
+    get their old copies removed ('classes' limits this to those classes).
+    Each copy's seed comes from the source's content hash and base_seed, so
+    regenerate=True rewrites byte-identical outputs for unchanged sources.
+    Returns {"augmented", "skipped", "removed"} counts.
+    """
+    manifest = load_manifest(data_dir)
+    originals = find_originals(data_dir, manifest, classes)
+    stats = {"augmented": 0, "skipped": 0, "removed": 0}
+
+    # Sources that disappeared (deleted, or relabeled into another class folder)
+    present = set(originals)
+    in_scope = set(classes) if classes is not None else None
+    for key in [k for k in manifest if k not in present
+                and (in_scope is None or k.split("/")[0] in in_scope)]:
+        _remove_outputs(data_dir, manifest.pop(key)["outputs"])
+        stats["removed"] += 1
+
+    for n, key in enumerate(originals):
+        patch_path = os.path.join(data_dir, *key.split("/"))
+        st = os.stat(patch_path)
+        entry = manifest.get(key)
+
+        # Manifests written before base_seed was recorded always used the default 0
+        if entry and not regenerate and len(entry["outputs"]) == augment_per_patch \
+                and entry.get("base_seed", 0) == base_seed \
+                and all(os.path.exists(os.path.join(data_dir, *o.split("/"))) for o in entry["outputs"]):
+            # Cheap check first; only hash when size/mtime moved
+            if (entry["size"], entry["mtime_ns"]) == (st.st_size, st.st_mtime_ns):
+                stats["skipped"] += 1
+                continue
+            content_hash = file_digest(patch_path)
+            if content_hash == entry["sha1"]:
+                entry["size"], entry["mtime_ns"] = st.st_size, st.st_mtime_ns
+                stats["skipped"] += 1
                 continue
+        else:
+            content_hash = file_digest(patch_path)
 
-            # Create some augmented versions
-            for i in range(augment_per_patch):
-                aug_img = augment_image(img)
-                base_name, ext = os.path.splitext(patch_file)
-                aug_filename = f"{base_name}_aug{i}{ext}"
-                aug_path = os.path.join(class_folder, aug_filename)
-                cv2.imwrite(aug_path, aug_img)
-                print(f"Saved augmented patch -> {aug_path}")
+        img = cv2.imread(patch_path)
+        if img is None:
+            print(f"Could not read {patch_path}")
+            continue
+
+        if entry:
+            _remove_outputs(data_dir, entry["outputs"])
+        cls, patch_file = key.split("/")
+        base_name, ext = os.path.splitext(patch_file)
+        seeds, outputs = [], []
+        for i in range(augment_per_patch):
+            seed = patch_seed(content_hash, i, base_seed)
+            aug_img = augment_image(img, random.Random(seed))
+            aug_filename = f"{base_name}_aug{i}{ext}"
+            cv2.imwrite(os.path.join(data_dir, cls, aug_filename), aug_img)
+            seeds.append(seed)
+            outputs.append(f"{cls}/{aug_filename}")
+
+        manifest[key] = {"sha1": content_hash, "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                         "base_seed": base_seed, "seeds": seeds, "outputs": outputs}
+        stats["augmented"] += 1
+        print(f"Saved {augment_per_patch} augmented patches for {key}")
+        if stats["augmented"] % save_every == 0:
+            save_manifest(data_dir, manifest)
+
+    save_manifest(data_dir, manifest)
+    return stats
+
+def main():
+    # Offline path: writes augmented copies next to the originals.
+    # train_cnn.py can instead augment on the fly (batch_augment.py) without touching disk.
+    parser = argparse.ArgumentParser(description="Incrementally augment labeled_data/<class>/ patches.")
+    parser.add_argument("data_dir", nargs="?", default="labeled_data")
+    parser.add_argument("--per-patch", type=int, default=7, help="augmented copies per original patch")
+    parser.add_argument("--seed", type=int, default=0, help="base seed mixed into every patch seed")
+    parser.add_argument("--regenerate", action="store_true",
+                        help="rewrite every copy, even up-to-date ones (seeds come from the content "
+                             "hash and --seed; a changed --seed re-augments without this flag)")
+    args = parser.parse_args()
 
-    print("Augmentation completed for all classes!")
+    stats = augment_dataset(args.data_dir, augment_per_patch=args.per_patch,
+                            base_seed=args.seed, regenerate=args.regenerate)
+    print(f"Augmentation completed: {stats['augmented']} patches augmented, "
+          f"{stats['skipped']} up to date, {stats['removed']} stale entries removed.")
 
 if __name__ == "__main__":
     main()
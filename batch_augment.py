@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+import numpy as np
+import tensorflow as tf
+
+class AugmentPolicy:
+    """
+    Probabilities and ranges for on-the-fly augmentation.
+    Defaults mirror augment_labels.augment_image so models trained either way see
+    the same distribution of patches.
+    """
+
+    def __init__(self, rotate=0.5, flip_h=0.5, flip_v=0.3,
+                 brightness_contrast=0.5, brightness=50, contrast=30,
+                 blur=0.3, blur_ksize=5, noise=0.3, noise_sigma=10.0):
+        self.rotate = rotate                      # chance of a 90/180/270 degree rotation
+        self.flip_h = flip_h
+        self.flip_v = flip_v
+        self.brightness_contrast = brightness_contrast
+        self.brightness = brightness              # brightness drawn from [-brightness, +brightness]
+        self.contrast = contrast                  # contrast drawn from [-contrast, +contrast]
+        self.blur = blur                          # chance of a blur_ksize x blur_ksize Gaussian blur
+        self.blur_ksize = blur_ksize
+        self.noise = noise                        # chance of additive Gaussian noise
+        self.noise_sigma = noise_sigma
+
+def gaussian_kernel(ksize):
+    """
+    Depthwise (ksize, ksize, 3, 1) Gaussian kernel with the sigma cv2.GaussianBlur
+    picks for sigma=0.
+    """
+    sigma = 0.3 * ((ksize - 1) * 0.5 - 1) + 0.8
+    ax = np.arange(ksize, dtype=np.float32) - (ksize - 1) / 2
+    k1d = np.exp(-(ax ** 2) / (2 * sigma ** 2))
+    k1d /= k1d.sum()
+    k2d = np.outer(k1d, k1d)
+    return tf.constant(np.tile(k2d[:, :, None, None], (1, 1, 3, 1)), dtype=tf.float32)
+
+def augment_batch(images, seed, policy=None):
+    """
+    Augments a whole batch at once.
+    images: float32 (B, H, W, 3) in [0, 255], square patches (H == W).
+    seed:   int32/int64 pair; the same seed always gives the same augmentations,
+            so a (base_seed, step) pair makes a training run reproducible.
+    Every op is computed for the full batch and selected per sample with tf.where,
+    in the same order as augment_image: rotate, flip_h, flip_v, brightness/contrast,
+    blur, noise. Returns float32 in [0, 255].
+    """
+    if policy is None:
+        policy = AugmentPolicy()
+
+    images = tf.convert_to_tensor(images, dtype=tf.float32)
+    batch = tf.shape(images)[0]
+    seeds = tf.random.experimental.stateless_split(tf.cast(seed, tf.int64), num=10)
+
+    def coin(i, p):
+        return tf.random.stateless_uniform([batch], seeds[i]) < p
+
+    def select(mask, a, b):
+        return tf.where(mask[:, None, None, None], a, b)
+
+    out = images
+
+    # Rotation by 90/180/270
+    k = tf.random.stateless_uniform([batch], seeds[1], minval=1, maxval=4, dtype=tf.int32)
+    rotated = select(k == 1, tf.image.rot90(out, 1),
+                     select(k == 2, tf.image.rot90(out, 2), tf.image.rot90(out, 3)))
+    out = select(coin(0, policy.rotate), rotated, out)
+
+    # Flips
+    out = select(coin(2, policy.flip_h), tf.image.flip_left_right(out), out)
+    out = select(coin(3, policy.flip_v), tf.image.flip_up_down(out), out)
+
+    # Brightness / contrast, same formula as adjust_brightness_contrast
+    brightness = tf.random.stateless_uniform([batch], seeds[5], -policy.brightness, policy.brightness + 1)
+    contrast = tf.random.stateless_uniform([batch], seeds[6], -policy.contrast, policy.contrast + 1)
+    brightness = tf.floor(brightness)[:, None, None, None]
+    contrast = tf.floor(contrast)[:, None, None, None]
+    adjusted = tf.clip_by_value(out * (contrast / 127 + 1) - contrast + brightness, 0, 255)
+    out = select(coin(4, policy.brightness_contrast), adjusted, out)
+
+    # Gaussian blur (reflect padding like OpenCV's default border)
+    pad = policy.blur_ksize // 2
+    padded = tf.pad(out, [[0, 0], [pad, pad], [pad, pad], [0, 0]], mode="REFLECT")
+    blurred = tf.nn.depthwise_conv2d(padded, gaussian_kernel(policy.blur_ksize),
+                                     strides=[1, 1, 1, 1], padding="VALID")
+    out = select(coin(7, policy.blur), blurred, out)
+
+    # Additive Gaussian noise
+    noise = tf.random.stateless_normal(tf.shape(out), seeds[9], stddev=policy.noise_sigma)
+    out = select(coin(8, policy.noise), tf.clip_by_value(out + noise, 0, 255), out)
+
+    return out
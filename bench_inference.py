@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+import os
+import time
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2, preprocess_input
+from tensorflow.keras.layers import GlobalAveragePooling2D, Dense, Dropout
+from tensorflow.keras.models import Sequential
+
+from inference_test import load_classifier, classify_boxes
+
+def benchmark_model(model_path="solder_classifier_two_phase.keras"):
+    """
+    Loads the trained classifier if it exists, otherwise builds an untrained
+    MobileNetV2 with the same head as train_cnn.py (timing is identical).
+    """
+    if os.path.exists(model_path):
+        return load_classifier(model_path)
+
+    print(f"'{model_path}' not found, benchmarking an untrained MobileNetV2 of the same shape.")
+    base_model = MobileNetV2(weights=None, include_top=False, input_shape=(224, 224, 3))
+    return Sequential([
+        base_model,
+        GlobalAveragePooling2D(),
+        Dropout(0.3),
+        Dense(128, activation='relu'),
+        Dense(3, activation='softmax')
+    ])
+
+def random_board(num_joints=300, size=(1920, 1080), seed=0):
+    """
+    Random BGR image plus 'num_joints' random boxes in the size range
+    select_joint_method_fixed produces (15..80 px).
+    """
+    rng = np.random.default_rng(seed)
+    width, height = size
+    img = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    boxes = []
+    for _ in range(num_joints):
+        w, h = rng.integers(15, 80, size=2)
+        x = int(rng.integers(0, width - w))
+        y = int(rng.integers(0, height - h))
+        boxes.append((x, y, int(w), int(h)))
+    return img, boxes
+
+def classify_per_box(model, bgr_img, boxes):
+    """The original loop: one crop, resize and model.predict per box."""
+    for (x, y, w, h) in boxes:
+        patch = bgr_img[y:y+h, x:x+w]
+        patch_resized = cv2.resize(patch, (224, 224))
+        patch_array = np.expand_dims(patch_resized, axis=0).astype("float32")
+        patch_array = preprocess_input(patch_array)
+        model.predict(patch_array, verbose=0)
+
+def benchmark_batched_inference(model, num_joints=300, batch_sizes=(8, 32, 64), repeats=3):
+    """
+    Compares joints/sec of the per-box loop against classify_boxes at a few batch sizes.
+    Returns a dict {method_name: joints_per_sec}.
+    """
+    img, boxes = random_board(num_joints)
+    report = {}
+
+    # Warm up both paths so graph tracing is not counted
+    classify_per_box(model, img, boxes[:2])
+    for bs in batch_sizes:
+        classify_boxes(model, img, boxes[:bs], batch_size=bs)
+
+    t0 = time.perf_counter()
+    classify_per_box(model, img, boxes)
+    elapsed = time.perf_counter() - t0
+    report["per_box"] = num_joints / elapsed
+
+    for bs in batch_sizes:
+        best = float("inf")
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            classify_boxes(model, img, boxes, batch_size=bs)
+            best = min(best, time.perf_counter() - t0)
+        report[f"batched_{bs}"] = num_joints / best
+
+    base = report["per_box"]
+    print(f"{num_joints} joints per board")
+    for name, jps in report.items():
+        print(f"  {name:<12} {jps:8.1f} joints/sec  ({jps / base:5.1f}x)")
+    return report
+
+def main():
+    model = benchmark_model("solder_classifier_two_phase.keras")
+    benchmark_batched_inference(model, num_joints=300, batch_sizes=(8, 32, 64))
+
+if __name__ == "__main__":
+    main()
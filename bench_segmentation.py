@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+import time
+
+import cv2
+import numpy as np
+
+from image_seg import JointSegmenter, segment_joints
+from tiled_seg import segment_joints_tiled
+
+def synthetic_frame(size=(640, 480), num_joints=200, seed=0):
+    """Green board with bright round 'joints' scattered on it."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    img[:] = (40, 110, 30)
+    img += rng.integers(0, 20, size=img.shape, dtype=np.uint8)
+    for _ in range(num_joints):
+        x = int(rng.integers(10, width - 10))
+        y = int(rng.integers(10, height - 10))
+        cv2.circle(img, (x, y), int(rng.integers(6, 14)), (190, 190, 200), -1)
+    return img
+
+def benchmark_segmenter(sizes=((640, 480), (1920, 1080), (4056, 3040)), num_frames=60, **params):
+    """
+    Frames/sec of the one-shot segment_joints() vs. a reused JointSegmenter
+    over the same frame stream, per resolution.
+    """
+    report = {}
+    for size in sizes:
+        frames = [synthetic_frame(size, seed=i) for i in range(4)]
+        segmenter = JointSegmenter(**params)
+        segmenter.segment(frames[0])  # allocate buffers outside the timing
+
+        t0 = time.perf_counter()
+        for i in range(num_frames):
+            segment_joints(frames[i % len(frames)], **params)
+        function_fps = num_frames / (time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        for i in range(num_frames):
+            segmenter.segment(frames[i % len(frames)])
+        segmenter_fps = num_frames / (time.perf_counter() - t0)
+
+        report[f"{size[0]}x{size[1]}"] = {"function_fps": function_fps, "segmenter_fps": segmenter_fps}
+        print(f"{size[0]}x{size[1]}: function {function_fps:7.1f} fps, "
+              f"segmenter {segmenter_fps:7.1f} fps ({segmenter_fps / function_fps:4.2f}x)")
+    return report
+
+def benchmark_tiled(size=(4056, 3040), worker_counts=(1, 2, 4, 8), tile_size=1024,
+                    executor="thread", repeats=3, **params):
+    """
+    Scaling of segment_joints_tiled() across worker counts on one large frame,
+    against the single-pass segment_joints(). Also checks that the tiled boxes
+    (global Otsu at full resolution) match the single-pass boxes.
+    """
+    frame = synthetic_frame(size, num_joints=int(size[0] * size[1] / 10000))
+
+    def best_time(fn):
+        best = float("inf")
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            out = fn()
+            best = min(best, time.perf_counter() - t0)
+        return best, out
+
+    single_time, (_, single_boxes) = best_time(lambda: segment_joints(frame, **params))
+    print(f"{size[0]}x{size[1]} single pass: {single_time*1000:.0f} ms, {len(single_boxes)} boxes")
+
+    report = {"single_ms": single_time * 1000, "tiled": {}}
+    for workers in worker_counts:
+        tiled_time, (_, boxes) = best_time(lambda: segment_joints_tiled(
+            frame, tile_size=tile_size, workers=workers, executor=executor,
+            otsu_mode="global", otsu_downsample=1, **params))
+        same = sorted(boxes) == sorted(single_boxes)
+        report["tiled"][workers] = {"ms": tiled_time * 1000, "matches_single_pass": same}
+        print(f"  {workers:2d} workers: {tiled_time*1000:6.0f} ms  "
+              f"({single_time / tiled_time:4.2f}x)  boxes match: {same}")
+    return report
+
+def main():
+    benchmark_segmenter(num_frames=60, do_hist_eq=True)
+    benchmark_tiled(size=(4056, 3040), worker_counts=(1, 2, 4, 8))
+
+if __name__ == "__main__":
+    main()
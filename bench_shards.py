@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+import os
+import time
+
+import cv2
+import numpy as np
+
+from image_seg import IMAGE_EXTENSIONS
+from patch_shards import PatchShards, pack_folder
+
+def make_synthetic_folder(out_dir, num_patches=100000, size=64, classes=("bad", "good", "missing"), seed=0):
+    """Writes num_patches small random PNG patches spread over the class folders."""
+    rng = np.random.default_rng(seed)
+    for cls in classes:
+        os.makedirs(os.path.join(out_dir, cls), exist_ok=True)
+    for i in range(num_patches):
+        cls = classes[i % len(classes)]
+        patch = rng.integers(0, 256, size=(size, size, 3), dtype=np.uint8)
+        cv2.imwrite(os.path.join(out_dir, cls, f"patch_{i:06d}.png"), patch)
+
+def iterate_folder(data_dir, size=224):
+    """
+    What the scripts do today: list every class folder and decode every file.
+    Returns (count, checksum); the checksum sums every resized pixel (resized
+    as pack_folder() does), so it must equal iterate_shards()' checksum.
+    """
+    count = 0
+    checksum = 0
+    for cls in sorted(os.listdir(data_dir)):
+        class_folder = os.path.join(data_dir, cls)
+        for f in os.listdir(class_folder):
+            if f.lower().endswith(IMAGE_EXTENSIONS):
+                img = cv2.imread(os.path.join(class_folder, f))
+                checksum += int(cv2.resize(img, (size, size), interpolation=cv2.INTER_AREA).sum(dtype=np.uint64))
+                count += 1
+    return count, checksum
+
+def iterate_shards(shard_dir):
+    """
+    Open the packed shards and read every byte of every patch through the
+    memory map (summed, so none of it can be skipped). Returns (count, checksum).
+    """
+    shards = PatchShards(shard_dir)
+    count = 0
+    checksum = 0
+    for patches, labels in shards.batches(1024):
+        checksum += int(np.asarray(patches).sum(dtype=np.uint64))
+        count += len(patches)
+    return count, checksum
+
+def benchmark_shards(data_dir="bench_patches", shard_dir="bench_shards", num_patches=100000):
+    if not os.path.exists(data_dir):
+        print(f"Writing {num_patches} synthetic patches -> {data_dir}")
+        make_synthetic_folder(data_dir, num_patches)
+
+    t0 = time.perf_counter()
+    pack_folder(data_dir, shard_dir)
+    pack_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    n_folder, folder_sum = iterate_folder(data_dir)
+    folder_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    n_shards, shard_sum = iterate_shards(shard_dir)
+    shard_time = time.perf_counter() - t0
+
+    print(f"One-time pack: {pack_time:.1f} s")
+    print(f"Folder  : {n_folder} patches in {folder_time:.2f} s (checksum {folder_sum})")
+    print(f"Shards  : {n_shards} patches in {shard_time:.2f} s ({folder_time / shard_time:.0f}x faster, "
+          f"checksum {shard_sum})")
+    return {"pack_s": pack_time, "folder_s": folder_time, "shards_s": shard_time,
+            "folder_checksum": folder_sum, "shards_checksum": shard_sum}
+
+def main():
+    benchmark_shards("bench_patches", "bench_shards", num_patches=100000)
+
+if __name__ == "__main__":
+    main()
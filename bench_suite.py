@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from image_seg import DEFAULT_SEG_PARAMS, JointSegmenter, select_joint_method_fixed
+from synthetic_pcb import render_board
+
+SUITE_VERSION = 1
+RESOLUTIONS = ((640, 480), (1280, 960), (1920, 1080), (4000, 3000))
+
+def measure(fn, repeats=5, warmup=1):
+    """Runs 'fn' warmup + repeats times; returns best/median/mean wall time in ms."""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return {"best_ms": min(times), "median_ms": float(np.median(times)), "mean_ms": float(np.mean(times))}
+
+def environment():
+    """Run metadata stored with every result file, so runs stay comparable."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "suite_version": SUITE_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "opencv_threads": cv2.getNumThreads(),
+    }
+
+def bench_segmentation(resolutions=RESOLUTIONS, repeats=5, pad_density=0.08):
+    """
+    select_joint_method_fixed (decode from PNG + segment) and a reused
+    JointSegmenter (in-memory) on one synthetic board per resolution.
+    """
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for width, height in resolutions:
+            img, _ = render_board((width, height), pad_density=pad_density)
+            path = os.path.join(tmp, f"board_{width}x{height}.png")
+            cv2.imwrite(path, img)
+            segmenter = JointSegmenter(**DEFAULT_SEG_PARAMS)
+            _, boxes = segmenter.segment(img)
+
+            from_path = measure(lambda: select_joint_method_fixed(path, **DEFAULT_SEG_PARAMS), repeats)
+            in_memory = measure(lambda: segmenter.segment(img), repeats)
+            mpix = width * height / 1e6
+            report[f"{width}x{height}"] = {
+                "boxes": len(boxes),
+                "select_joint_method_fixed": from_path,
+                "segmenter": in_memory,
+                "segmenter_mpix_per_s": mpix / (in_memory["median_ms"] / 1000),
+            }
+            print(f"segmentation {width}x{height}: path {from_path['median_ms']:8.1f} ms, "
+                  f"in-memory {in_memory['median_ms']:8.1f} ms, {len(boxes)} boxes")
+    return report
+
+def bench_pyramid(resolutions=RESOLUTIONS, factors=(2, 4), repeats=5, pad_density=0.08):
+    """
+    Pyramid segmentation (pyramid_seg.PyramidSegmenter) against the full
+    pass: in-memory time per resolution and factor, plus box recall /
+    precision / IoU against the full-resolution boxes.
+    """
+    from pyramid_seg import PyramidSegmenter, compare_with_full
+
+    report = {}
+    for width, height in resolutions:
+        img, _ = render_board((width, height), pad_density=pad_density)
+        full = JointSegmenter(**DEFAULT_SEG_PARAMS)
+        full_timing = measure(lambda: full.segment(img), repeats)
+        entry = {"full": full_timing}
+        for factor in factors:
+            pyramid = PyramidSegmenter(factor, **DEFAULT_SEG_PARAMS)
+            timing = measure(lambda: pyramid.segment(img), repeats)
+            accuracy = compare_with_full(img, factor, **DEFAULT_SEG_PARAMS)
+            entry[f"x{factor}"] = dict(timing, **accuracy, rois=len(pyramid.last_rois),
+                                       speedup=full_timing["median_ms"] / timing["median_ms"])
+            print(f"pyramid {width}x{height} x{factor}: {timing['median_ms']:8.1f} ms "
+                  f"(full {full_timing['median_ms']:8.1f} ms, {entry[f'x{factor}']['speedup']:4.2f}x), "
+                  f"recall {accuracy['recall']:6.1%}, precision {accuracy['precision']:6.1%}, "
+                  f"IoU {accuracy['mean_iou']:.3f}")
+        report[f"{width}x{height}"] = entry
+    return report
+
+def bench_cropping(joint_counts=(50, 200, 800), size=(1920, 1080), repeats=5):
+    """crop_patches (crop + resize to 224x224) throughput per joints-per-board count."""
+    from inference_test import crop_patches
+
+    img, _ = render_board(size)
+    rng = np.random.default_rng(0)
+    report = {}
+    for n in joint_counts:
+        wh = rng.integers(15, 80, size=(n, 2))
+        xy = rng.integers(0, [size[0] - 80, size[1] - 80], size=(n, 2))
+        boxes = [(int(x), int(y), int(w), int(h)) for (x, y), (w, h) in zip(xy, wh)]
+        timing = measure(lambda: crop_patches(img, boxes), repeats)
+        report[str(n)] = dict(timing, joints_per_s=n / (timing["median_ms"] / 1000))
+        print(f"cropping {n:4d} joints: {timing['median_ms']:7.2f} ms "
+              f"({report[str(n)]['joints_per_s']:9.0f} joints/s)")
+    return report
+
+def bench_classifier(model, batch_sizes=(1, 8, 16, 32, 64), num_patches=256, repeats=3):
+    """ClassifierEngine joints/sec for each fixed batch size on the same patch set."""
+    from inference_test import ClassifierEngine
+
+    patches = np.random.default_rng(0).integers(0, 256, size=(num_patches, 224, 224, 3), dtype=np.uint8)
+    report = {}
+    for bs in batch_sizes:
+        engine = ClassifierEngine(model=model, batch_sizes=(bs,))
+        timing = measure(lambda: engine.classify_patches(patches), repeats, warmup=0)
+        report[str(bs)] = dict(timing, joints_per_s=num_patches / (timing["median_ms"] / 1000),
+                               warmup_ms=engine.warmup_time * 1000)
+        print(f"classifier batch {bs:3d}: {report[str(bs)]['joints_per_s']:8.1f} joints/s")
+    return report
+
+def bench_end_to_end(model, size=(1920, 1080), num_boards=8, batch_sizes=(8, 32), repeats=3):
+    """
+    Full board inspection (inspection_engine.SegmentationEngine) over
+    synthetic boards: ms per board, split into detect and classify.
+    """
+    from inference_test import ClassifierEngine
+    from inspection_engine import SegmentationEngine
+
+    boards = [render_board(size, seed=i)[0] for i in range(num_boards)]
+    engine = SegmentationEngine(ClassifierEngine(model=model, batch_sizes=batch_sizes))
+    engine.inspect(boards[:1])
+
+    per_board, detect, classify, joints = [], [], [], 0
+    for _ in range(repeats):
+        for board in boards:
+            [(_, results)] = engine.inspect([board])
+            per_board.append(engine.last_timings["total_time"] * 1000)
+            detect.append(engine.last_timings["detect_time"] * 1000)
+            classify.append(engine.last_timings["classify_time"] * 1000)
+            joints += len(results)
+    report = {
+        "size": f"{size[0]}x{size[1]}",
+        "boards": num_boards * repeats,
+        "joints_per_board": joints / (num_boards * repeats),
+        "board_ms_median": float(np.median(per_board)),
+        "board_ms_p95": float(np.percentile(per_board, 95)),
+        "detect_ms_median": float(np.median(detect)),
+        "classify_ms_median": float(np.median(classify)),
+    }
+    print(f"end-to-end {report['size']}: {report['board_ms_median']:.1f} ms/board "
+          f"(detect {report['detect_ms_median']:.1f}, classify {report['classify_ms_median']:.1f}), "
+          f"{report['joints_per_board']:.0f} joints/board")
+    return report
+
+def flatten(tree, prefix=""):
+    """{"a": {"b": 1.0}} -> {"a/b": 1.0} for every numeric leaf."""
+    flat = {}
+    for key, value in tree.items():
+        name = f"{prefix}/{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+def compare(old_path, new_path, threshold=0.1):
+    """
+    Prints every metric present in both result files with its relative
+    change; changes beyond 'threshold' are flagged (for *_ms lower is better,
+    for throughput higher is better).
+    """
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"old: {old['meta'].get('commit')} {old['meta'].get('timestamp')}")
+    print(f"new: {new['meta'].get('commit')} {new['meta'].get('timestamp')}")
+    old_flat, new_flat = flatten(old["results"]), flatten(new["results"])
+    for name in sorted(set(old_flat) & set(new_flat)):
+        a, b = old_flat[name], new_flat[name]
+        if not a:
+            continue
+        change = (b - a) / abs(a)
+        flag = ""
+        if abs(change) > threshold:
+            lower_is_better = "_ms" in name
+            flag = "  better" if (change < 0) == lower_is_better else "  WORSE"
+        print(f"{name:<60} {a:12.2f} -> {b:12.2f} ({change:+7.1%}){flag}")
+
+def run_suite(sections, quick=False, model_path="solder_classifier_two_phase.keras"):
+    """Runs the chosen sections; a section whose dependencies are missing is recorded as skipped."""
+    resolutions = RESOLUTIONS[:2] if quick else RESOLUTIONS
+    repeats = 2 if quick else 5
+    results = {}
+    model = None
+
+    def classifier_model():
+        nonlocal model
+        if model is None:
+            from bench_inference import benchmark_model
+            model = benchmark_model(model_path)
+        return model
+
+    runners = {
+        "segmentation": lambda: bench_segmentation(resolutions, repeats=repeats),
+        "pyramid": lambda: bench_pyramid(resolutions, repeats=repeats),
+        "cropping": lambda: bench_cropping(repeats=repeats),
+        "classifier": lambda: bench_classifier(classifier_model(), repeats=max(repeats // 2, 1),
+                                               batch_sizes=(1, 8, 32) if quick else (1, 8, 16, 32, 64)),
+        "end_to_end": lambda: bench_end_to_end(classifier_model(), num_boards=2 if quick else 8,
+                                               repeats=1 if quick else 3),
+    }
+    for name in sections:
+        try:
+            results[name] = runners[name]()
+        except ImportError as e:
+            print(f"{name}: skipped ({e})")
+            results[name] = {"skipped": str(e)}
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Performance regression suite on synthetic PCB images.")
+    parser.add_argument("--sections", default="segmentation,pyramid,cropping,classifier,end_to_end",
+                        help="comma-separated subset of the sections to run")
+    parser.add_argument("--quick", action="store_true", help="fewer resolutions and repeats")
+    parser.add_argument("--model", default="solder_classifier_two_phase.keras",
+                        help="classifier to time (an untrained MobileNetV2 of the same shape if missing)")
+    parser.add_argument("--out-dir", default="bench_results")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    meta = environment()
+    results = run_suite([s.strip() for s in args.sections.split(",") if s.strip()], args.quick, args.model)
+    if not os.path.exists(args.out_dir):
+        os.makedirs(args.out_dir)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    out_path = os.path.join(args.out_dir, f"bench_{stamp}_{meta['commit'] or 'nogit'}.json")
+    with open(out_path, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=1)
+    print(f"Saved {out_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+import multiprocessing as mp
+import os
+import resource
+import time
+from queue import Empty
+
+import numpy as np
+
+def _run_backend(model_path, backend, patches, labels, batch_size, num_threads, repeats, queue):
+    """
+    Runs in its own process so peak RSS only reflects one backend. Puts the
+    result dict on 'queue', or {"error": message} if the backend fails.
+    """
+    try:
+        queue.put(_measure_backend(model_path, backend, patches, labels, batch_size, num_threads, repeats))
+    except Exception as e:
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+
+def _measure_backend(model_path, backend, patches, labels, batch_size, num_threads, repeats):
+    from inference_test import ClassifierEngine
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    engine = ClassifierEngine(model_path, batch_sizes=(batch_size,), backend=backend,
+                              num_threads=num_threads)
+
+    best = float("inf")
+    probs = None
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        probs = engine.classify_patches(patches)
+        best = min(best, time.perf_counter() - t0)
+
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    preds = np.argmax(probs, axis=1)
+    return {
+        "preds": preds,
+        "ms_per_joint": best * 1000 / len(patches),
+        "peak_rss_mb": rss_peak / 1024,
+        "model_rss_mb": (rss_peak - rss_before) / 1024,
+        "accuracy": float(np.mean(preds == labels)) if len(labels) else float("nan"),
+    }
+
+def _wait_result(proc, queue, poll=1.0):
+    """
+    The child's result from 'queue'; {"error": ...} if the process exits
+    without putting one (killed, out of memory, interpreter crash).
+    """
+    while True:
+        try:
+            return queue.get(timeout=poll)
+        except Empty:
+            if not proc.is_alive():
+                try:
+                    return queue.get(timeout=poll)  # put just before exiting
+                except Empty:
+                    return {"error": f"process exited with code {proc.exitcode}"}
+
+def benchmark_backends(models, data_dir="labeled_data", max_per_class=100, batch_size=32,
+                       num_threads=None, repeats=3):
+    """
+    models: {name: (model_path, backend)}, e.g. the Keras model plus the
+            fp16/int8 files written by export_tflite.py.
+    Reports per-joint CPU latency, peak memory (and how much of it loading +
+    running the model added), model file size, accuracy on a
+    labeled_data subset and agreement with the first entry (the reference).
+    """
+    from export_tflite import load_labeled_samples
+
+    patches, labels = load_labeled_samples(data_dir, max_per_class=max_per_class)
+    if len(patches) == 0:
+        print(f"No labeled patches in {data_dir}, timing on random patches (accuracy n/a).")
+        patches = np.random.default_rng(0).integers(0, 256, size=(256, 224, 224, 3), dtype=np.uint8)
+        labels = np.zeros((0,), dtype=np.int64)
+
+    ctx = mp.get_context("spawn")
+    report = {}
+    for name, (model_path, backend) in models.items():
+        if not os.path.exists(model_path):
+            print(f"Skipping {name}: {model_path} not found")
+            continue
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_run_backend, args=(model_path, backend, patches, labels,
+                                                      batch_size, num_threads, repeats, queue))
+        proc.start()
+        result = _wait_result(proc, queue)
+        proc.join()
+        if "error" in result:
+            print(f"Skipping {name}: {result['error']}")
+            continue
+        result["file_mb"] = os.path.getsize(model_path) / 2**20
+        report[name] = result
+
+    if not report:
+        return report
+
+    reference = next(iter(report.values()))["preds"]
+    print(f"{len(patches)} patches, batch size {batch_size}, threads {num_threads}")
+    print(f"{'model':<8} {'ms/joint':>9} {'peak MB':>8} {'+load MB':>8} {'file MB':>8} {'accuracy':>9} {'agree':>7}")
+    for name, r in report.items():
+        r["agreement"] = float(np.mean(r["preds"] == reference))
+        print(f"{name:<8} {r['ms_per_joint']:9.2f} {r['peak_rss_mb']:8.0f} {r['model_rss_mb']:8.0f} {r['file_mb']:8.1f} "
+              f"{r['accuracy']:9.3f} {r['agreement']:7.3f}")
+    return report
+
+def main():
+    models = {
+        "keras": ("solder_classifier_two_phase.keras", "keras"),
+        "fp16": ("solder_classifier_two_phase_fp16.tflite", "tflite"),
+        "int8": ("solder_classifier_two_phase_int8.tflite", "tflite"),
+    }
+    benchmark_backends(models, data_dir="labeled_data", batch_size=32, num_threads=os.cpu_count())
+
+if __name__ == "__main__":
+    main()
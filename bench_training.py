@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+import time
+
+import tensorflow as tf
+from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
+from tensorflow.keras.optimizers import Adam
+from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+from train_cnn import EpochTimer, build_model, cached_phase1_datasets, make_datasets
+
+def legacy_generators(data_dir, batch_size=8, img_size=(224,224)):
+    """The previous ImageDataGenerator.flow_from_directory input pipeline."""
+    datagen = ImageDataGenerator(preprocessing_function=preprocess_input, validation_split=0.2)
+    train = datagen.flow_from_directory(data_dir, target_size=img_size, batch_size=batch_size,
+                                        class_mode='categorical', subset='training')
+    val = datagen.flow_from_directory(data_dir, target_size=img_size, batch_size=batch_size,
+                                      class_mode='categorical', subset='validation')
+    return train, val
+
+def time_input_epochs(data_dir, epochs=3, legacy_batch_size=8, batch_size=32):
+    """
+    Input pipeline only (no model, no augmentation on either side): seconds per
+    epoch for the legacy generator vs. tf.data. tf.data epoch 1 pays for
+    decoding, later epochs read the cache.
+    """
+    train, _ = legacy_generators(data_dir, legacy_batch_size)
+    legacy = []
+    for _ in range(epochs):
+        t0 = time.perf_counter()
+        for i in range(len(train)):
+            train[i]
+        legacy.append(time.perf_counter() - t0)
+
+    train_ds, _, steps, _ = make_datasets(data_dir, batch_size=batch_size, augment=False)
+    it = iter(train_ds)
+    fast = []
+    for _ in range(epochs):
+        t0 = time.perf_counter()
+        for _ in range(steps):
+            next(it)
+        fast.append(time.perf_counter() - t0)
+
+    print("Input pipeline seconds/epoch")
+    for e in range(epochs):
+        print(f"  epoch {e + 1}: ImageDataGenerator {legacy[e]:6.2f} s   tf.data {fast[e]:6.2f} s")
+    return {"legacy": legacy, "tf_data": fast}
+
+def time_two_phase_epochs(data_dir, epochs1=2, epochs2=2, legacy_batch_size=8, batch_size=32,
+                          mixed_precision=None, weights='imagenet'):
+    """
+    Full training epochs on the existing two-phase schedule (phase 1 frozen to
+    layer 100 at LR 1e-4, phase 2 fully unfrozen at LR 1e-5) for both pipelines.
+    """
+    def run(train_data, val_data, steps, num_classes):
+        model, base_model = build_model(num_classes, weights=weights)
+        timer = EpochTimer()
+        model.compile(optimizer=Adam(1e-4), loss='categorical_crossentropy', metrics=['accuracy'])
+        model.fit(train_data, steps_per_epoch=steps, epochs=epochs1, validation_data=val_data,
+                  callbacks=[timer], verbose=0)
+        base_model.trainable = True
+        model.compile(optimizer=Adam(1e-5), loss='categorical_crossentropy', metrics=['accuracy'])
+        model.fit(train_data, steps_per_epoch=steps, epochs=epochs2, validation_data=val_data,
+                  callbacks=[timer], verbose=0)
+        return timer.times
+
+    train, val = legacy_generators(data_dir, legacy_batch_size)
+    legacy = run(train, val, None, train.num_classes)
+
+    previous_policy = tf.keras.mixed_precision.global_policy()
+    if mixed_precision:
+        tf.keras.mixed_precision.set_global_policy(mixed_precision)
+    try:
+        train_ds, val_ds, steps, class_names = make_datasets(data_dir, batch_size=batch_size, augment=False)
+        fast = run(train_ds, val_ds, steps, len(class_names))
+    finally:
+        tf.keras.mixed_precision.set_global_policy(previous_policy)
+
+    print("Two-phase training seconds/epoch")
+    for e, (a, b) in enumerate(zip(legacy, fast)):
+        phase = 1 if e < epochs1 else 2
+        print(f"  phase {phase} epoch {e + 1}: legacy (bs={legacy_batch_size}) {a:7.1f} s   "
+              f"tf.data (bs={batch_size}) {b:7.1f} s   ({a / b:4.2f}x)")
+    return {"legacy": legacy, "tf_data": fast}
+
+def time_phase1_feature_cache(data_dir, epochs=3, batch_size=32, cache_dir="feature_cache",
+                              weights='imagenet'):
+    """
+    Phase-1 seconds/epoch: full backbone on images vs. suffix + head on cached
+    frozen-prefix features (the first cached run also pays for building the store).
+    """
+    def run(make_inputs):
+        model, base_model = build_model(3, weights=weights)
+        train_model, train_data, val_data, steps = make_inputs(model, base_model)
+        timer = EpochTimer()
+        train_model.compile(optimizer=Adam(1e-4), loss='categorical_crossentropy', metrics=['accuracy'])
+        train_model.fit(train_data, steps_per_epoch=steps, epochs=epochs, validation_data=val_data,
+                        callbacks=[timer], verbose=0)
+        return timer.times
+
+    def images(model, base_model):
+        train_ds, val_ds, steps, _ = make_datasets(data_dir, batch_size=batch_size, augment=False)
+        return model, train_ds, val_ds, steps
+
+    def cached(model, base_model):
+        return cached_phase1_datasets(model, base_model, data_dir, cache_dir,
+                                      batch_size=batch_size, weights=weights)
+
+    t0 = time.perf_counter()
+    full = run(images)
+    build_and_train = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    fast = run(cached)
+    print(f"Phase 1 seconds/epoch (full run {build_and_train:.1f} s vs cached run "
+          f"{time.perf_counter() - t0:.1f} s incl. store build)")
+    for e, (a, b) in enumerate(zip(full, fast)):
+        print(f"  epoch {e + 1}: full backbone {a:7.1f} s   cached features {b:7.1f} s   ({a / b:4.2f}x)")
+    return {"full": full, "cached": fast}
+
+def main():
+    time_input_epochs("labeled_data", epochs=3)
+    time_two_phase_epochs("labeled_data", epochs1=2, epochs2=2)
+    time_phase1_feature_cache("labeled_data", epochs=3)
+
+if __name__ == "__main__":
+    main()
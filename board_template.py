@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from image_seg import JointSegmenter, iter_image_paths, load_image
+
+TEMPLATE_VERSION = 1
+
+class BoardTemplate:
+    """
+    Joint boxes of one board type, recorded once from a golden board.
+
+    Boards sit against the tray's hard-stop datums, so joints land in (almost)
+    the same place on every capture. Instead of re-segmenting, a new capture is
+    registered to the golden board's downscaled grayscale image with ECC and
+    the recorded boxes are mapped through that transform. Box order is the
+    template's, so joint #i is the same joint on every board.
+    """
+
+    def __init__(self, reference, boxes, scale, image_shape, seg_params=None, name=None):
+        self.reference = reference        # downscaled grayscale golden board (uint8)
+        self.boxes = [tuple(int(v) for v in b) for b in boxes]
+        self.scale = float(scale)
+        self.image_shape = tuple(image_shape[:2])
+        self.seg_params = dict(seg_params or {})
+        self.name = name
+
+    @staticmethod
+    def prepare(bgr_img, scale):
+        """Downscaled, lightly blurred grayscale image used on both sides of the registration."""
+        gray = cv2.cvtColor(bgr_img, cv2.COLOR_BGR2GRAY)
+        if scale != 1.0:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    @classmethod
+    def record(cls, bgr_img, seg_params=None, scale=0.25, name=None):
+        """Segments the golden board once and keeps its boxes + reference image."""
+        segmenter = JointSegmenter(**(seg_params or {}))
+        _, boxes = segmenter.segment(bgr_img)
+        return cls(cls.prepare(bgr_img, scale), boxes, scale, bgr_img.shape,
+                   seg_params=segmenter.params, name=name)
+
+    def save(self, path):
+        meta = {"version": TEMPLATE_VERSION, "scale": self.scale, "image_shape": list(self.image_shape),
+                "seg_params": self.seg_params, "name": self.name}
+        np.savez_compressed(path, reference=self.reference,
+                            boxes=np.asarray(self.boxes, dtype=np.int32).reshape(-1, 4),
+                            meta=np.array(json.dumps(meta)))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("version") != TEMPLATE_VERSION:
+                raise ValueError(f"{path}: unsupported template version {meta.get('version')}")
+            return cls(data["reference"], data["boxes"].tolist(), meta["scale"], meta["image_shape"],
+                       seg_params=meta["seg_params"], name=meta.get("name"))
+
+    def register(self, bgr_img, motion=cv2.MOTION_EUCLIDEAN, iterations=50, eps=1e-4):
+        """
+        Aligns 'bgr_img' to the reference with ECC on the downscaled image.
+        Returns (warp, correlation): a 2x3 matrix mapping template pixel
+        coordinates to full-resolution image coordinates, and the ECC
+        correlation coefficient (1.0 = perfect match). Raises cv2.error if ECC
+        does not converge.
+        """
+        gray = self.prepare(bgr_img, self.scale)
+        if gray.shape != self.reference.shape:
+            gray = cv2.resize(gray, self.reference.shape[::-1], interpolation=cv2.INTER_AREA)
+        warp = np.eye(2, 3, dtype=np.float32)
+        criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, iterations, eps)
+        correlation, warp = cv2.findTransformECC(self.reference, gray, warp, motion, criteria, None, 1)
+
+        # Downscaled -> full resolution: the linear part is scale-invariant,
+        # translation scales up; a resized capture also needs its own scale
+        sy = bgr_img.shape[0] / self.image_shape[0]
+        sx = bgr_img.shape[1] / self.image_shape[1]
+        full = warp.astype(np.float64)
+        full[:, 2] /= self.scale
+        full = np.diag([sx, sy]) @ full
+        return full, correlation
+
+    def map_boxes(self, warp, shape):
+        """
+        Template boxes through 'warp' into an image of 'shape'; each becomes the
+        bounding rect of its transformed corners. Returns None if any box ends
+        up (mostly) outside the image.
+        """
+        b = np.asarray(self.boxes, dtype=np.float64).reshape(-1, 4)
+        x0, y0, x1, y1 = b[:, 0], b[:, 1], b[:, 0] + b[:, 2], b[:, 1] + b[:, 3]
+        corners = np.stack([np.stack([x0, y0], -1), np.stack([x1, y0], -1),
+                            np.stack([x0, y1], -1), np.stack([x1, y1], -1)], axis=1)
+        mapped = corners @ warp[:, :2].T + warp[:, 2]
+        h, w = shape[:2]
+        nx0 = np.clip(np.floor(mapped[..., 0].min(axis=1)), 0, w)
+        ny0 = np.clip(np.floor(mapped[..., 1].min(axis=1)), 0, h)
+        nx1 = np.clip(np.ceil(mapped[..., 0].max(axis=1)), 0, w)
+        ny1 = np.clip(np.ceil(mapped[..., 1].max(axis=1)), 0, h)
+        nw, nh = nx1 - nx0, ny1 - ny0
+        if np.any(nw < 0.5 * b[:, 2]) or np.any(nh < 0.5 * b[:, 3]):
+            return None
+        return [tuple(int(v) for v in box) for box in np.stack([nx0, ny0, nw, nh], -1)]
+
+class TemplateDetector:
+    """
+    Drop-in for JointSegmenter (same segment()/equalize() contract): boxes come
+    from a BoardTemplate registered to the frame, and the full segmentation
+    pipeline only runs when registration fails or correlates below
+    'min_correlation' (wrong board, heavy occlusion, board out of the fixture).
+
+    After every call, 'last_source' is "template" or "segmentation" and
+    'last_correlation' the ECC score (None if ECC did not converge).
+    """
+
+    def __init__(self, template, seg_params=None, min_correlation=0.8, motion=cv2.MOTION_EUCLIDEAN):
+        self.template = template
+        self.segmenter = JointSegmenter(**(seg_params or template.seg_params))
+        self.min_correlation = min_correlation
+        self.motion = motion
+        self.last_source = None
+        self.last_correlation = None
+        self.stats = {"template": 0, "segmentation": 0}
+
+    def equalize(self, bgr_img):
+        return self.segmenter.equalize(bgr_img)
+
+    def locate(self, bgr_img):
+        """Template boxes in 'bgr_img', or None if the frame cannot be registered."""
+        try:
+            warp, self.last_correlation = self.template.register(bgr_img, motion=self.motion)
+        except cv2.error:
+            self.last_correlation = None
+            return None
+        if self.last_correlation < self.min_correlation:
+            return None
+        return self.template.map_boxes(warp, bgr_img.shape)
+
+    def segment(self, bgr_img, debug=None):
+        boxes = self.locate(bgr_img)
+        if boxes is None:
+            self.last_source = "segmentation"
+            self.stats["segmentation"] += 1
+            return self.segmenter.segment(bgr_img, debug=debug)
+        self.last_source = "template"
+        self.stats["template"] += 1
+        return self.segmenter.equalize(bgr_img), boxes
+
+def main():
+    parser = argparse.ArgumentParser(description="Record a golden-board joint template or detect joints with one.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rec = sub.add_parser("record", help="segment a golden board and save its joint template")
+    rec.add_argument("image")
+    rec.add_argument("template", help="output .npz")
+    rec.add_argument("--scale", type=float, default=0.25, help="registration image scale")
+    rec.add_argument("--name", default=None, help="board type name stored in the template")
+
+    det = sub.add_parser("detect", help="register captures to a template and print their joint boxes")
+    det.add_argument("template")
+    det.add_argument("inputs", nargs="+", help="image files, folders or glob patterns")
+    det.add_argument("--min-correlation", type=float, default=0.8)
+    det.add_argument("--overlay-dir", default=None)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        from inference_test import SEG_PARAMS
+
+        template = BoardTemplate.record(load_image(args.image), SEG_PARAMS, scale=args.scale, name=args.name)
+        template.save(args.template)
+        print(f"Recorded {len(template.boxes)} joints from {args.image} -> {args.template}")
+        return
+
+    detector = TemplateDetector(BoardTemplate.load(args.template), min_correlation=args.min_correlation)
+    if args.overlay_dir is not None and not os.path.exists(args.overlay_dir):
+        os.makedirs(args.overlay_dir)
+    for image_path in iter_image_paths(args.inputs):
+        bgr_img = load_image(image_path)
+        t0 = time.perf_counter()
+        bgr_eq, boxes = detector.segment(bgr_img)
+        elapsed = time.perf_counter() - t0
+        corr = "n/a" if detector.last_correlation is None else f"{detector.last_correlation:.3f}"
+        print(f"{image_path}: {len(boxes)} joints via {detector.last_source} "
+              f"(ECC {corr}) in {elapsed*1000:.1f} ms")
+        if args.overlay_dir is not None:
+            overlay = bgr_eq.copy()
+            for (x, y, w, h) in boxes:
+                cv2.rectangle(overlay, (x, y), (x+w, y+h), (0, 255, 0), 2)
+            base_name = os.path.splitext(os.path.basename(image_path))[0]
+            cv2.imwrite(os.path.join(args.overlay_dir, f"{base_name}_joints.png"), overlay)
+    print(f"template: {detector.stats['template']}, segmentation fallback: {detector.stats['segmentation']}")
+
+if __name__ == "__main__":
+    main()
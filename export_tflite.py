@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+import os
+import random
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
+
+from image_seg import IMAGE_EXTENSIONS
+from inference_test import CLASS_NAMES
+from patch_shards import PatchShards, is_shard_dir
+
+def load_labeled_samples(data_dir="labeled_data", max_per_class=None, img_size=(224, 224), seed=0):
+    """
+    Reads a (shuffled, optionally capped) subset of labeled_data/<class>/ into memory.
+    Returns (patches uint8 (N, H, W, 3) BGR, labels int (N,)) with label indices
+    in CLASS_NAMES order, i.e. the alphabetical folder order used for training.
+    'data_dir' may also be a packed shard directory (patch_shards.py).
+    """
+    rng = random.Random(seed)
+    if is_shard_dir(data_dir):
+        return _load_shard_samples(PatchShards(data_dir), max_per_class, img_size, rng)
+
+    patches, labels = [], []
+    for class_idx, cls in enumerate(CLASS_NAMES):
+        class_folder = os.path.join(data_dir, cls)
+        if not os.path.exists(class_folder):
+            continue
+
+        files = sorted(f for f in os.listdir(class_folder) if f.lower().endswith(IMAGE_EXTENSIONS))
+        rng.shuffle(files)
+        if max_per_class is not None:
+            files = files[:max_per_class]
+
+        for f in files:
+            img = cv2.imread(os.path.join(class_folder, f))
+            if img is None:
+                print(f"Could not read {os.path.join(class_folder, f)}")
+                continue
+            patches.append(cv2.resize(img, img_size))
+            labels.append(class_idx)
+
+    if not patches:
+        return np.zeros((0, img_size[1], img_size[0], 3), dtype=np.uint8), np.zeros((0,), dtype=np.int64)
+    return np.stack(patches), np.array(labels)
+
+def _load_shard_samples(shards, max_per_class, img_size, rng):
+    picked, labels = [], []
+    for class_idx, cls in enumerate(CLASS_NAMES):
+        if cls not in shards.class_names:
+            continue
+        shard_label = shards.class_names.index(cls)
+        indices = [i for i, y in enumerate(shards.labels) if y == shard_label]
+        rng.shuffle(indices)
+        if max_per_class is not None:
+            indices = indices[:max_per_class]
+        picked.extend(indices)
+        labels.extend([class_idx] * len(indices))
+
+    patches, _ = shards.gather(picked)
+    if len(patches) and patches.shape[1:3] != (img_size[1], img_size[0]):
+        patches = np.stack([cv2.resize(p, img_size) for p in patches])
+    return patches, np.array(labels, dtype=np.int64)
+
+def representative_dataset(data_dir="labeled_data", num_samples=300, seed=0):
+    """
+    Int8 calibration data: a class-balanced random subset of labeled_data,
+    preprocessed exactly like at inference time, one sample per step.
+    """
+    per_class = max(1, num_samples // len(CLASS_NAMES))
+    patches, _ = load_labeled_samples(data_dir, max_per_class=per_class, seed=seed)
+    if len(patches) == 0:
+        raise ValueError(f"No calibration patches found in {data_dir}")
+
+    inputs = preprocess_input(patches.astype("float32"))
+
+    def gen():
+        for i in range(len(inputs)):
+            yield [inputs[i:i+1]]
+    return gen
+
+def export_tflite(model_path="solder_classifier_two_phase.keras", data_dir="labeled_data",
+                  out_prefix=None, num_calibration=300):
+    """
+    Converts the trained Keras classifier into two TFLite models:
+      - <prefix>_fp16.tflite : float16 weights, float32 input/output
+      - <prefix>_int8.tflite : full-integer (int8 weights, activations, input and output),
+                               calibrated on a representative subset of 'data_dir'
+    Returns {"fp16": path, "int8": path}.
+    """
+    if out_prefix is None:
+        out_prefix = os.path.splitext(model_path)[0]
+
+    model = tf.keras.models.load_model(model_path)
+    outputs = {}
+
+    # float16
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.target_spec.supported_types = [tf.float16]
+    outputs["fp16"] = f"{out_prefix}_fp16.tflite"
+    with open(outputs["fp16"], "wb") as f:
+        f.write(converter.convert())
+    print(f"Saved float16 TFLite model -> {outputs['fp16']}")
+
+    # full int8
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset(data_dir, num_calibration)
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.int8
+    converter.inference_output_type = tf.int8
+    outputs["int8"] = f"{out_prefix}_int8.tflite"
+    with open(outputs["int8"], "wb") as f:
+        f.write(converter.convert())
+    print(f"Saved int8 TFLite model -> {outputs['int8']}")
+
+    return outputs
+
+def main():
+    export_tflite("solder_classifier_two_phase.keras", data_dir="labeled_data", num_calibration=300)
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,30 @@
 #!/usr/bin/env python3
+import argparse
 import cv2
+import hashlib
+import json
 import os
+import time
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 
-from image_seg import select_joint_method_fixed
+from image_seg import iter_image_paths, segment_joints
 # Removed crop_to_pcb import since it's no longer used
 
+# Select Joint settings used to build the patch dataset
+EXTRACT_SEG_PARAMS = dict(
+    do_hist_eq=True,
+    otsu_invert=True,
+    value_low_thresh=80,
+    median_ksize=3,
+    morph_open_ksize=4,
+    morph_close_ksize=5,
+    min_box_size=15,
+    max_box_size=500
+)
+
+INDEX_FILE = ".extract_index.json"
+
 def extract_solder_patches(input_image_path, output_dir):
     """
     1) Loads the image
@@ -20,18 +39,8 @@ def extract_solder_patches(input_image_path, output_dir):
     if raw_img is None:
         raise ValueError(f"Could not read image {input_image_path}")
 
-    # Directly process the original image without cropping
-    bgr_eq, boxes = select_joint_method_fixed(
-        input_image_path,
-        do_hist_eq=True,
-        otsu_invert=True,
-        value_low_thresh=80,
-        median_ksize=3,
-        morph_open_ksize=4,
-        morph_close_ksize=5,
-        min_box_size=15,
-        max_box_size=500
-    )
+    # Directly process the original (already decoded) image without cropping
+    bgr_eq, boxes = segment_joints(raw_img, **EXTRACT_SEG_PARAMS)
 
     print(f"Detected {len(boxes)} bounding boxes in {input_image_path}")
 
@@ -44,12 +53,156 @@ def extract_solder_patches(input_image_path, output_dir):
         cv2.imwrite(patch_path, patch)
         print(f"Saved patch -> {patch_path}")
 
+def params_digest(params):
+    """Short stable hash of a segmentation parameter dict."""
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:12]
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-1 of a file's content."""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _extract_one(image_path, content_hash, output_dir, params):
+    """
+    Worker: segment one image and write its patches.
+    Patch names carry a short content hash so equal basenames from different
+    folders never collide. Returns (patch_filenames, error).
+    """
+    raw_img = cv2.imread(image_path)
+    if raw_img is None:
+        return [], f"Could not read image {image_path}"
+
+    bgr_eq, boxes = segment_joints(raw_img, **params)
+
+    base_name = os.path.splitext(os.path.basename(image_path))[0]
+    patch_files = []
+    for i, (x, y, w, h) in enumerate(boxes):
+        patch_filename = f"{base_name}_{content_hash[:8]}_patch_{i}.png"
+        cv2.imwrite(os.path.join(output_dir, patch_filename), bgr_eq[y:y+h, x:x+w])
+        patch_files.append(patch_filename)
+    return patch_files, None
+
+def load_index(output_dir):
+    index_path = os.path.join(output_dir, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return {}
+    with open(index_path) as f:
+        return json.load(f)
+
+def save_index(output_dir, index):
+    # Write-then-rename so an interrupted run never leaves a truncated index
+    index_path = os.path.join(output_dir, INDEX_FILE)
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+
+def extract_patches_bulk(inputs, output_dir="unlabeled_patches", workers=None, batch_size=64,
+                         params=None):
+    """
+    Bulk patch extraction over files, directories and globs:
+      1) Expand 'inputs' into image paths
+      2) Skip images already extracted with the same content hash + segmentation params
+         (recorded in <output_dir>/.extract_index.json); hashing runs in this
+         process, one file at a time, ahead of the pool (it reads each file
+         once, far cheaper than segmenting it); unreadable paths count as failed
+      3) Fan the rest out over a process pool; at most 'batch_size' images are in
+         flight at once, and the index is flushed after every 'batch_size' results
+      4) Print a throughput summary
+    Returns the summary dict.
+    """
+    if params is None:
+        params = EXTRACT_SEG_PARAMS
+    if workers is None:
+        workers = os.cpu_count()
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    t_start = time.perf_counter()
+    param_key = params_digest(params)
+    index = load_index(output_dir)
+    stats = {"images": 0, "skipped": 0, "failed": 0, "patches": 0}
+
+    def pending_jobs():
+        submitted = set()
+        for image_path in iter_image_paths(inputs):
+            try:
+                content_hash = file_digest(image_path)
+            except OSError as e:
+                print(f"Could not read {image_path}: {e}")
+                stats["failed"] += 1
+                continue
+            key = f"{content_hash}:{param_key}"
+            if key in submitted:
+                stats["skipped"] += 1
+                continue
+            entry = index.get(key)
+            if entry is not None and all(os.path.exists(os.path.join(output_dir, p))
+                                         for p in entry["patches"]):
+                stats["skipped"] += 1
+                continue
+            submitted.add(key)
+            yield image_path, content_hash, key
+
+    jobs = pending_jobs()
+    unsaved = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight = {}
+            while True:
+                # Keep the pool fed without ever queueing more than batch_size images
+                for image_path, content_hash, key in jobs:
+                    future = pool.submit(_extract_one, image_path, content_hash, output_dir, params)
+                    in_flight[future] = (image_path, key)
+                    if len(in_flight) >= batch_size:
+                        break
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    image_path, key = in_flight.pop(future)
+                    patch_files, error = future.result()
+                    if error is not None:
+                        print(error)
+                        stats["failed"] += 1
+                        continue
+                    index[key] = {"source": image_path, "patches": patch_files}
+                    stats["images"] += 1
+                    stats["patches"] += len(patch_files)
+                    unsaved += 1
+
+                if unsaved >= batch_size:
+                    save_index(output_dir, index)
+                    unsaved = 0
+    finally:
+        save_index(output_dir, index)
+
+    elapsed = time.perf_counter() - t_start
+    stats["seconds"] = elapsed
+    print(f"Processed {stats['images']} images ({stats['skipped']} already extracted, "
+          f"{stats['failed']} failed) -> {stats['patches']} patches in {elapsed:.1f} s")
+    if elapsed > 0:
+        print(f"Throughput: {stats['images'] / elapsed:.1f} images/s, "
+              f"{stats['patches'] / elapsed:.1f} patches/s with {workers} workers")
+    return stats
+
 def main():
-    # Example usage: process a single image
-    images = ["test6.jpg","test2.png"]
+    parser = argparse.ArgumentParser(description="Extract solder joint patches from board images.")
+    parser.add_argument("inputs", nargs="*", default=["test6.jpg", "test2.png"],
+                        help="image files, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", default="unlabeled_patches")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="worker processes (default: all cores)")
+    parser.add_argument("--batch-size", type=int, default=64,
+                        help="max images in flight / between index flushes")
+    args = parser.parse_args()
 
-    for img_file in images:
-        extract_solder_patches(img_file, output_dir="unlabeled_patches")
+    extract_patches_bulk(args.inputs, output_dir=args.output_dir,
+                         workers=args.workers, batch_size=args.batch_size)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
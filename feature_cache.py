@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.layers import Input
+from tensorflow.keras.models import Model
+
+def _layer_inputs(layer):
+    ins = layer.input
+    return ins if isinstance(ins, (list, tuple)) else [ins]
+
+def boundary_tensors(base_model, cut):
+    """
+    Tensors produced by layers[:cut] that layers[cut:] consume. MobileNetV2 has
+    residual adds, so a cut inside a block needs more than one tensor (e.g. at
+    layer 100 both block_11_expand_BN and block_10_project_BN cross the cut).
+    """
+    prefix_outputs = {id(layer.output) for layer in base_model.layers[:cut]}
+    needed = []
+    for layer in base_model.layers[cut:]:
+        for t in _layer_inputs(layer):
+            if id(t) in prefix_outputs and all(t is not n for n in needed):
+                needed.append(t)
+    return needed
+
+def split_backbone(base_model, cut, head_layers=()):
+    """
+    Splits a functional backbone at layer index 'cut'.
+    Returns (prefix_model, suffix_model):
+      prefix_model: image -> list of boundary tensors (the frozen part)
+      suffix_model: boundary tensors -> backbone output -> head_layers
+    Both reuse the original layer objects, so training suffix_model trains
+    the same weights the full model uses.
+    """
+    needed = boundary_tensors(base_model, cut)
+    prefix_model = Model(base_model.input, needed)
+
+    new_inputs = [Input(shape=t.shape[1:], dtype="float32") for t in needed]
+    mapping = {id(t): n for t, n in zip(needed, new_inputs)}
+    for layer in base_model.layers[cut:]:
+        ins = layer.input
+        if isinstance(ins, (list, tuple)):
+            args = [mapping[id(t)] for t in ins]
+        else:
+            args = mapping[id(ins)]
+        mapping[id(layer.output)] = layer(args)
+
+    x = mapping[id(base_model.output)]
+    for layer in head_layers:
+        x = layer(x)
+    suffix_model = Model(new_inputs, x)
+    return prefix_model, suffix_model
+
+def dataset_fingerprint(paths):
+    """Hash of the file list with sizes and modification times."""
+    h = hashlib.sha1()
+    for p in paths:
+        st = os.stat(p)
+        h.update(f"{p}|{st.st_size}|{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+class FeatureStore:
+    """
+    Memory-mapped store of frozen-prefix activations:
+        <root>/<name>-<key>/features_<i>.npy   one per boundary tensor, (N, h, w, c)
+        <root>/<name>-<key>/labels.npy         (N,) int class indices
+        <root>/<name>-<key>/meta.json          written last, marks the store complete
+    'key' hashes everything the activations depend on (data fingerprint, cut
+    point, image size, views, seed, weights), so changing any of them builds a
+    new store and older '<name>-*' stores are deleted.
+    """
+
+    def __init__(self, root, name, key_info):
+        self.key = hashlib.sha1(json.dumps(key_info, sort_keys=True).encode()).hexdigest()[:16]
+        self.name = name
+        self.root = root
+        self.path = os.path.join(root, f"{name}-{self.key}")
+        self.features = []
+        self.labels = None
+
+    @property
+    def complete(self):
+        return os.path.exists(os.path.join(self.path, "meta.json"))
+
+    @property
+    def num_samples(self):
+        return len(self.labels)
+
+    def open(self):
+        with open(os.path.join(self.path, "meta.json")) as f:
+            meta = json.load(f)
+        self.features = [np.load(os.path.join(self.path, f"features_{i}.npy"), mmap_mode="r")
+                         for i in range(meta["num_tensors"])]
+        self.labels = np.load(os.path.join(self.path, "labels.npy"), mmap_mode="r")
+        return self
+
+    def build(self, prefix_model, batches_for_view, num_samples, views=1, dtype=np.float16):
+        """
+        Runs prefix_model once over the data and writes the activations.
+        batches_for_view(view) must return an iterable of (model-ready images,
+        int labels) batches covering 'num_samples' samples; view 0 is normally the
+        un-augmented data and views 1.. fixed, seeded augmentations of it.
+        """
+        for stale in os.listdir(self.root) if os.path.exists(self.root) else []:
+            if stale.startswith(f"{self.name}-"):
+                shutil.rmtree(os.path.join(self.root, stale))
+        os.makedirs(self.path)
+
+        outputs = prefix_model.outputs
+        total = num_samples * views
+        features = [np.lib.format.open_memmap(os.path.join(self.path, f"features_{i}.npy"), mode="w+",
+                                              dtype=dtype, shape=(total,) + tuple(t.shape[1:]))
+                    for i, t in enumerate(outputs)]
+        labels = np.lib.format.open_memmap(os.path.join(self.path, "labels.npy"), mode="w+",
+                                           dtype=np.int64, shape=(total,))
+
+        pos = 0
+        for view in range(views):
+            for images, batch_labels in batches_for_view(view):
+                acts = prefix_model(images, training=False)
+                if not isinstance(acts, (list, tuple)):
+                    acts = [acts]
+                n = len(batch_labels)
+                for store, act in zip(features, acts):
+                    store[pos:pos + n] = np.asarray(act, dtype=dtype)
+                labels[pos:pos + n] = np.asarray(batch_labels)
+                pos += n
+
+        for store in features:
+            store.flush()
+        labels.flush()
+        del features, labels
+
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump({"num_tensors": len(outputs), "num_samples": total}, f)
+        return self.open()
+
+    def dataset(self, batch_size, num_classes, shuffle=False, seed=0, repeat=False):
+        """
+        tf.data over the store: batches of indices are gathered from the memmaps
+        (sorted within the batch for sequential reads) and cast to float32.
+        Yields (features, one_hot_labels), features being a tuple when the cut
+        has several boundary tensors.
+        """
+        n = self.num_samples
+        k = len(self.features)
+        shapes = [f.shape[1:] for f in self.features]
+
+        def gather(idx):
+            idx = np.sort(idx)
+            out = [np.asarray(f[idx], dtype=np.float32) for f in self.features]
+            return out + [np.asarray(self.labels[idx], dtype=np.int64)]
+
+        def load(idx):
+            out = tf.numpy_function(gather, [idx], [tf.float32] * k + [tf.int64])
+            feats = []
+            for t, shape in zip(out[:k], shapes):
+                t.set_shape((None,) + tuple(shape))
+                feats.append(t)
+            out[k].set_shape((None,))
+            y = tf.one_hot(out[k], num_classes)
+            return (tuple(feats) if k > 1 else feats[0]), y
+
+        ds = tf.data.Dataset.range(n)
+        if shuffle:
+            ds = ds.shuffle(n, seed=seed, reshuffle_each_iteration=True)
+        if repeat:
+            ds = ds.repeat()
+        ds = ds.batch(batch_size).map(load, num_parallel_calls=tf.data.AUTOTUNE)
+        return ds.prefetch(tf.data.AUTOTUNE)
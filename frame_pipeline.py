@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+import queue
+import threading
+import time
+from collections import deque
+
+class FrameRing:
+    """
+    Small thread-safe ring buffer of (seq, timestamp, frame). When full, put()
+    drops the oldest frame instead of blocking the producer, so a slow consumer
+    only ever sees stale frames skipped, never a growing backlog.
+    """
+
+    def __init__(self, size=3):
+        self._frames = deque(maxlen=size)
+        self._cond = threading.Condition()
+        self._seq = 0
+        self.dropped = 0
+
+    def put(self, frame, timestamp=None):
+        with self._cond:
+            if len(self._frames) == self._frames.maxlen:
+                self.dropped += 1
+            self._seq += 1
+            self._frames.append((self._seq, time.perf_counter() if timestamp is None else timestamp, frame))
+            self._cond.notify_all()
+            return self._seq
+
+    def latest(self, after=0, timeout=None):
+        """
+        Newest (seq, timestamp, frame) with seq > 'after'. Waits up to 'timeout'
+        seconds for one (None waits forever, 0 doesn't wait); returns None on timeout.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._frames and self._frames[-1][0] > after, timeout):
+                return None
+            return self._frames[-1]
+
+class CaptureThread(threading.Thread):
+    """
+    Producer thread: calls read_frame() in a loop and pushes every frame into
+    'ring'. read_frame returns a frame, or None to skip; raising StopIteration
+    ends the thread (e.g. at the end of a file). min_interval caps the rate.
+    """
+
+    def __init__(self, read_frame, ring, min_interval=0.0):
+        super().__init__(daemon=True)
+        self.read_frame = read_frame
+        self.ring = ring
+        self.min_interval = min_interval
+        self.frames = 0
+        self.error = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            t0 = time.perf_counter()
+            try:
+                frame = self.read_frame()
+            except StopIteration:
+                break
+            except Exception as e:  # surfaced to the caller via self.error
+                self.error = e
+                break
+            if frame is not None:
+                # Timestamp when the frame is in hand (read() may block on the camera or pacing)
+                self.ring.put(frame)
+                self.frames += 1
+            wait = self.min_interval - (time.perf_counter() - t0)
+            if wait > 0:
+                self._stop_event.wait(wait)
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        self.join(timeout)
+
+class InferenceWorker(threading.Thread):
+    """
+    Consumer thread: runs infer(frame) off the UI thread and puts
+    (seq, frame, output, seconds, captured_at) into self.results; output is
+    the exception on failure, captured_at the frame's ring timestamp (or the
+    submit() time for one-off requests).
+    submit(frame) queues a one-off request (latest request wins); with
+    auto=True the worker keeps inferring the newest frame in 'ring' it has not
+    seen yet, skipping whatever arrived while it was busy.
+    """
+
+    def __init__(self, infer, ring=None, auto=False, results=None):
+        super().__init__(daemon=True)
+        self.infer = infer
+        self.ring = ring
+        self.auto = auto
+        self.results = results if results is not None else queue.Queue()
+        self.busy = False
+        self._request = None
+        self._request_time = None
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self._last_seq = 0
+
+    def submit(self, frame):
+        with self._cond:
+            self._request = frame
+            self._request_time = time.perf_counter()
+            self._cond.notify_all()
+
+    def set_auto(self, auto):
+        with self._cond:
+            self.auto = auto
+            self._cond.notify_all()
+
+    def _next_job(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self._request is not None or self.auto or self._stop_event.is_set())
+            if self._request is not None:
+                frame, self._request = self._request, None
+                return 0, frame, self._request_time
+        if self.ring is None:
+            self._stop_event.wait(0.05)
+            return None
+        item = self.ring.latest(after=self._last_seq, timeout=0.1)
+        if item is None:
+            return None
+        self._last_seq = item[0]
+        return item[0], item[2], item[1]
+
+    def run(self):
+        while not self._stop_event.is_set():
+            job = self._next_job()
+            if job is None:
+                continue
+            seq, frame, captured_at = job
+            self.busy = True
+            t0 = time.perf_counter()
+            try:
+                output = self.infer(frame)
+            except Exception as e:  # reported through the results queue
+                output = e
+            self.busy = False
+            self.results.put((seq, frame, output, time.perf_counter() - t0, captured_at))
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+        self.join(timeout)
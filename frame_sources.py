@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+import os
+import time
+
+import cv2
+
+from image_seg import IMAGE_EXTENSIONS, iter_image_paths, load_image
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".h264")
+
+class FrameSource:
+    """
+    Something that produces RGB frames (what the GUI displays): read() returns
+    the next frame as an (H, W, 3) uint8 array and raises StopIteration when
+    the source is exhausted. Usable as a context manager.
+    """
+
+    def read(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class Picamera2Source(FrameSource):
+    """Raspberry Pi camera through picamera2 (imported only when used)."""
+
+    def __init__(self, size=(640, 480)):
+        from picamera2 import Picamera2
+
+        self.picam2 = Picamera2()
+        config = self.picam2.create_preview_configuration(
+            main={"format": "RGB888", "size": size}
+        )
+        self.picam2.configure(config)
+        self.picam2.start()
+
+    def read(self):
+        return self.picam2.capture_array()
+
+    def close(self):
+        self.picam2.stop()
+
+class OpenCVCameraSource(FrameSource):
+    """
+    USB / laptop camera through cv2.VideoCapture. 'api' selects the backend,
+    e.g. cv2.CAP_DSHOW on Windows or cv2.CAP_V4L2 on Linux.
+    """
+
+    def __init__(self, index=0, api=cv2.CAP_ANY, size=None):
+        self.cap = cv2.VideoCapture(index, api)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"Could not open camera {index}")
+        if size is not None:
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, size[0])
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, size[1])
+
+    def read(self):
+        ok, bgr = self.cap.read()
+        if not ok:
+            return None
+        return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+
+    def close(self):
+        self.cap.release()
+
+class _Pacer:
+    """Releases frame i no earlier than i / fps seconds after the first one."""
+
+    def __init__(self, fps):
+        self.fps = fps
+        self.start = None
+        self.count = 0
+
+    def wait(self):
+        if not self.fps:
+            return
+        now = time.perf_counter()
+        if self.start is None:
+            self.start = now
+        delay = self.start + self.count / self.fps - now
+        if delay > 0:
+            time.sleep(delay)
+        self.count += 1
+
+class VideoFileSource(FrameSource):
+    """
+    Replays a recorded video. pace=True releases frames at the file's frame
+    rate (like a live camera); pace=False decodes as fast as possible.
+    fps overrides the rate stored in the file. loop restarts at the end.
+    """
+
+    def __init__(self, path, pace=True, fps=None, loop=False):
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise FileNotFoundError(f"Could not open video {path}")
+        self.fps = fps or self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.loop = loop
+        self._pacer = _Pacer(self.fps if pace else None)
+
+    def read(self):
+        ok, bgr = self.cap.read()
+        if not ok and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, bgr = self.cap.read()
+        if not ok:
+            raise StopIteration
+        self._pacer.wait()
+        return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+
+    def close(self):
+        self.cap.release()
+
+class ImageFolderSource(FrameSource):
+    """
+    Replays still images (files, directories or glob patterns, see
+    iter_image_paths) as frames, optionally at 'fps' and in a loop.
+    """
+
+    def __init__(self, inputs, fps=None, loop=False):
+        self.paths = iter_image_paths(inputs)
+        if not self.paths:
+            raise FileNotFoundError(f"No images found in {inputs}")
+        self.loop = loop
+        self._next = 0
+        self._pacer = _Pacer(fps)
+
+    def read(self):
+        if self._next >= len(self.paths):
+            if not self.loop:
+                raise StopIteration
+            self._next = 0
+        path = self.paths[self._next]
+        self._next += 1
+        bgr = load_image(path)
+        self._pacer.wait()
+        return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+
+def open_source(spec, pace=True, fps=None, loop=False):
+    """
+    Builds a FrameSource from a command-line style spec:
+      "picamera2"          Raspberry Pi camera
+      "camera" / "camera:N" cv2.VideoCapture(N)
+      path to a video file  VideoFileSource (paced unless pace=False)
+      anything else         ImageFolderSource (file, directory or glob)
+    """
+    if spec == "picamera2":
+        return Picamera2Source()
+    if spec == "camera" or spec.startswith("camera:"):
+        return OpenCVCameraSource(int(spec.partition(":")[2] or 0))
+    if os.path.isfile(spec) and spec.lower().endswith(VIDEO_EXTENSIONS):
+        return VideoFileSource(spec, pace=pace, fps=fps, loop=loop)
+    if os.path.isfile(spec) and not spec.lower().endswith(IMAGE_EXTENSIONS):
+        raise ValueError(f"Unsupported frame source '{spec}'")
+    return ImageFolderSource([spec], fps=fps, loop=loop)
@@ -1,9 +1,247 @@
 import cv2
+import glob
 import numpy as np
 import os
 
-def select_joint_method_fixed(
-    image_path,
+from stage_timing import stage
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+class DebugSink:
+    """
+    Collects the pipeline's intermediate masks in memory.
+    Nothing touches disk until write() is called.
+    """
+
+    def __init__(self):
+        self.images = {}
+
+    def add(self, name, img):
+        # Copy: the segmentation may reuse its buffers on the next frame
+        self.images[name] = img.copy()
+
+    def write(self, out_dir="."):
+        """Saves every collected image as <out_dir>/<name>.png."""
+        if not os.path.exists(out_dir):
+            os.makedirs(out_dir)
+        for name, img in self.images.items():
+            cv2.imwrite(os.path.join(out_dir, f"{name}.png"), img)
+
+# Default 'Select Joint' parameters (same as the segment_joints keyword defaults)
+DEFAULT_SEG_PARAMS = dict(
+    do_hist_eq=False,
+    otsu_invert=True,
+    value_low_thresh=80,
+    median_ksize=3,
+    morph_open_ksize=4,
+    morph_close_ksize=5,
+    min_box_size=15,
+    max_box_size=500,
+    morph_dilate_ksize=9,
+    morph_dilate_iterations=2
+)
+
+class JointSegmenter:
+    """
+    Stateful 'Select Joint' pipeline for frame streams.
+    Structuring elements are built once per parameter set and every intermediate
+    image lives in a buffer preallocated per frame size; all OpenCV calls write
+    into those buffers via dst=, so segmenting consecutive frames of the same
+    size allocates nothing but the contour list.
+
+    Note: the returned bgr_eq is an internal buffer when do_hist_eq is True and
+    is overwritten by the next call to segment().
+    """
+
+    def __init__(self, **params):
+        self.params = {}
+        self._shape = None
+        self.last_hue_thresh = None
+        self.set_params(**params)
+
+    def set_params(self, **params):
+        """Updates parameters; kernels are only rebuilt if their sizes changed."""
+        unknown = set(params) - set(DEFAULT_SEG_PARAMS)
+        if unknown:
+            raise TypeError(f"Unknown segmentation parameter(s): {sorted(unknown)}")
+
+        new_params = dict(DEFAULT_SEG_PARAMS, **self.params)
+        new_params.update(params)
+        old_params, self.params = self.params, new_params
+
+        def kernel(ksize):
+            if ksize <= 0:
+                return None
+            return cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (ksize, ksize))
+
+        for attr, name in (("_close_kernel", "morph_close_ksize"),
+                           ("_open_kernel", "morph_open_ksize"),
+                           ("_dilate_kernel", "morph_dilate_ksize")):
+            if old_params.get(name) != self.params[name]:
+                setattr(self, attr, kernel(self.params[name]))
+
+    def _allocate(self, shape):
+        """(Re)allocates every work buffer for a frame of 'shape' (h, w, 3)."""
+        h, w = shape[:2]
+        self._yuv = np.empty((h, w, 3), dtype=np.uint8)
+        self._luma = np.empty((h, w), dtype=np.uint8)
+        self._bgr_eq = np.empty((h, w, 3), dtype=np.uint8)
+        self._hsv = np.empty((h, w, 3), dtype=np.uint8)
+        self._hue = np.empty((h, w), dtype=np.uint8)
+        self._value = np.empty((h, w), dtype=np.uint8)
+        self._mask_hue = np.empty((h, w), dtype=np.uint8)
+        self._mask_value = np.empty((h, w), dtype=np.uint8)
+        self._merged = np.empty((h, w), dtype=np.uint8)
+        self._morph = np.empty((h, w), dtype=np.uint8)
+        self._filtered = np.empty((h, w), dtype=np.uint8)
+        self._dilated = np.empty((h, w), dtype=np.uint8)
+        self._shape = shape
+
+    def equalize(self, bgr_img):
+        """Step 1: optional histogram eq on the luma channel (returns 'bgr_img' if disabled)."""
+        if not self.params["do_hist_eq"]:
+            return bgr_img
+        if bgr_img.shape != self._shape:
+            self._allocate(bgr_img.shape)
+        with stage("seg.hist_eq"):
+            cv2.cvtColor(bgr_img, cv2.COLOR_BGR2YUV, dst=self._yuv)
+            cv2.extractChannel(self._yuv, 0, dst=self._luma)
+            cv2.equalizeHist(self._luma, dst=self._luma)
+            cv2.insertChannel(self._luma, self._yuv, 0)
+            return cv2.cvtColor(self._yuv, cv2.COLOR_YUV2BGR, dst=self._bgr_eq)
+
+    def mask(self, bgr_eq, hue_thresh=None, debug=None):
+        """
+        Steps 2-8 on an (already equalized) BGR image; returns the final dilated
+        mask (an internal buffer). hue_thresh=None picks the Hue threshold with
+        Otsu on this image, a number uses that fixed threshold instead; the
+        value used is kept in 'last_hue_thresh'.
+        """
+        p = self.params
+        if bgr_eq.shape != self._shape:
+            self._allocate(bgr_eq.shape)
+
+        # 2) Convert to HSV
+        with stage("seg.hsv"):
+            cv2.cvtColor(bgr_eq, cv2.COLOR_BGR2HSV, dst=self._hsv)
+            cv2.extractChannel(self._hsv, 0, dst=self._hue)    # hue
+            cv2.extractChannel(self._hsv, 2, dst=self._value)  # value
+
+        # 3) Hue -> Otsu threshold
+        otsu_flag = cv2.THRESH_BINARY_INV if p["otsu_invert"] else cv2.THRESH_BINARY
+        with stage("seg.otsu"):
+            if hue_thresh is None:
+                hue_thresh, _ = cv2.threshold(self._hue, 0, 255, otsu_flag + cv2.THRESH_OTSU, dst=self._mask_hue)
+            else:
+                cv2.threshold(self._hue, hue_thresh, 255, otsu_flag, dst=self._mask_hue)
+        self.last_hue_thresh = hue_thresh
+        if debug is not None:
+            debug.add("otsu_hue", self._mask_hue)
+
+        # 4) Value -> low threshold gating
+        # 5) Merge masks with AND
+        with stage("seg.value_gate"):
+            cv2.threshold(self._value, p["value_low_thresh"], 255, cv2.THRESH_BINARY, dst=self._mask_value)
+            merged_mask = cv2.bitwise_and(self._mask_hue, self._mask_value, dst=self._merged)
+        if debug is not None:
+            debug.add("low_thresh_value", self._mask_value)
+            debug.add("mask_merged", merged_mask)
+
+        # 6) Additional morphological opening/closing (ping-pong between two buffers)
+        with stage("seg.morphology"):
+            if self._close_kernel is not None:
+                other = self._morph if merged_mask is self._merged else self._merged
+                merged_mask = cv2.morphologyEx(merged_mask, cv2.MORPH_CLOSE, self._close_kernel,
+                                               dst=other, iterations=1)
+
+            if self._open_kernel is not None:
+                other = self._morph if merged_mask is self._merged else self._merged
+                merged_mask = cv2.morphologyEx(merged_mask, cv2.MORPH_OPEN, self._open_kernel,
+                                               dst=other, iterations=1)
+
+        # 7) Median filter (size=3 from the paper)
+        with stage("seg.median"):
+            filtered_mask = cv2.medianBlur(merged_mask, p["median_ksize"], dst=self._filtered)
+        if debug is not None:
+            debug.add("mask_filtered", filtered_mask)
+
+        # 8)
+        # Increasing ksize or iterations will make bounding boxes bigger
+        if self._dilate_kernel is not None and p["morph_dilate_iterations"] > 0:
+            with stage("seg.dilate"):
+                dilated_mask = cv2.dilate(filtered_mask, self._dilate_kernel, dst=self._dilated,
+                                          iterations=p["morph_dilate_iterations"])
+            if debug is not None:
+                debug.add("mask_dilated", dilated_mask)
+        else:
+            dilated_mask = filtered_mask
+
+        return dilated_mask
+
+    def segment(self, bgr_img, debug=None):
+        """
+        Runs the pipeline on one BGR frame. Same steps and results as
+        segment_joints(); see there for 'debug' and the return value.
+        """
+        bgr_eq = self.equalize(bgr_img)
+        dilated_mask = self.mask(bgr_eq, debug=debug)
+        return bgr_eq, boxes_from_mask(dilated_mask, self.params["min_box_size"], self.params["max_box_size"])
+
+def boxes_from_mask(mask, min_box_size=15, max_box_size=500):
+    """
+    Steps 9-10: external contours of a binary mask -> (x, y, w, h) boxes,
+    dropping boxes smaller than min_box_size or larger than max_box_size.
+    """
+    # 9) Contour detection
+    with stage("seg.contours"):
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        bounding_boxes = []
+        for cnt in contours:
+            x, y, w, h = cv2.boundingRect(cnt)
+
+            # Filter out small or large boxes
+            if w < min_box_size or h < min_box_size:
+                continue
+            if w > max_box_size or h > max_box_size:
+                continue
+
+            bounding_boxes.append((x, y, w, h))
+
+    return bounding_boxes
+
+def box_iou(a, b):
+    """IoU matrix between two lists of (x, y, w, h) boxes."""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    ax2, ay2 = a[:, 0] + a[:, 2], a[:, 1] + a[:, 3]
+    bx2, by2 = b[:, 0] + b[:, 2], b[:, 1] + b[:, 3]
+    iw = np.clip(np.minimum(ax2[:, None], bx2[None]) - np.maximum(a[:, None, 0], b[None, :, 0]), 0, None)
+    ih = np.clip(np.minimum(ay2[:, None], by2[None]) - np.maximum(a[:, None, 1], b[None, :, 1]), 0, None)
+    inter = iw * ih
+    union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None] - inter
+    return inter / np.maximum(union, 1e-6)
+
+def match_boxes(reference, other, iou_match=0.5):
+    """
+    Greedy one-to-one matching of 'other' boxes to 'reference' boxes, best
+    IoU first; returns [(i_reference, j_other, iou)] for pairs with IoU >= iou_match.
+    """
+    if len(reference) == 0 or len(other) == 0:
+        return []
+    iou = box_iou(reference, other)
+    pairs = []
+    used = set()
+    for i in np.argsort(-iou.max(axis=1)):
+        j = int(np.argmax(iou[i]))
+        if iou[i, j] < iou_match or j in used:
+            continue
+        used.add(j)
+        pairs.append((int(i), j, float(iou[i, j])))
+    return pairs
+
+def segment_joints(
+    bgr_img,
     do_hist_eq=False,
     otsu_invert=True,       # If True, do THRESH_BINARY_INV+OTSU on Hue instead of THRESH_BINARY+OTSU
     value_low_thresh=80,    # Low-threshold gating on the Value channel
@@ -16,10 +254,11 @@ def select_joint_method_fixed(
     max_box_size=500,
     # NEW: optional dilation settings
     morph_dilate_ksize=9,
-    morph_dilate_iterations=2
+    morph_dilate_iterations=2,
+    debug=None
 ):
     """
-    Revised 'Select Joint' pipeline:
+    Revised 'Select Joint' pipeline on an in-memory BGR image:
       1) Histogram Equalization (optional)
       2) BGR->HSV
       3) Hue -> Otsu threshold (with optional invert)
@@ -31,92 +270,104 @@ def select_joint_method_fixed(
       9) Find contours, filter out outliers
       10) Return bounding boxes
 
-    Saves intermediate images for debug.
+    debug: optional DebugSink that receives the intermediate masks
+           (otsu_hue, low_thresh_value, mask_merged, mask_filtered, mask_dilated).
+           Off by default, so nothing is written or copied in the hot path.
+
+    Returns (bgr_eq, boxes). bgr_eq is 'bgr_img' itself (not a copy) when do_hist_eq is False.
+    One-shot call: for a stream of frames keep a JointSegmenter instead.
     """
+    segmenter = JointSegmenter(
+        do_hist_eq=do_hist_eq,
+        otsu_invert=otsu_invert,
+        value_low_thresh=value_low_thresh,
+        median_ksize=median_ksize,
+        morph_open_ksize=morph_open_ksize,
+        morph_close_ksize=morph_close_ksize,
+        min_box_size=min_box_size,
+        max_box_size=max_box_size,
+        morph_dilate_ksize=morph_dilate_ksize,
+        morph_dilate_iterations=morph_dilate_iterations
+    )
+    return segmenter.segment(bgr_img, debug=debug)
 
+def load_image(image_path):
+    """Reads a BGR image from disk with the same errors the pipeline always raised."""
     if not os.path.exists(image_path):
         raise FileNotFoundError(f"Could not find image at: {image_path}")
 
-    # 1) Load image
-    bgr_img = cv2.imread(image_path)
+    with stage("decode"):
+        bgr_img = cv2.imread(image_path)
     if bgr_img is None:
         raise ValueError("Could not read image file. Check format.")
+    return bgr_img
 
-    # Optional histogram eq
-    if do_hist_eq:
-        yuv = cv2.cvtColor(bgr_img, cv2.COLOR_BGR2YUV)
-        yuv[..., 0] = cv2.equalizeHist(yuv[..., 0])
-        bgr_eq = cv2.cvtColor(yuv, cv2.COLOR_YUV2BGR)
-    else:
-        bgr_eq = bgr_img.copy()
-
-    # 2) Convert to HSV
-    hsv = cv2.cvtColor(bgr_eq, cv2.COLOR_BGR2HSV)
-    h_channel = hsv[..., 0]  # hue
-    v_channel = hsv[..., 2]  # value
-
-    # 3) Hue -> Otsu threshold
-    otsu_flag = cv2.THRESH_BINARY_INV if otsu_invert else cv2.THRESH_BINARY
-    _, mask_hue = cv2.threshold(
-        h_channel, 0, 255,
-        otsu_flag + cv2.THRESH_OTSU
-    )
-    cv2.imwrite("otsu_hue.png", mask_hue)
-
-    # 4) Value -> low threshold gating
-    _, mask_value = cv2.threshold(
-        v_channel, value_low_thresh, 255,
-        cv2.THRESH_BINARY
-    )
-    cv2.imwrite("low_thresh_value.png", mask_value)
-
-    # 5) Merge masks with AND
-    merged_mask = cv2.bitwise_and(mask_hue, mask_value)
-    cv2.imwrite("mask_merged.png", merged_mask)
-
-    # 6) Additional morphological opening/closing
-    if morph_close_ksize > 0:
-        close_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (morph_close_ksize, morph_close_ksize))
-        merged_mask = cv2.morphologyEx(merged_mask, cv2.MORPH_CLOSE, close_kernel, iterations=1)
-
-    if morph_open_ksize > 0:
-        open_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (morph_open_ksize, morph_open_ksize))
-        merged_mask = cv2.morphologyEx(merged_mask, cv2.MORPH_OPEN, open_kernel, iterations=1)
-
-    # 7) Median filter (size=3 from the paper)
-    filtered_mask = cv2.medianBlur(merged_mask, median_ksize)
-    cv2.imwrite("mask_filtered.png", filtered_mask)
-
-    # 8)
-    # Increasing ksize or iterations will make bounding boxes bigger
-    if morph_dilate_ksize > 0 and morph_dilate_iterations > 0:
-        dilate_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (morph_dilate_ksize, morph_dilate_ksize))
-        dilated_mask = cv2.dilate(filtered_mask, dilate_kernel, iterations=morph_dilate_iterations)
-        cv2.imwrite("mask_dilated.png", dilated_mask)
-    else:
-        dilated_mask = filtered_mask
-
-    # 9) Contour detection
-    contours, _ = cv2.findContours(dilated_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-    bounding_boxes = []
-    for cnt in contours:
-        x, y, w, h = cv2.boundingRect(cnt)
+def iter_image_paths(inputs):
+    """
+    Expands a list of image files, directories and/or glob patterns
+    (e.g. "captures/**/*.jpg") into a sorted, de-duplicated list of image paths.
+    """
+    if isinstance(inputs, str):
+        inputs = [inputs]
 
-        # Filter out small or large boxes
-        if w < min_box_size or h < min_box_size:
-            continue
-        if w > max_box_size or h > max_box_size:
-            continue
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for f in sorted(os.listdir(item)):
+                if f.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(os.path.join(item, f))
+        elif any(c in item for c in "*?["):
+            paths.extend(p for p in sorted(glob.glob(item, recursive=True))
+                         if p.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            paths.append(item)
 
-        bounding_boxes.append((x, y, w, h))
+    seen = set()
+    return [p for p in paths if not (p in seen or seen.add(p))]
 
-    return bgr_eq, bounding_boxes
+def select_joint_method_fixed(
+    image_path,
+    do_hist_eq=False,
+    otsu_invert=True,       # If True, do THRESH_BINARY_INV+OTSU on Hue instead of THRESH_BINARY+OTSU
+    value_low_thresh=80,    # Low-threshold gating on the Value channel
+    median_ksize=3,
+    # Additional morph to fix holes or remove specks
+    morph_open_ksize=4,
+    morph_close_ksize=5,
+    # bounding box filters
+    min_box_size=15,
+    max_box_size=500,
+    # NEW: optional dilation settings
+    morph_dilate_ksize=9,
+    morph_dilate_iterations=2,
+    debug=None
+):
+    """
+    Path-based wrapper around segment_joints(): loads 'image_path' and runs the
+    pipeline with the same parameters. Returns (bgr_eq, boxes).
+    Pass a DebugSink as 'debug' to get the intermediate masks.
+    """
+    return segment_joints(
+        load_image(image_path),
+        do_hist_eq=do_hist_eq,
+        otsu_invert=otsu_invert,
+        value_low_thresh=value_low_thresh,
+        median_ksize=median_ksize,
+        morph_open_ksize=morph_open_ksize,
+        morph_close_ksize=morph_close_ksize,
+        min_box_size=min_box_size,
+        max_box_size=max_box_size,
+        morph_dilate_ksize=morph_dilate_ksize,
+        morph_dilate_iterations=morph_dilate_iterations,
+        debug=debug
+    )
 
 def main():
     image_path = "newtest3.jpeg"
+    debug = DebugSink()
     bgr_img, boxes = select_joint_method_fixed(
         image_path,
+        debug=debug,
         do_hist_eq=False,
         otsu_invert=True,
         value_low_thresh=80,
@@ -132,6 +383,9 @@ def main():
 
     print(f"Found {len(boxes)} bounding boxes after final step.")
 
+    # Save intermediate masks for debug
+    debug.write(".")
+
     # Draw detected bounding boxes for visual check
     output_img = bgr_img.copy()
     for (x, y, w, h) in boxes:
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+import time
+
+import cv2
+import numpy as np
+
+from image_seg import JointSegmenter, box_iou
+from inference_test import SEG_PARAMS, crop_patches, draw_results, joint_results
+
+class IncrementalInspector:
+    """
+    Segmentation + classification for a mostly static scene (board in the
+    fixture, live feed or video). Only joints whose pixels changed are cropped
+    and classified again; every other joint keeps its cached label/confidence.
+
+    A grayscale reference frame holds, per joint box, the pixels the cached
+    result was computed from. Each frame costs one absdiff + integral image
+    against it (at 'diff_scale'), which gives the mean change inside every box
+    in O(1) per box:
+      - boxes changing by more than 'box_threshold' (mean gray levels) are
+        re-classified in one batch and their reference pixels refreshed;
+      - a whole-frame change above 'scene_threshold' (new board, camera moved),
+        or every 'resegment_every' frames, re-runs segmentation; new boxes are
+        matched to the old ones by IoU >= 'iou_match' and unchanged matches
+        keep their cached result.
+    """
+
+    def __init__(self, engine, seg_params=None, box_threshold=6.0, scene_threshold=12.0,
+                 resegment_every=30, iou_match=0.5, diff_scale=0.5, segmenter=None, result_log=None):
+        self.engine = engine
+        # Any JointSegmenter-like object, e.g. board_template.TemplateDetector
+        self.segmenter = segmenter if segmenter is not None else JointSegmenter(**(seg_params or SEG_PARAMS))
+        self.box_threshold = box_threshold
+        self.scene_threshold = scene_threshold
+        self.resegment_every = resegment_every
+        self.iou_match = iou_match
+        self.diff_scale = diff_scale
+        self.result_log = result_log  # optional result_log.JointResultLog, one board per frame
+        self.session = time.strftime("%Y%m%d-%H%M%S")
+        self.reset()
+
+    def reset(self):
+        """Forgets every tracked joint; the next frame is fully segmented and classified."""
+        self.boxes = []
+        self.results = []
+        self._reference = None
+        self._since_segment = 0
+        self.stats = {"frames": 0, "segmentations": 0, "classified": 0, "reused": 0}
+
+    def _gray(self, bgr):
+        gray = cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+        if self.diff_scale != 1.0:
+            gray = cv2.resize(gray, None, fx=self.diff_scale, fy=self.diff_scale, interpolation=cv2.INTER_AREA)
+        return gray
+
+    def _scaled(self, boxes, shape):
+        """Boxes in diff-image coordinates as (x0, y0, x1, y1), clipped and at least 1 px."""
+        b = np.asarray(boxes, dtype=np.float32).reshape(-1, 4) * self.diff_scale
+        x0 = np.clip(np.floor(b[:, 0]), 0, shape[1] - 1).astype(int)
+        y0 = np.clip(np.floor(b[:, 1]), 0, shape[0] - 1).astype(int)
+        x1 = np.clip(np.ceil(b[:, 0] + b[:, 2]), x0 + 1, shape[1]).astype(int)
+        y1 = np.clip(np.ceil(b[:, 1] + b[:, 3]), y0 + 1, shape[0]).astype(int)
+        return x0, y0, x1, y1
+
+    def box_changes(self, diff, boxes):
+        """Mean of the absdiff image 'diff' (gray vs. reference) inside every box."""
+        if not len(boxes):
+            return np.zeros((0,), dtype=np.float64)
+        integral = cv2.integral(diff)
+        x0, y0, x1, y1 = self._scaled(boxes, diff.shape)
+        sums = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+        return sums / ((x1 - x0) * (y1 - y0))
+
+    def _refresh_reference(self, gray, boxes):
+        x0, y0, x1, y1 = self._scaled(boxes, gray.shape)
+        for i in range(len(x0)):
+            self._reference[y0[i]:y1[i], x0[i]:x1[i]] = gray[y0[i]:y1[i], x0[i]:x1[i]]
+
+    def _classify(self, bgr_eq, boxes):
+        if not boxes:
+            return []
+        probs = self.engine.classify_patches(crop_patches(bgr_eq, boxes))
+        self.stats["classified"] += len(boxes)
+        return joint_results(boxes, probs, self.engine.class_names)
+
+    def inspect(self, bgr):
+        """
+        Processes one BGR frame. Returns (bgr_eq, results) with results in the
+        same format as ClassifierEngine.classify_boxes().
+        """
+        self.stats["frames"] += 1
+        gray = self._gray(bgr)
+        diff = None
+        if self._reference is not None and gray.shape == self._reference.shape:
+            diff = cv2.absdiff(gray, self._reference)
+        scene_change = diff is None or float(diff.mean()) > self.scene_threshold
+        self._since_segment += 1
+
+        if scene_change or self._since_segment >= self.resegment_every:
+            bgr_eq, boxes = self.segmenter.segment(bgr)
+            boxes = [tuple(b) for b in boxes]
+            self.stats["segmentations"] += 1
+            self._since_segment = 0
+            old_reference = self._reference
+            if scene_change:
+                self.boxes, self.results = [], []
+                old_reference = None
+            reuse = [None] * len(boxes)
+            if self.boxes and boxes:
+                iou = box_iou(boxes, self.boxes)
+                changes = self.box_changes(diff, boxes)
+                for i in np.argsort(-iou.max(axis=1)):
+                    j = int(np.argmax(iou[i]))
+                    if iou[i, j] >= self.iou_match and changes[i] <= self.box_threshold and j not in reuse:
+                        reuse[i] = j
+
+            # Reused boxes keep their old reference pixels, everything else starts from this frame
+            self._reference = gray.copy()
+            fresh = [b for b, r in zip(boxes, reuse) if r is None]
+            fresh_results = iter(self._classify(bgr_eq, fresh))
+            results = []
+            for box, r in zip(boxes, reuse):
+                if r is None:
+                    results.append(next(fresh_results))
+                else:
+                    old = self.results[r]
+                    results.append({**old, "box": box})
+                    x0, y0, x1, y1 = self._scaled([box], gray.shape)
+                    self._reference[y0[0]:y1[0], x0[0]:x1[0]] = old_reference[y0[0]:y1[0], x0[0]:x1[0]]
+                    self.stats["reused"] += 1
+            self.boxes, self.results = boxes, results
+        else:
+            bgr_eq = self.segmenter.equalize(bgr)
+            changed = np.nonzero(self.box_changes(diff, self.boxes) > self.box_threshold)[0]
+            if len(changed):
+                changed_boxes = [self.boxes[i] for i in changed]
+                for i, res in zip(changed, self._classify(bgr_eq, changed_boxes)):
+                    self.results[i] = res
+                self._refresh_reference(gray, changed_boxes)
+            self.stats["reused"] += len(self.boxes) - len(changed)
+
+        for i, res in enumerate(self.results):
+            res["index"] = i
+        return bgr_eq, self.results
+
+    def __call__(self, rgb_frame):
+        """Annotator contract (live_inspect / SolderingApp): RGB frame in, BGR overlay out."""
+        bgr = cv2.cvtColor(np.asarray(rgb_frame), cv2.COLOR_RGB2BGR)
+        t0 = time.perf_counter()
+        bgr_eq, results = self.inspect(bgr)
+        if self.result_log is not None:
+            self.result_log.log_board(f"{self.session}-{self.stats['frames']:06d}", results,
+                                      self.engine.model_version, time.perf_counter() - t0)
+        return draw_results(bgr_eq, results)
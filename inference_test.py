@@ -2,12 +2,36 @@
 import cv2
 import numpy as np
 import os
+import time
 import tensorflow as tf
 
 from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
 
 # Import the same morphological segmentation function used to train
-from image_seg import select_joint_method_fixed
+from image_seg import IMAGE_EXTENSIONS, iter_image_paths, load_image, select_joint_method_fixed
+from inspection_engine import draw_joint_results
+from result_cache import model_version
+from stage_timing import stage
+
+# class_names must match the alphabetical order of training folders
+# E.g., if subfolders were labeled_data/bad, labeled_data/good, labeled_data/missing
+# then alphabetical is: ["bad", "good", "missing"]
+CLASS_NAMES = ["bad", "good", "missing"]
+
+# Morphological pipeline settings used for inference
+# (No cropping to PCB – we rely on dilation, etc. as per your updated code.)
+SEG_PARAMS = dict(
+    do_hist_eq=False,
+    otsu_invert=True,
+    value_low_thresh=80,
+    median_ksize=3,
+    morph_open_ksize=4,
+    morph_close_ksize=5,
+    min_box_size=15,
+    max_box_size=500,
+    morph_dilate_ksize=9,
+    morph_dilate_iterations=2
+)
 
 def load_classifier(model_path="solder_classifier.keras"):
     """
@@ -16,78 +40,342 @@ def load_classifier(model_path="solder_classifier.keras"):
     model = tf.keras.models.load_model(model_path)
     return model
 
-def run_inference_on_image(input_image, model_path="solder_classifier.keras"):
+def crop_patches(bgr_img, boxes, target_size=(224, 224)):
     """
-    1) Detect bounding boxes on 'input_image' using the morphological pipeline.
-    2) Crop each box, run the trained classifier to get "good"/"bad"/"missing" predictions.
-    3) Draw the predicted label on the overlay, save final result as e.g. 'inference_result.png'.
+    Crops every (x, y, w, h) box out of 'bgr_img' and resizes it straight into
+    one preallocated uint8 array of shape (N, H, W, 3).
     """
-    # 1. Load the trained classifier
-    model = load_classifier(model_path)
+    with stage("crop"):
+        patches = np.empty((len(boxes), target_size[1], target_size[0], 3), dtype=np.uint8)
+        for i, (x, y, w, h) in enumerate(boxes):
+            cv2.resize(bgr_img[y:y+h, x:x+w], target_size, dst=patches[i])
+    return patches
 
-    # 2. Use the morphological pipeline to get bounding boxes
-    #    (No cropping to PCB – we rely on dilation, etc. as per your updated code.)
-    bgr_eq, boxes = select_joint_method_fixed(
-        input_image,
-        do_hist_eq=False,
-        otsu_invert=True,
-        value_low_thresh=80,
-        median_ksize=3,
-        morph_open_ksize=4,
-        morph_close_ksize=5,
-        min_box_size=15,
-        max_box_size=500,
-        morph_dilate_ksize=9,
-        morph_dilate_iterations=2
-    )
-    print(f"Detected {len(boxes)} bounding boxes in {input_image}")
+def classify_patches(model, patches, batch_size=32):
+    """
+    Runs the classifier over an (N, H, W, 3) uint8 patch array.
+    preprocess_input is applied once to the whole array, then the model sees
+    fixed-size batches (the last one is zero-padded) so every forward pass has
+    the same shape. Returns an (N, num_classes) array of probabilities.
+    """
+    num = len(patches)
+    if num == 0:
+        return np.zeros((0, len(CLASS_NAMES)), dtype=np.float32)
+
+    inputs = preprocess_input(patches.astype("float32"))  # scale to match training
+
+    num_batches = -(-num // batch_size)
+    padded = np.zeros((num_batches * batch_size,) + inputs.shape[1:], dtype=np.float32)
+    padded[:num] = inputs
+
+    probs = []
+    for start in range(0, len(padded), batch_size):
+        batch = padded[start:start + batch_size]
+        probs.append(np.asarray(model(batch, training=False)))
+    return np.concatenate(probs, axis=0)[:num]
+
+def joint_results(boxes, probs, class_names=None):
+    """
+    Turns per-box probabilities into one result dict per joint:
+        {"index", "box", "label", "confidence", "probs"}
+    """
+    if class_names is None:
+        class_names = CLASS_NAMES
+
+    results = []
+    for i, box in enumerate(boxes):
+        class_idx = int(np.argmax(probs[i]))
+        results.append({
+            "index": i,
+            "box": tuple(int(v) for v in box),
+            "label": class_names[class_idx],
+            "confidence": float(probs[i][class_idx]),
+            "probs": probs[i],
+        })
+    return results
+
+def classify_boxes(model, bgr_img, boxes, batch_size=32, class_names=None):
+    """
+    Batched per-board classification: crop + resize every box into one tensor,
+    classify it in fixed-size batches, and return the joint_results dicts.
+    """
+    patches = crop_patches(bgr_img, boxes)
+    probs = classify_patches(model, patches, batch_size=batch_size)
+    return joint_results(boxes, probs, class_names)
+
+def draw_results(bgr_img, results):
+    """
+    Draws every joint result onto a copy of 'bgr_img' and returns it.
+    Red for 'missing', yellow for others.
+    """
+    return draw_joint_results(bgr_img, results)
+
+def load_tflite_interpreter(model_path, num_threads=None):
+    """
+    Prefers the lightweight tflite_runtime package (what the Pi ships), then
+    ai_edge_litert, and falls back to the interpreter bundled with TensorFlow.
+    """
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            Interpreter = tf.lite.Interpreter
+    return Interpreter(model_path=model_path, num_threads=num_threads)
+
+class TFLiteClassifier:
+    """
+    TFLite backend (float or full-int8 models from export_tflite.py).
+    Keeps one interpreter per fixed batch size so tensors are resized and
+    allocated once, and (de)quantizes input/output when the model is integer.
+    """
+
+    def __init__(self, model_path, batch_sizes=(8, 32), num_threads=None):
+        self.model_path = model_path
+        self.interpreters = {}
+        for bs in batch_sizes:
+            interpreter = load_tflite_interpreter(model_path, num_threads=num_threads)
+            input_index = interpreter.get_input_details()[0]["index"]
+            interpreter.resize_tensor_input(input_index, [bs, 224, 224, 3])
+            interpreter.allocate_tensors()
+            self.interpreters[bs] = interpreter
+
+        any_interpreter = next(iter(self.interpreters.values()))
+        self.input_details = any_interpreter.get_input_details()[0]
+        self.output_details = any_interpreter.get_output_details()[0]
+
+    def __call__(self, batch):
+        """'batch' is preprocessed float32 of one of the configured batch sizes."""
+        interpreter = self.interpreters[len(batch)]
+
+        input_dtype = self.input_details["dtype"]
+        if input_dtype != np.float32:
+            scale, zero_point = self.input_details["quantization"]
+            info = np.iinfo(input_dtype)
+            batch = np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(input_dtype)
 
-    # 3. Prepare a class_names list matching the alphabetical order of training folders
-    #    E.g., if subfolders were labeled_data/bad, labeled_data/good, labeled_data/missing
-    #    then alphabetical is: ["bad", "good", "missing"]
-    class_names = ["bad", "good", "missing"]
+        interpreter.set_tensor(self.input_details["index"], batch)
+        interpreter.invoke()
+        probs = interpreter.get_tensor(self.output_details["index"])
 
-    # 4. Create an overlay to draw the predictions
-    overlay = bgr_eq.copy()
+        if self.output_details["dtype"] != np.float32:
+            scale, zero_point = self.output_details["quantization"]
+            probs = (probs.astype(np.float32) - zero_point) * scale
+        return probs
 
-    for i, (x, y, w, h) in enumerate(boxes):
-        # Crop the patch from the bounding box
-        patch = bgr_eq[y:y+h, x:x+w]
+class ClassifierEngine:
+    """
+    Long-lived classifier: loads the model once, traces one inference function
+    per fixed batch size and warms them up, so every image after that only pays
+    for segmentation + forward passes.
+    """
+
+    def __init__(self, model_path="solder_classifier_two_phase.keras", batch_sizes=(8, 32),
+                 class_names=None, model=None, warmup=True, backend="keras", num_threads=None):
+        """
+        model_path: Keras (.keras) or TFLite (.tflite) model to load (ignored if 'model' is given).
+        batch_sizes: the fixed batch shapes the model will ever see; a board's
+                     joints are split into the largest size, and the remainder is
+                     padded up to the smallest size that fits.
+        backend: "keras" (traced tf.function) or "tflite" (TFLiteClassifier).
+        num_threads: interpreter threads for the "tflite" backend.
+        """
+        t0 = time.perf_counter()
+        self.model_path = model_path
+        self.backend = backend
+        self.batch_sizes = tuple(sorted(batch_sizes))
+        self.class_names = class_names if class_names is not None else CLASS_NAMES
+        if backend == "keras":
+            self.model = model if model is not None else load_classifier(model_path)
+            traced = tf.function(self._forward_impl, reduce_retracing=False)
+            self._forward = lambda batch: traced(batch).numpy()
+        elif backend == "tflite":
+            self.model = model if model is not None else TFLiteClassifier(
+                model_path, self.batch_sizes, num_threads=num_threads)
+            self._forward = self.model
+        else:
+            raise ValueError(f"Unknown backend '{backend}', expected 'keras' or 'tflite'")
+        self.load_time = time.perf_counter() - t0
+        self.warmup_time = 0.0
+        self.cache = None
+        self.model_version = model_version(model_path, backend)
+
+        if warmup:
+            self.warm_up()
+
+    def _forward_impl(self, batch):
+        return self.model(batch, training=False)
+
+    def warm_up(self):
+        """Traces and runs every fixed batch shape once on dummy data."""
+        t0 = time.perf_counter()
+        for bs in self.batch_sizes:
+            self._forward(np.zeros((bs, 224, 224, 3), dtype=np.float32))
+        self.warmup_time = time.perf_counter() - t0
+        return self.warmup_time
+
+    def _plan_batches(self, num):
+        """Splits 'num' joints into (start, count, padded_size) chunks using only self.batch_sizes."""
+        largest = self.batch_sizes[-1]
+        plan = []
+        start = 0
+        while num - start >= largest:
+            plan.append((start, largest, largest))
+            start += largest
+        remainder = num - start
+        if remainder > 0:
+            padded = next(bs for bs in self.batch_sizes if bs >= remainder)
+            plan.append((start, remainder, padded))
+        return plan
 
-        # Preprocess for MobileNetV2
-        patch_resized = cv2.resize(patch, (224, 224))
-        patch_array = np.expand_dims(patch_resized, axis=0).astype("float32")
-        patch_array = preprocess_input(patch_array)  # scale to match training
+    def enable_cache(self, **options):
+        """
+        Puts a result_cache.ResultCache (options: capacity, disk_dir,
+        disk_max_bytes, hash_size, hash_bits, color_grid, max_distance,
+        color_tolerance) in front of the model, namespaced by
+        this model file, backend and class names. Returns the cache; its
+        'stats' / summary() report hits and misses.
+        """
+        from result_cache import ResultCache, model_identity
 
-        # 5. Classify
-        preds = model.predict(patch_array)  # shape: (1, 3)
-        class_idx = np.argmax(preds[0])
-        class_label = class_names[class_idx]
-        confidence = preds[0][class_idx]
+        self.cache = ResultCache(model_identity(self.model_path, self.backend, *self.class_names), **options)
+        return self.cache
 
-        # Determine the color: red for 'missing', yellow for others
-        if class_label == "missing":
-            color = (0, 0, 255)  # Red in BGR
+    def classify_patches(self, patches):
+        """
+        Same contract as classify_patches(), but through the traced fixed-shape
+        function; with enable_cache() only uncached patches reach the model.
+        """
+        if self.cache is not None and len(patches):
+            from result_cache import cached_classify
+
+            return cached_classify(self.cache, patches, self._classify_patches, len(self.class_names))
+        return self._classify_patches(patches)
+
+    def _classify_patches(self, patches):
+        num = len(patches)
+        if num == 0:
+            return np.zeros((0, len(self.class_names)), dtype=np.float32)
+
+        with stage("preprocess"):
+            inputs = preprocess_input(patches.astype("float32"))
+        probs = np.empty((num, len(self.class_names)), dtype=np.float32)
+        for start, count, padded in self._plan_batches(num):
+            if count == padded:
+                batch = inputs[start:start + count]
+            else:
+                batch = np.zeros((padded,) + inputs.shape[1:], dtype=np.float32)
+                batch[:count] = inputs[start:start + count]
+            with stage(f"inference.batch{padded}"):
+                probs[start:start + count] = self._forward(batch)[:count]
+        return probs
+
+    def classify_boxes(self, bgr_img, boxes):
+        patches = crop_patches(bgr_img, boxes)
+        return joint_results(boxes, self.classify_patches(patches), self.class_names)
+
+    def process_image(self, image_path, overlay_path=None, segmenter=None):
+        """
+        Segments + classifies one image. Returns a dict with the joint results
+        and the per-stage timings (seconds). 'segmenter' replaces the default
+        pipeline with any JointSegmenter-like object (e.g. a TemplateDetector).
+        """
+        t0 = time.perf_counter()
+        if segmenter is None:
+            bgr_eq, boxes = select_joint_method_fixed(image_path, **SEG_PARAMS)
         else:
-            color = (0, 255, 255)  # Yellow in BGR
-
-        # Print or draw info
-        print(f"Box #{i}: {class_label} ({confidence*100:.1f}%)")
-        cv2.putText(
-            overlay, f"{class_label} {confidence*100:.1f}%",
-            (x, max(y-5, 0)), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
-            color, 2
-        )
-        cv2.rectangle(overlay, (x, y), (x+w, y+h), color, 2)
-
-    # 6. Save the final overlay
+            bgr_eq, boxes = segmenter.segment(load_image(image_path))
+        t1 = time.perf_counter()
+        results = self.classify_boxes(bgr_eq, boxes)
+        t2 = time.perf_counter()
+
+        if overlay_path is not None:
+            cv2.imwrite(overlay_path, draw_results(bgr_eq, results))
+
+        return {
+            "image": image_path,
+            "results": results,
+            "segment_time": t1 - t0,
+            "classify_time": t2 - t1,
+            "total_time": t2 - t0,
+        }
+
+    def process_images(self, inputs, overlay_dir=None, segmenter=None, result_log=None):
+        """
+        Runs every image (files and/or directories) through the one loaded model
+        and prints first-image vs. steady-state latency. Every board's joints
+        go to 'result_log' (a result_log.JointResultLog) if given.
+        """
+        if overlay_dir is not None and not os.path.exists(overlay_dir):
+            os.makedirs(overlay_dir)
+
+        reports = []
+        for image_path in iter_image_paths(inputs):
+            overlay_path = None
+            if overlay_dir is not None:
+                base_name = os.path.splitext(os.path.basename(image_path))[0]
+                overlay_path = os.path.join(overlay_dir, f"{base_name}_inference.png")
+            report = self.process_image(image_path, overlay_path, segmenter=segmenter)
+            if result_log is not None:
+                result_log.log_board(image_path, report["results"], self.model_version, report["total_time"])
+            print(f"{image_path}: {len(report['results'])} joints in {report['total_time']*1000:.1f} ms")
+            reports.append(report)
+
+        summarize_latency(self, reports)
+        return reports
+
+def summarize_latency(engine, reports):
+    """
+    Prints model load / warm-up cost, first-image latency and steady-state
+    per-image latency (all images after the first) separately.
+    """
+    print(f"Model load: {engine.load_time*1000:.1f} ms, warm-up: {engine.warmup_time*1000:.1f} ms")
+    if engine.cache is not None:
+        print(engine.cache.summary())
+    if not reports:
+        return
+    latencies = np.array([r["total_time"] for r in reports])
+    print(f"First image latency: {latencies[0]*1000:.1f} ms")
+    if len(latencies) > 1:
+        steady = latencies[1:]
+        print(f"Steady-state latency: mean {steady.mean()*1000:.1f} ms, "
+              f"median {np.median(steady)*1000:.1f} ms over {len(steady)} images")
+
+def run_inference_on_image(input_image, model_path="solder_classifier.keras", batch_size=32, engine=None):
+    """
+    1) Detect bounding boxes on 'input_image' using the morphological pipeline.
+    2) Crop every box into one batch, run the trained classifier to get "good"/"bad"/"missing" predictions.
+    3) Draw the predicted label on the overlay, save final result as e.g. 'inference_result.png'.
+    Pass a ClassifierEngine as 'engine' to reuse an already loaded model.
+    Returns the list of per-joint result dicts.
+    """
+    # 1. Load the trained classifier (only if no long-lived engine was given)
+    if engine is None:
+        backend = "tflite" if model_path.endswith(".tflite") else "keras"
+        engine = ClassifierEngine(model_path, batch_sizes=(batch_size,), warmup=False, backend=backend)
+
+    # 2. Use the morphological pipeline to get bounding boxes
+    bgr_eq, boxes = select_joint_method_fixed(input_image, **SEG_PARAMS)
+    print(f"Detected {len(boxes)} bounding boxes in {input_image}")
+
+    # 3. Classify all joints in a few fixed-size forward passes
+    results = engine.classify_boxes(bgr_eq, boxes)
+    for res in results:
+        print(f"Box #{res['index']}: {res['label']} ({res['confidence']*100:.1f}%)")
+
+    # 4. Save the final overlay
+    overlay = draw_results(bgr_eq, results)
     out_name = "inference_result.png"
     cv2.imwrite(out_name, overlay)
     print(f"Saved inference overlay -> {out_name}")
+    return results
 
 def main():
+    # One engine for every image: the model is loaded and warmed up once
+    engine = ClassifierEngine("solder_classifier_two_phase.keras", batch_sizes=(8, 32))
     test_image = "test2.png"
-    run_inference_on_image(test_image, "solder_classifier_two_phase.keras")
+    run_inference_on_image(test_image, engine=engine)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
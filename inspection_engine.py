@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import time
+
+import cv2
+import numpy as np
+
+from image_seg import iter_image_paths, load_image, match_boxes
+from stage_timing import add_metrics_arguments, finish_metrics, stage, start_metrics
+
+# Overlay colors (BGR) by lowercase label; anything else gets the engine's default color
+SEG_PALETTE = {"missing": (0, 0, 255)}
+YOLO_PALETTE = {"good": (0, 255, 0), "missing": (0, 0, 255), "red": (0, 165, 255)}
+
+def draw_joint_results(bgr_img, results, palette=None, default_color=(0, 255, 255), thickness=2):
+    """Draws every joint result ({"box", "label", "confidence"}) onto a copy of 'bgr_img'."""
+    palette = SEG_PALETTE if palette is None else palette
+    with stage("draw"):
+        overlay = bgr_img.copy()
+        for res in results:
+            x, y, w, h = res["box"]
+            color = palette.get(res["label"].lower(), default_color)
+            cv2.putText(
+                overlay, f"{res['label']} {res['confidence']*100:.1f}%",
+                (x, max(y-5, 0)), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                color, thickness
+            )
+            cv2.rectangle(overlay, (x, y), (x+w, y+h), color, 2)
+    return overlay
+
+class InspectionEngine:
+    """
+    Common interface of every board inspection stack, in two batched stages:
+      detect(images)       -> one detection dict per image:
+                              {"image": bgr_eq, "boxes": [(x, y, w, h)], "results": None or [...]}
+      classify(detections) -> one list of joint result dicts per image
+                              ({"index", "box", "label", "confidence", ...}, see joint_results)
+    Single-stage detectors (YOLO) already fill "results" in detect(); classify()
+    passes those through. inspect() runs both stages and records their timings
+    in 'last_timings' (seconds).
+    """
+
+    name = "engine"
+    model_version = ""
+    palette = SEG_PALETTE
+    default_color = (0, 255, 255)
+
+    def detect(self, images):
+        raise NotImplementedError
+
+    def classify(self, detections):
+        raise NotImplementedError
+
+    def inspect(self, images):
+        """Returns [(bgr_eq, results)] for a list of BGR images."""
+        t0 = time.perf_counter()
+        with stage(f"{self.name}.detect"):
+            detections = self.detect(images)
+        t1 = time.perf_counter()
+        with stage(f"{self.name}.classify"):
+            results = self.classify(detections)
+        t2 = time.perf_counter()
+        self.last_timings = {"detect_time": t1 - t0, "classify_time": t2 - t1, "total_time": t2 - t0}
+        return [(det["image"], res) for det, res in zip(detections, results)]
+
+    def draw(self, bgr_img, results):
+        return draw_joint_results(bgr_img, results, self.palette, self.default_color)
+
+    def enable_cache(self, **options):
+        raise NotImplementedError(f"{self.name} engine has no result cache")
+
+class SegmentationEngine(InspectionEngine):
+    """
+    Morphological segmentation (or any JointSegmenter-like object, e.g. a
+    board_template.TemplateDetector) + ClassifierEngine. classify() crops the
+    joints of every image in the batch into one patch array, so a tray of
+    boards costs a few full fixed-shape forward passes.
+    """
+
+    def __init__(self, classifier, segmenter=None, seg_params=None, name=None):
+        from image_seg import JointSegmenter
+        from inference_test import SEG_PARAMS
+
+        self.classifier = classifier
+        self.segmenter = segmenter if segmenter is not None else JointSegmenter(**(seg_params or SEG_PARAMS))
+        self.name = name or classifier.backend
+        self.model_version = classifier.model_version
+
+    def detect(self, images):
+        detections = []
+        for bgr in images:
+            bgr_eq, boxes = self.segmenter.segment(bgr)
+            if bgr_eq is not bgr:
+                bgr_eq = bgr_eq.copy()  # the segmenter reuses its buffer on the next image
+            detections.append({"image": bgr_eq, "boxes": [tuple(b) for b in boxes], "results": None})
+        return detections
+
+    def classify(self, detections):
+        from inference_test import crop_patches, joint_results
+
+        pending = [d for d in detections if d["results"] is None]
+        if pending:
+            patches = np.concatenate([crop_patches(d["image"], d["boxes"]) for d in pending])
+            probs = self.classifier.classify_patches(patches)
+            start = 0
+            for d in pending:
+                n = len(d["boxes"])
+                d["results"] = joint_results(d["boxes"], probs[start:start + n], self.classifier.class_names)
+                start += n
+        return [d["results"] for d in detections]
+
+    def enable_cache(self, **options):
+        return self.classifier.enable_cache(**options)
+
+class YoloEngine(InspectionEngine):
+    """
+    Ultralytics YOLO (detection and classification in one pass). A batch of
+    images goes through the model in one call and every image's boxes come
+    back as a single tensor transfer instead of per-box .item()/.cpu() calls.
+    """
+
+    name = "yolo"
+    palette = YOLO_PALETTE
+    default_color = (255, 255, 255)
+
+    def __init__(self, model_path="best.pt", confidence_threshold=0.5, model=None):
+        if model is None:
+            from ultralytics import YOLO
+            model = YOLO(model_path)
+        self.model = model
+        from result_cache import model_version
+
+        self.model_path = model_path
+        self.model_version = model_version(model_path, "yolo")
+        self.confidence_threshold = confidence_threshold
+        self.cache = None
+
+    def enable_cache(self, **options):
+        """
+        Frame-level ResultCache namespaced by this model. A frame's hash barely
+        moves when one joint changes, so the key carries a 32x32 color grid
+        with a tight tolerance: on synthetic 640x480 boards sigma=2 noise moves
+        a cell by at most 1 level, a dulled joint by 11+, a missing one by 24+.
+        """
+        from result_cache import ResultCache, model_identity
+
+        options = dict(dict(capacity=256, hash_size=64, hash_bits=8, color_grid=32,
+                            max_distance=10, color_tolerance=4), **options)
+        self.cache = ResultCache(model_identity(self.model_path, "yolo"), **options)
+        return self.cache
+
+    def raw_detections(self, images):
+        """(N, 6) float32 arrays of [xmin, ymin, xmax, ymax, conf, cls_id], one per image."""
+        keys = [None] * len(images)
+        out = [None] * len(images)
+        if self.cache is not None:
+            keys = [self.cache.key(img) for img in images]
+            out = [self.cache.get(k) for k in keys]
+        missing = [i for i, o in enumerate(out) if o is None]
+        if missing:
+            with stage("inference.yolo"):
+                results = self.model([images[i] for i in missing], verbose=False)
+            for i, r in zip(missing, results):
+                data = r.boxes.data
+                out[i] = np.asarray(data.cpu().numpy() if hasattr(data, "cpu") else data,
+                                    dtype=np.float32).reshape(-1, 6)
+                if self.cache is not None:
+                    self.cache.put(keys[i], out[i])
+        return out
+
+    def detect(self, images):
+        detections = []
+        for bgr, raw in zip(images, self.raw_detections(images)):
+            raw = raw[raw[:, 4] >= self.confidence_threshold]
+            boxes, results = [], []
+            for i, (x0, y0, x1, y1, conf, cls_id) in enumerate(raw):
+                box = (int(x0), int(y0), int(x1) - int(x0), int(y1) - int(y0))
+                boxes.append(box)
+                results.append({"index": i, "box": box,
+                                "label": self.model.names.get(int(cls_id), f"CLS_{int(cls_id)}"),
+                                "confidence": float(conf)})
+            detections.append({"image": bgr, "boxes": boxes, "results": results})
+        return detections
+
+    def classify(self, detections):
+        return [d["results"] for d in detections]
+
+    def draw(self, bgr_img, results):
+        return draw_joint_results(bgr_img, results, self.palette, self.default_color, thickness=1)
+
+ENGINE_KINDS = ("seg", "tflite", "yolo")
+DEFAULT_MODELS = {"seg": "solder_classifier_two_phase.keras", "tflite": "solder_classifier_two_phase_int8.tflite",
+                  "yolo": "best.pt"}
+
+def make_engine(kind, model_path=None, segmenter=None, confidence_threshold=0.5, **classifier_options):
+    """
+    Builds an InspectionEngine: "seg" (segmentation + Keras MobileNetV2),
+    "tflite" (segmentation + TFLite classifier) or "yolo".
+    """
+    if kind not in ENGINE_KINDS:
+        raise ValueError(f"Unknown engine '{kind}', expected one of {ENGINE_KINDS}")
+    model_path = model_path or DEFAULT_MODELS[kind]
+    if kind == "yolo":
+        return YoloEngine(model_path, confidence_threshold)
+
+    from inference_test import ClassifierEngine
+
+    backend = "tflite" if kind == "tflite" or model_path.endswith(".tflite") else "keras"
+    classifier = ClassifierEngine(model_path, backend=backend, **classifier_options)
+    return SegmentationEngine(classifier, segmenter=segmenter, name=kind)
+
+class EngineAnnotator:
+    """
+    Annotator contract (live_inspect / SolderingApp): RGB frame in, BGR overlay out.
+    With a result_log every frame's joints are logged as board
+    "<session start>-<frame number>".
+    """
+
+    def __init__(self, engine, result_log=None):
+        self.engine = engine
+        self.result_log = result_log
+        self.session = time.strftime("%Y%m%d-%H%M%S")
+        self.frames = 0
+
+    def __call__(self, rgb_frame):
+        bgr = cv2.cvtColor(np.asarray(rgb_frame), cv2.COLOR_RGB2BGR)
+        [(bgr_eq, results)] = self.engine.inspect([bgr])
+        self.frames += 1
+        if self.result_log is not None:
+            self.result_log.log_board(f"{self.session}-{self.frames:06d}", results, self.engine.model_version,
+                                      self.engine.last_timings["total_time"])
+        return self.engine.draw(bgr_eq, results)
+
+def run_images(engine, inputs, batch_size=8, overlay_dir=None, verbose=True, result_log=None):
+    """
+    Batch job: inspects every image (files, folders, globs) in batches of
+    'batch_size'. Returns one report per image:
+        {"image", "results", "time"}  (time = the batch's time / its size)
+    Each image's joints also go to 'result_log' (a JointResultLog) if given.
+    """
+    if overlay_dir is not None and not os.path.exists(overlay_dir):
+        os.makedirs(overlay_dir)
+    paths = iter_image_paths(inputs)
+    reports = []
+    for start in range(0, len(paths), batch_size):
+        chunk = paths[start:start + batch_size]
+        outputs = engine.inspect([load_image(p) for p in chunk])
+        per_image = engine.last_timings["total_time"] / len(chunk)
+        for path, (bgr_eq, results) in zip(chunk, outputs):
+            reports.append({"image": path, "results": results, "time": per_image})
+            if result_log is not None:
+                result_log.log_board(path, results, engine.model_version, per_image)
+            if verbose:
+                print(f"[{engine.name}] {path}: {len(results)} joints")
+            if overlay_dir is not None:
+                base_name = os.path.splitext(os.path.basename(path))[0]
+                cv2.imwrite(os.path.join(overlay_dir, f"{base_name}_{engine.name}.png"),
+                            engine.draw(bgr_eq, results))
+    return reports
+
+def agreement(reference, other, iou_match=0.5):
+    """
+    Joint-level agreement of 'other' with 'reference' (two result lists for
+    the same image): boxes are matched greedily by IoU >= iou_match.
+    Returns (matched, label_agreements, n_reference, n_other).
+    """
+    pairs = match_boxes([r["box"] for r in reference], [o["box"] for o in other], iou_match)
+    agree = sum(reference[i]["label"].lower() == other[j]["label"].lower() for i, j, _ in pairs)
+    return len(pairs), agree, len(reference), len(other)
+
+def compare_engines(engines, inputs, batch_size=8, iou_match=0.5):
+    """
+    Runs the same images through every engine and prints per-engine latency
+    plus box recall/precision and label agreement against the first engine.
+    Returns one list of reports per engine.
+    """
+    all_reports = [run_images(e, inputs, batch_size=batch_size, verbose=False) for e in engines]
+    print(f"{'engine':<10} {'ms/image':>9} {'joints':>7} {'recall':>7} {'precision':>9} {'labels':>7}")
+    for engine, reports in zip(engines, all_reports):
+        times = np.array([r["time"] for r in reports]) * 1000
+        joints = sum(len(r["results"]) for r in reports)
+        matched = agree = n_ref = n_other = 0
+        for ref, rep in zip(all_reports[0], reports):
+            m, a, nr, no = agreement(ref["results"], rep["results"], iou_match)
+            matched, agree, n_ref, n_other = matched + m, agree + a, n_ref + nr, n_other + no
+        recall = matched / n_ref if n_ref else 1.0
+        precision = matched / n_other if n_other else 1.0
+        labels = agree / matched if matched else 0.0
+        ms = times.mean() if len(times) else 0.0
+        print(f"{engine.name:<10} {ms:>9.1f} {joints:>7} {recall:>7.1%} {precision:>9.1%} {labels:>7.1%}")
+    return all_reports
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect images with one engine, or compare several.")
+    parser.add_argument("inputs", nargs="+", help="image files, folders or glob patterns")
+    parser.add_argument("--engine", choices=ENGINE_KINDS, action="append",
+                        help="repeat to compare engines (the first is the reference); default seg")
+    parser.add_argument("--model", action="append", default=[],
+                        help="model per --engine, in the same order (default per engine kind)")
+    parser.add_argument("--template", default=None, help="golden-board template for the seg/tflite engines")
+    parser.add_argument("--pyramid", type=int, default=None, metavar="FACTOR",
+                        help="seg/tflite: coarse-to-fine segmentation at 1/FACTOR resolution (large captures)")
+    parser.add_argument("--batch-size", type=int, default=8, help="images per inspect() call")
+    parser.add_argument("--overlay-dir", default=None)
+    parser.add_argument("--log-dir", default=None, help="write one row per joint to a result log here")
+    parser.add_argument("--log-format", choices=["csv", "parquet"], default="csv")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    start_metrics(args)
+
+    segmenter = None
+    if args.template is not None:
+        from board_template import BoardTemplate, TemplateDetector
+
+        segmenter = TemplateDetector(BoardTemplate.load(args.template))
+    elif args.pyramid is not None:
+        from inference_test import SEG_PARAMS
+        from pyramid_seg import PyramidSegmenter
+
+        segmenter = PyramidSegmenter(args.pyramid, **SEG_PARAMS)
+    kinds = args.engine or ["seg"]
+    models = args.model + [None] * (len(kinds) - len(args.model))
+    engines = [make_engine(kind, model, segmenter=segmenter if kind != "yolo" else None)
+               for kind, model in zip(kinds, models)]
+
+    if len(engines) > 1:
+        compare_engines(engines, args.inputs, batch_size=args.batch_size)
+        finish_metrics(args)
+        return
+    result_log = None
+    if args.log_dir is not None:
+        from result_log import JointResultLog
+
+        result_log = JointResultLog(args.log_dir, format=args.log_format)
+    reports = run_images(engines[0], args.inputs, batch_size=args.batch_size, overlay_dir=args.overlay_dir,
+                         result_log=result_log)
+    if result_log is not None:
+        result_log.close()
+        print(f"Logged {result_log.rows_written} joints to {', '.join(result_log.paths)}")
+    if reports:
+        times = np.array([r["time"] for r in reports]) * 1000
+        print(f"{len(reports)} images, mean {times.mean():.1f} ms/image")
+    finish_metrics(args)
+
+if __name__ == "__main__":
+    main()
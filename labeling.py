@@ -1,6 +1,11 @@
 #!/usr/bin/env python3
+import argparse
 import cv2
+import numpy as np
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+from image_seg import IMAGE_EXTENSIONS
 
 # Now we have 3 categories:
 LABELS = {
@@ -58,9 +63,273 @@ def label_patches(unlabeled_dir, labeled_dir="labeled_data"):
 
     cv2.destroyAllWindows()
 
+def list_unlabeled(unlabeled_dir):
+    return sorted(os.path.join(unlabeled_dir, f) for f in os.listdir(unlabeled_dir)
+                  if f.lower().endswith(IMAGE_EXTENSIONS))
+
+def read_patches(paths, size=(224, 224), workers=4):
+    """Decodes 'paths' in parallel into one (N, H, W, 3) uint8 BGR array (unreadable files stay black)."""
+    patches = np.zeros((len(paths), size[1], size[0], 3), dtype=np.uint8)
+
+    def load(i):
+        img = cv2.imread(paths[i])
+        if img is not None:
+            cv2.resize(img, size, dst=patches[i])
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(load, range(len(paths))))
+    return patches
+
+def predict_unlabeled(paths, model_path="solder_classifier_two_phase.keras", chunk=512, engine=None):
+    """
+    Runs the current classifier over every patch in one batched pass
+    (ClassifierEngine, decoded 'chunk' files at a time).
+    Returns (probs (N, num_classes), class_names).
+    """
+    from inference_test import ClassifierEngine
+
+    if engine is None:
+        engine = ClassifierEngine(model_path)
+    probs = np.zeros((len(paths), len(engine.class_names)), dtype=np.float32)
+    for start in range(0, len(paths), chunk):
+        probs[start:start + chunk] = engine.classify_patches(read_patches(paths[start:start + chunk]))
+        print(f"Pre-classified {min(start + chunk, len(paths))}/{len(paths)} patches")
+    return probs, engine.class_names
+
+def presort_order(probs):
+    """
+    Order that groups patches by predicted class and puts the least certain
+    ones (smallest top-1 / top-2 margin) first within each class.
+    """
+    if probs.shape[1] < 2:
+        return np.arange(len(probs))
+    top2 = np.sort(probs, axis=1)[:, -2:]
+    margin = top2[:, 1] - top2[:, 0]
+    return np.lexsort((margin, probs.argmax(axis=1)))
+
+class PagePrefetcher:
+    """
+    Decodes pages of tiles on a background thread. get(page) returns the
+    page's tiles (decoding it now if it was not prefetched) and schedules the
+    next 'ahead' pages.
+    """
+
+    def __init__(self, paths, page_size, tile_size=160, ahead=2):
+        self.paths = paths
+        self.page_size = page_size
+        self.tile_size = tile_size
+        self.ahead = ahead
+        self.num_pages = max(1, -(-len(paths) // page_size))
+        self._pool = ThreadPoolExecutor(max_workers=1)
+        self._pages = {}
+
+    def _load(self, page):
+        start = page * self.page_size
+        return read_patches(self.paths[start:start + self.page_size],
+                            (self.tile_size, self.tile_size), workers=2)
+
+    def _schedule(self, page):
+        if 0 <= page < self.num_pages and page not in self._pages:
+            self._pages[page] = self._pool.submit(self._load, page)
+
+    def get(self, page):
+        self._schedule(page)
+        for p in range(page + 1, page + 1 + self.ahead):
+            self._schedule(p)
+        # Keep only a small window of decoded pages around the current one
+        for p in [p for p in self._pages if p < page - 1 or p > page + self.ahead]:
+            self._pages.pop(p).cancel()
+        return self._pages[page].result()
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+class LabelSession:
+    """
+    Label state for a list of unlabeled patches, separate from the files.
+    assign() only records labels (and an undo step); flush() then moves every
+    file whose label changed in one batch, including moving undone labels
+    back to the unlabeled folder.
+    """
+
+    def __init__(self, paths, labeled_dir, label_names):
+        self.paths = paths
+        self.labeled_dir = labeled_dir
+        self.labels = [None] * len(paths)    # desired label per patch
+        self.on_disk = [None] * len(paths)   # label folder the file is currently in
+        self.history = []
+        for label_name in label_names:
+            os.makedirs(os.path.join(labeled_dir, label_name), exist_ok=True)
+
+    def assign(self, indices, label):
+        self.assign_each({i: label for i in indices})
+
+    def assign_each(self, labels):
+        """Sets one label per index ({index: label}) as a single undo step."""
+        step = [(i, self.labels[i]) for i, label in labels.items() if self.labels[i] != label]
+        if not step:
+            return
+        for i, _ in step:
+            self.labels[i] = labels[i]
+        self.history.append(step)
+
+    def undo(self):
+        """Reverts the last assign(); returns the affected indices."""
+        if not self.history:
+            return []
+        step = self.history.pop()
+        for i, previous in step:
+            self.labels[i] = previous
+        return [i for i, _ in step]
+
+    def location(self, i, label):
+        if label is None:
+            return self.paths[i]
+        return os.path.join(self.labeled_dir, label, os.path.basename(self.paths[i]))
+
+    def flush(self):
+        """Moves every file whose label changed since the last flush; returns the number moved."""
+        moved = 0
+        for i, (want, have) in enumerate(zip(self.labels, self.on_disk)):
+            if want != have:
+                os.replace(self.location(i, have), self.location(i, want))
+                self.on_disk[i] = want
+                moved += 1
+        return moved
+
+    def counts(self):
+        counts = {}
+        for label in self.labels:
+            if label is not None:
+                counts[label] = counts.get(label, 0) + 1
+        return counts
+
+LABEL_COLORS = {"good": (0, 200, 0), "bad": (0, 0, 255), "missing": (0, 200, 255)}
+
+def render_page(tiles, indices, session, selected, predictions=None, cols=6, tile_size=160):
+    """Draws one page of tiles with their assigned label (border) and prediction (caption)."""
+    rows = -(-len(indices) // cols)
+    canvas = np.zeros((max(rows, 1) * tile_size, cols * tile_size, 3), dtype=np.uint8)
+    for slot, i in enumerate(indices):
+        y, x = (slot // cols) * tile_size, (slot % cols) * tile_size
+        canvas[y:y + tile_size, x:x + tile_size] = tiles[slot]
+        label = session.labels[i]
+        if label is not None:
+            cv2.rectangle(canvas, (x + 2, y + 2), (x + tile_size - 3, y + tile_size - 3),
+                          LABEL_COLORS.get(label, (255, 255, 255)), 4)
+        if slot == selected:
+            cv2.rectangle(canvas, (x, y), (x + tile_size - 1, y + tile_size - 1), (255, 255, 255), 2)
+        caption = f"{slot + 1}"
+        if predictions is not None:
+            caption += f" {predictions[i]}"
+        cv2.putText(canvas, caption, (x + 6, y + tile_size - 8),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1, cv2.LINE_AA)
+    return canvas
+
+def label_patches_grid(unlabeled_dir, labeled_dir="labeled_data", model_path=None,
+                       rows=4, cols=6, tile_size=160):
+    """
+    Grid labeling mode: rows x cols patches per screen, upcoming pages decoded
+    in the background. With 'model_path', the whole folder is pre-classified
+    in one batched pass and shown grouped by predicted class, least certain first.
+    Keys:
+       click       select a tile (the next unlabeled tile is selected automatically)
+       g / b / m   label the selected tile
+       G / B / M   label every still-unlabeled tile on the page
+       a           accept the predicted label for every unlabeled tile on the page
+       u           undo the last labeling step
+       n / space   next page,  p previous page,  q / Esc quit
+    Files are moved in one batch on every page change and on quit.
+    """
+    paths = list_unlabeled(unlabeled_dir)
+    if not paths:
+        print(f"No patches in {unlabeled_dir}")
+        return {}
+
+    predictions = None
+    if model_path and os.path.exists(model_path):
+        probs, class_names = predict_unlabeled(paths, model_path)
+        order = presort_order(probs)
+        paths = [paths[i] for i in order]
+        predictions = [class_names[k] for k in probs[order].argmax(axis=1)]
+
+    page_size = rows * cols
+    session = LabelSession(paths, labeled_dir, LABELS.values())
+    prefetcher = PagePrefetcher(paths, page_size, tile_size)
+    keys = {**LABELS, **{k.upper(): v for k, v in LABELS.items()}}
+    state = {"page": 0, "selected": 0, "tiles": None, "indices": []}
+
+    def redraw():
+        cv2.imshow(window, render_page(state["tiles"], state["indices"], session, state["selected"],
+                                       predictions, cols, tile_size))
+
+    def on_mouse(event, x, y, flags, param):
+        # waitKey(0) blocks the main loop, so a click redraws the page itself
+        if event == cv2.EVENT_LBUTTONDOWN and state["tiles"] is not None:
+            state["selected"] = (y // tile_size) * cols + x // tile_size
+            redraw()
+
+    window = "Label Patches"
+    cv2.namedWindow(window)
+    cv2.setMouseCallback(window, on_mouse)
+    print(label_patches_grid.__doc__)
+
+    try:
+        while True:
+            page = state["page"]
+            indices = list(range(page * page_size, min((page + 1) * page_size, len(paths))))
+            state["tiles"], state["indices"] = prefetcher.get(page), indices
+            redraw()
+            cv2.setWindowTitle(window, f"Page {page + 1}/{prefetcher.num_pages}  {session.counts()}")
+            key = cv2.waitKey(0) & 0xFF
+            key_char = chr(key)
+
+            if key_char in ("q", "\x1b"):
+                break
+            elif key_char in ("n", " ", "p"):
+                session.flush()
+                step = -1 if key_char == "p" else 1
+                state["page"] = min(max(page + step, 0), prefetcher.num_pages - 1)
+                state["selected"] = 0
+            elif key_char == "u":
+                undone = session.undo()
+                if undone:
+                    state["page"] = undone[0] // page_size
+                    state["selected"] = undone[0] % page_size
+            elif key_char == "a" and predictions is not None:
+                session.assign_each({i: predictions[i] for i in indices if session.labels[i] is None})
+            elif key_char in keys and key_char.isupper():
+                session.assign([i for i in indices if session.labels[i] is None], keys[key_char])
+            elif key_char in keys and state["selected"] < len(indices):
+                session.assign([indices[state["selected"]]], keys[key_char])
+                unlabeled = [s for s, i in enumerate(indices) if session.labels[i] is None]
+                state["selected"] = next((s for s in unlabeled if s > state["selected"]),
+                                         unlabeled[0] if unlabeled else state["selected"])
+    finally:
+        moved = session.flush()
+        prefetcher.close()
+        cv2.destroyAllWindows()
+
+    print(f"Moved {moved} patches in the last batch; labeled so far: {session.counts()}")
+    return session.counts()
+
 def main():
+    parser = argparse.ArgumentParser(description="Label unlabeled patches into labeled_data/<class>/.")
+    parser.add_argument("unlabeled_dir", nargs="?", default="unlabeled_patches")
+    parser.add_argument("--labeled-dir", default="labeled_data")
+    parser.add_argument("--model", default="solder_classifier_two_phase.keras",
+                        help="classifier used to pre-sort patches (skipped if the file is missing)")
+    parser.add_argument("--grid", default="4x6", help="rows x cols of patches per screen")
+    parser.add_argument("--single", action="store_true", help="original one-patch-at-a-time mode")
+    args = parser.parse_args()
+
     # We labeled the patches in 'unlabeled_patches'
-    label_patches("unlabeled_patches", labeled_dir="labeled_data")
+    if args.single:
+        label_patches(args.unlabeled_dir, labeled_dir=args.labeled_dir)
+    else:
+        rows, cols = (int(v) for v in args.grid.lower().split("x"))
+        label_patches_grid(args.unlabeled_dir, labeled_dir=args.labeled_dir,
+                           model_path=args.model, rows=rows, cols=cols)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import queue
+import time
+
+import cv2
+import numpy as np
+
+from frame_pipeline import CaptureThread, FrameRing, InferenceWorker
+from frame_sources import open_source
+from inspection_engine import EngineAnnotator, SegmentationEngine, YoloEngine
+from stage_timing import add_metrics_arguments, finish_metrics, start_metrics
+
+class YoloAnnotator(EngineAnnotator):
+    """
+    YOLO detection + overlay used by the GUI: __call__(rgb_frame) returns a
+    BGR copy of the frame with colored, labeled boxes (inspection_engine.YoloEngine).
+    """
+
+    def __init__(self, model_path="best.pt", confidence_threshold=0.5, model=None, result_log=None):
+        super().__init__(YoloEngine(model_path, confidence_threshold, model=model), result_log=result_log)
+        self.model = self.engine.model
+
+    def enable_cache(self, **options):
+        """Reuses detections of identical-looking frames (see YoloEngine.enable_cache)."""
+        return self.engine.enable_cache(**options)
+
+class SegmentationAnnotator(EngineAnnotator):
+    """
+    Morphological segmentation + batched classifier (inspection_engine.SegmentationEngine)
+    with the same contract as YoloAnnotator. 'engine' is the ClassifierEngine.
+    """
+
+    def __init__(self, model_path="solder_classifier_two_phase.keras", engine=None, seg_params=None,
+                 segmenter=None, result_log=None):
+        """segmenter: anything with JointSegmenter's segment() (e.g. board_template.TemplateDetector)."""
+        from inference_test import ClassifierEngine
+
+        if engine is None:
+            backend = "tflite" if model_path.endswith(".tflite") else "keras"
+            engine = ClassifierEngine(model_path, backend=backend)
+        super().__init__(SegmentationEngine(engine, segmenter=segmenter, seg_params=seg_params),
+                         result_log=result_log)
+        self.classifier = engine
+        self.segmenter = self.engine.segmenter
+
+def latency_report(latencies, infer_times, frames_captured, frames_processed, wall_time):
+    """Summary dict: capture-to-result latency percentiles (ms), inference time and sustained FPS."""
+    lat = np.asarray(latencies) * 1000
+    inf = np.asarray(infer_times) * 1000
+    report = {
+        "frames_captured": frames_captured,
+        "frames_processed": frames_processed,
+        "frames_skipped": frames_captured - frames_processed,
+        "wall_time_s": wall_time,
+        "fps": frames_processed / wall_time if wall_time > 0 else 0.0,
+    }
+    if len(lat):
+        report.update({
+            "latency_p50_ms": float(np.percentile(lat, 50)),
+            "latency_p95_ms": float(np.percentile(lat, 95)),
+            "latency_p99_ms": float(np.percentile(lat, 99)),
+            "inference_mean_ms": float(inf.mean()),
+        })
+    return report
+
+def print_latency_report(report):
+    print(f"Frames: {report['frames_captured']} captured, {report['frames_processed']} processed, "
+          f"{report['frames_skipped']} skipped in {report['wall_time_s']:.1f} s "
+          f"-> {report['fps']:.1f} FPS sustained")
+    if "latency_p50_ms" in report:
+        print(f"Capture-to-result latency: p50 {report['latency_p50_ms']:.1f} ms, "
+              f"p95 {report['latency_p95_ms']:.1f} ms, p99 {report['latency_p99_ms']:.1f} ms "
+              f"(inference mean {report['inference_mean_ms']:.1f} ms)")
+
+def run_headless(source, annotate, max_frames=None, duration=None, every_frame=False,
+                 ring_size=3, warmup_frames=1, overlay_dir=None):
+    """
+    Drives a FrameSource through 'annotate' without a GUI and measures it.
+    every_frame=False runs the GUI's pipeline: CaptureThread -> drop-oldest
+    FrameRing -> InferenceWorker (auto mode) -> results queue, so frames that
+    arrive while the model is busy are skipped, as on the live feed.
+    every_frame=True reads and annotates every frame in one loop (no skipping),
+    which measures raw throughput.
+    The first 'warmup_frames' results are left out of the statistics.
+    Stops when the source is exhausted, after max_frames results or after
+    'duration' seconds. Returns latency_report().
+    """
+    if overlay_dir is not None and not os.path.exists(overlay_dir):
+        os.makedirs(overlay_dir)
+
+    latencies, infer_times = [], []
+    processed = 0
+    t_start = time.perf_counter()
+
+    def record(seq, overlay, captured_at, seconds):
+        nonlocal processed
+        processed += 1
+        if processed > warmup_frames:
+            latencies.append(time.perf_counter() - captured_at)
+            infer_times.append(seconds)
+        if overlay_dir is not None:
+            cv2.imwrite(os.path.join(overlay_dir, f"frame_{seq:06d}.png"), overlay)
+
+    def done():
+        return ((max_frames is not None and processed >= max_frames)
+                or (duration is not None and time.perf_counter() - t_start >= duration))
+
+    if every_frame:
+        captured = 0
+        while not done():
+            try:
+                frame = source.read()
+            except StopIteration:
+                break
+            captured_at = time.perf_counter()
+            if frame is None:
+                continue
+            captured += 1
+            t0 = time.perf_counter()
+            overlay = annotate(frame)
+            record(captured, overlay, captured_at, time.perf_counter() - t0)
+    else:
+        ring = FrameRing(ring_size)
+        capture = CaptureThread(source.read, ring)
+        worker = InferenceWorker(annotate, ring, auto=True)
+        capture.start()
+        worker.start()
+        last_seq = 0
+        try:
+            while not done():
+                try:
+                    seq, frame, overlay, seconds, captured_at = worker.results.get(timeout=0.1)
+                except queue.Empty:
+                    newest = ring.latest(timeout=0)
+                    # Source exhausted and its last frame already handled
+                    if not capture.is_alive() and (newest is None or newest[0] <= last_seq):
+                        break
+                    continue
+                if isinstance(overlay, Exception):
+                    raise overlay
+                last_seq = seq
+                record(seq, overlay, captured_at, seconds)
+        finally:
+            capture.stop()
+            worker.stop()
+        captured = capture.frames
+        if capture.error is not None:
+            raise capture.error
+
+    return latency_report(latencies, infer_times, captured, processed, time.perf_counter() - t_start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless capture -> detection -> overlay latency harness.")
+    parser.add_argument("source", help="picamera2, camera[:N], a video file, or image files/folder/glob")
+    parser.add_argument("--detector", choices=["yolo", "seg"], default="yolo",
+                        help="YOLO (GUI default) or segmentation + classifier")
+    parser.add_argument("--model", default=None, help="best.pt for yolo, a .keras/.tflite classifier for seg")
+    parser.add_argument("--incremental", action="store_true",
+                        help="seg only: re-classify just the joints whose pixels changed")
+    parser.add_argument("--template", default=None,
+                        help="seg only: golden-board template (.npz) used instead of segmenting every frame")
+    parser.add_argument("--fast", action="store_true", help="don't pace video/images at their frame rate")
+    parser.add_argument("--fps", type=float, default=None, help="override the replay frame rate")
+    parser.add_argument("--loop", action="store_true")
+    parser.add_argument("--every-frame", action="store_true", help="process every frame, no skipping")
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--duration", type=float, default=None, help="seconds")
+    parser.add_argument("--overlay-dir", default=None)
+    parser.add_argument("--cache", action="store_true", help="reuse results of identical-looking frames/patches")
+    parser.add_argument("--cache-dir", default=None, help="also keep cached results on disk here")
+    parser.add_argument("--log-dir", default=None, help="write one row per joint to a result log here")
+    parser.add_argument("--log-format", choices=["csv", "parquet"], default="csv")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    start_metrics(args)
+
+    result_log = None
+    if args.log_dir is not None:
+        from result_log import JointResultLog
+
+        result_log = JointResultLog(args.log_dir, format=args.log_format)
+
+    if args.detector == "yolo":
+        annotate = YoloAnnotator(args.model or "best.pt", result_log=result_log)
+    else:
+        segmenter = None
+        if args.template is not None:
+            from board_template import BoardTemplate, TemplateDetector
+
+            segmenter = TemplateDetector(BoardTemplate.load(args.template))
+        annotate = SegmentationAnnotator(args.model or "solder_classifier_two_phase.keras", segmenter=segmenter,
+                                         result_log=result_log)
+        if args.incremental:
+            from incremental_inspect import IncrementalInspector
+
+            annotate = IncrementalInspector(annotate.classifier, segmenter=annotate.segmenter,
+                                            result_log=result_log)
+
+    cache = None
+    if args.cache or args.cache_dir:
+        cache = annotate.engine.enable_cache(disk_dir=args.cache_dir)
+
+    with open_source(args.source, pace=not args.fast, fps=args.fps, loop=args.loop) as source:
+        report = run_headless(source, annotate, max_frames=args.max_frames, duration=args.duration,
+                              every_frame=args.every_frame, overlay_dir=args.overlay_dir)
+    print_latency_report(report)
+    if cache is not None:
+        print(cache.summary())
+    if result_log is not None:
+        result_log.close()
+        print(f"Logged {result_log.rows_written} joints ({result_log.dropped} boards dropped)")
+    finish_metrics(args)
+
+if __name__ == "__main__":
+    main()
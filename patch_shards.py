@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from image_seg import IMAGE_EXTENSIONS
+
+INDEX_FILE = "index.json"
+
+def is_shard_dir(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, INDEX_FILE))
+
+def _read_patch(path, size):
+    img = cv2.imread(path)
+    if img is None:
+        return None
+    if img.shape[:2] != (size, size):
+        img = cv2.resize(img, (size, size), interpolation=cv2.INTER_AREA)
+    return img
+
+def pack_folder(data_dir="labeled_data", out_dir="labeled_shards", size=224, shard_size=8192, workers=None):
+    """
+    Packs labeled_data/<class>/*.png into fixed-size uint8 shards:
+        <out_dir>/shard_00000.npy ...  (n, size, size, 3) BGR patches, np.memmap-able
+        <out_dir>/labels.npy           (N,) int class index per patch
+        <out_dir>/index.json           class names, shard sizes and the '<class>/<file>'
+                                       source name of every patch (written last)
+    Classes are the subfolders in alphabetical order, like training.
+    Patches are resized to size x size (INTER_AREA) on the way in.
+    """
+    class_names = sorted(d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d)))
+    items = []
+    for class_idx, cls in enumerate(class_names):
+        class_folder = os.path.join(data_dir, cls)
+        for f in sorted(os.listdir(class_folder)):
+            if f.lower().endswith(IMAGE_EXTENSIONS):
+                items.append((f"{cls}/{f}", class_idx, os.path.join(class_folder, f)))
+
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    shards, sources, labels = [], [], []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(items), shard_size):
+            chunk = items[start:start + shard_size]
+            patches = list(pool.map(lambda item: _read_patch(item[2], size), chunk))
+            keep = [(item, p) for item, p in zip(chunk, patches) if p is not None]
+            for item, p in zip(chunk, patches):
+                if p is None:
+                    print(f"Could not read {item[2]}")
+
+            shard_file = f"shard_{len(shards):05d}.npy"
+            shard = np.lib.format.open_memmap(os.path.join(out_dir, shard_file), mode="w+",
+                                              dtype=np.uint8, shape=(len(keep), size, size, 3))
+            for i, (item, p) in enumerate(keep):
+                shard[i] = p
+                sources.append(item[0])
+                labels.append(item[1])
+            shard.flush()
+            del shard
+            shards.append({"file": shard_file, "count": len(keep)})
+
+    np.save(os.path.join(out_dir, "labels.npy"), np.array(labels, dtype=np.int64))
+    with open(os.path.join(out_dir, INDEX_FILE), "w") as f:
+        json.dump({
+            "version": 1,
+            "size": size,
+            "channel_order": "BGR",
+            "class_names": class_names,
+            "shards": shards,
+            "sources": sources,
+        }, f)
+    print(f"Packed {len(sources)} patches in {len(shards)} shard(s) -> {out_dir}")
+    return out_dir
+
+def unpack_to_folder(shard_dir="labeled_shards", out_dir="labeled_data"):
+    """
+    Writes every packed patch back to <out_dir>/<class>/<file> (at the packed size).
+    """
+    shards = PatchShards(shard_dir)
+    for cls in shards.class_names:
+        os.makedirs(os.path.join(out_dir, cls), exist_ok=True)
+    for i, source in enumerate(shards.sources):
+        cv2.imwrite(os.path.join(out_dir, *source.split("/")), shards[i][0])
+    print(f"Unpacked {len(shards)} patches -> {out_dir}")
+
+class PatchShards:
+    """
+    Zero-copy reader for a pack_folder() directory. Shards are opened with
+    np.load(mmap_mode="r"): shards[i] returns a (patch view, label) pair and
+    batches() yields views straight out of the memory map.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            self.index = json.load(f)
+        self.size = self.index["size"]
+        self.class_names = self.index["class_names"]
+        self.sources = self.index["sources"]
+        self.shards = [np.load(os.path.join(path, s["file"]), mmap_mode="r") for s in self.index["shards"]]
+        self.labels = np.load(os.path.join(path, "labels.npy"), mmap_mode="r")
+        self.offsets = np.cumsum([0] + [len(s) for s in self.shards])
+        self._index_of = None
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def __getitem__(self, i):
+        shard_id = int(np.searchsorted(self.offsets, i, side="right")) - 1
+        return self.shards[shard_id][i - self.offsets[shard_id]], int(self.labels[i])
+
+    @property
+    def index_of(self):
+        """Source name ('<class>/<file>') -> global patch index."""
+        if self._index_of is None:
+            self._index_of = {s: i for i, s in enumerate(self.sources)}
+        return self._index_of
+
+    def fingerprint(self, sources=None):
+        """Stable hash of the packed content (optionally of a subset of sources)."""
+        h = hashlib.sha1(os.path.abspath(self.path).encode())
+        for s in self.index["shards"]:
+            st = os.stat(os.path.join(self.path, s["file"]))
+            h.update(f"{s['file']}|{st.st_size}|{st.st_mtime_ns}\n".encode())
+        for s in (self.sources if sources is None else sources):
+            h.update(s.encode())
+        return h.hexdigest()
+
+    def batches(self, batch_size=256):
+        """Yields (patches, labels) views in storage order; never crosses a shard boundary."""
+        for shard_id, shard in enumerate(self.shards):
+            base = self.offsets[shard_id]
+            for start in range(0, len(shard), batch_size):
+                end = min(start + batch_size, len(shard))
+                yield shard[start:end], self.labels[base + start:base + end]
+
+    def gather(self, indices):
+        """Copies the patches at arbitrary global 'indices' into one (n, size, size, 3) array."""
+        indices = np.asarray(indices, dtype=np.int64)
+        out = np.empty((len(indices), self.size, self.size, 3), dtype=np.uint8)
+        shard_ids = np.searchsorted(self.offsets, indices, side="right") - 1
+        for shard_id in np.unique(shard_ids):
+            sel = np.nonzero(shard_ids == shard_id)[0]
+            local = indices[sel] - self.offsets[shard_id]
+            order = np.argsort(local)  # sequential reads from the memory map
+            out[sel[order]] = self.shards[shard_id][local[order]]
+        return out, np.asarray(self.labels[indices])
+
+    def tf_dataset(self, indices=None, img_size=None, rgb=False, chunk=256):
+        """
+        tf.data of single (uint8 patch, int label) elements, read from the memory
+        maps in chunks. rgb=True flips BGR -> RGB (what tf.io.decode_image gives);
+        img_size resizes (nearest) if it differs from the packed size.
+        """
+        import tensorflow as tf
+
+        if indices is None:
+            indices = np.arange(len(self))
+        size = self.size
+
+        def load(idx):
+            patches, labels = self.gather(idx)
+            if rgb:
+                patches = np.ascontiguousarray(patches[..., ::-1])
+            return patches, labels.astype(np.int64)
+
+        def to_tensors(idx):
+            patches, labels = tf.numpy_function(load, [idx], [tf.uint8, tf.int64])
+            patches.set_shape((None, size, size, 3))
+            labels.set_shape((None,))
+            if img_size is not None and tuple(img_size) != (size, size):
+                patches = tf.cast(tf.image.resize(patches, img_size, method="nearest"), tf.uint8)
+            return patches, labels
+
+        ds = tf.data.Dataset.from_tensor_slices(np.asarray(indices, dtype=np.int64)).batch(chunk)
+        return ds.map(to_tensors, num_parallel_calls=tf.data.AUTOTUNE).unbatch()
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert between labeled_data folders and packed patch shards.")
+    parser.add_argument("command", choices=["pack", "unpack"])
+    parser.add_argument("src", help="labeled_data folder (pack) or shard directory (unpack)")
+    parser.add_argument("dst", help="shard directory (pack) or labeled_data folder (unpack)")
+    parser.add_argument("--size", type=int, default=224)
+    parser.add_argument("--shard-size", type=int, default=8192)
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        pack_folder(args.src, args.dst, size=args.size, shard_size=args.shard_size)
+    else:
+        unpack_to_folder(args.src, args.dst)
+
+if __name__ == "__main__":
+    main()
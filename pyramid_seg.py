@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from image_seg import DEFAULT_SEG_PARAMS, JointSegmenter, boxes_from_mask, iter_image_paths, load_image, match_boxes
+from stage_timing import stage
+
+def coarse_params(params, factor):
+    """Segmentation parameters with every kernel size scaled down by 'factor' (odd median size)."""
+    p = dict(DEFAULT_SEG_PARAMS, **params)
+
+    def scaled(ksize):
+        k = int(round(ksize / factor))
+        return k if k >= 2 else 0
+
+    median = (p["median_ksize"] // factor) | 1
+    return dict(p, morph_close_ksize=scaled(p["morph_close_ksize"]),
+                morph_open_ksize=scaled(p["morph_open_ksize"]),
+                morph_dilate_ksize=scaled(p["morph_dilate_ksize"]), median_ksize=median)
+
+def morph_reach(params):
+    """
+    How far (in px) a pixel of the final mask can be influenced by the input
+    through close -> open -> median -> dilate (the tight bound; tiled_seg's
+    morph_margin() is a looser one).
+    """
+    p = dict(DEFAULT_SEG_PARAMS, **params)
+    reach = p["median_ksize"] // 2
+    for name in ("morph_close_ksize", "morph_open_ksize"):
+        if p[name] > 0:
+            reach += 2 * (p[name] // 2)
+    if p["morph_dilate_ksize"] > 0:
+        reach += (p["morph_dilate_ksize"] // 2) * p["morph_dilate_iterations"]
+    return reach + 1
+
+def merge_rois(rois):
+    """
+    Greedily merges pairs of (x, y, w, h) regions whose bounding union is no
+    larger than the two areas added up (overlap counted twice), i.e. merging
+    costs no extra pixels but saves one pass of per-region call overhead.
+    """
+    boxes = np.array(sorted(rois), dtype=np.int64).reshape(-1, 4)
+    boxes[:, 2:] += boxes[:, :2]  # -> x0, y0, x1, y1
+    changed = True
+    while changed and len(boxes) > 1:
+        changed = False
+        out = np.empty_like(boxes)
+        n = 0
+        for b in boxes:
+            if n:
+                m = out[:n]
+                u0 = np.minimum(m[:, :2], b[:2])
+                u1 = np.maximum(m[:, 2:], b[2:])
+                union = np.prod(u1 - u0, axis=1)
+                fits = np.flatnonzero(union <= np.prod(m[:, 2:] - m[:, :2], axis=1) + np.prod(b[2:] - b[:2]))
+                if len(fits):
+                    k = fits[0]
+                    out[k, :2], out[k, 2:] = u0[k], u1[k]
+                    changed = True
+                    continue
+            out[n] = b
+            n += 1
+        boxes = out[:n]
+    return [(int(x0), int(y0), int(x1 - x0), int(y1 - y0)) for x0, y0, x1, y1 in boxes]
+
+class PyramidSegmenter:
+    """
+    Drop-in for JointSegmenter (same segment()/equalize() contract) that
+    runs coarse to fine:
+      1) steps 2-8 on a 'factor'x downscaled (INTER_AREA) image with kernels
+         scaled down to match; the Otsu Hue threshold found there is used
+         for the whole image (as tiled_seg's otsu_mode="global");
+      2) every coarse component that could pass the box size filter, grown
+         by twice the morphology reach, is a candidate region (ROI). A larger
+         coarse component whose box contains candidates replaces their ROIs
+         with its own: a full pass drops blobs inside its holes (they are
+         not external contours), which needs the whole enclosing blob in
+         view. Overlapping ROIs are merged when that costs no extra pixels
+         (merge_rois);
+      3) steps 2-8 and the contour/box filter at full resolution, only inside
+         each ROI. The mask there matches a full pass only 'morph_reach' px or
+         more away from an ROI edge inside the image, so boxes closer than
+         that are dropped (they may be part of a blob cut by the ROI).
+
+    Blobs the coarse pass does not see at all are lost: on the synthetic
+    boards those are specks a few px wide that only pass the size filter
+    thanks to the dilation, but small joints may need a small factor; check
+    a new setup with compare_with_full(). 'last_rois' holds the ROIs of the
+    last call.
+    """
+
+    def __init__(self, factor=2, **params):
+        if factor < 1:
+            raise ValueError(f"factor must be >= 1, got {factor}")
+        self.factor = factor
+        self.fine = JointSegmenter(**params)
+        self.coarse = JointSegmenter(**coarse_params(self.fine.params, factor))
+        self.last_rois = []
+
+    @property
+    def params(self):
+        return self.fine.params
+
+    def set_params(self, **params):
+        self.fine.set_params(**params)
+        self.coarse.set_params(**coarse_params(self.fine.params, self.factor))
+
+    def equalize(self, bgr_img):
+        return self.fine.equalize(bgr_img)
+
+    def rois(self, bgr_eq, debug=None):
+        """
+        Coarse pass: returns (rois, hue_thresh). ROIs are full-resolution
+        (x, y, w, h), one per coarse component that could pass the box size
+        filter or is larger and contains such components, then merged. They
+        are grown by twice the morphology reach: one reach is the band along
+        the edge where the mask can differ from a full pass, the other leaves
+        room for full-resolution blobs larger than their coarse counterpart
+        (kernel sizes are rounded when scaled down).
+        """
+        p = self.params
+        f = self.factor
+        h, w = bgr_eq.shape[:2]
+        with stage("seg.pyramid_coarse"):
+            small = bgr_eq
+            scale = 1
+            while scale < f:
+                # Halving steps: INTER_AREA has a fast path for exactly 2x
+                step = 2 if f % (scale * 2) == 0 else f // scale
+                scale *= step
+                small = cv2.resize(small, (max(w // scale, 1), max(h // scale, 1)), interpolation=cv2.INTER_AREA)
+        coarse_mask = self.coarse.mask(small)
+        if debug is not None:
+            debug.add("pyramid_coarse", coarse_mask)
+
+        with stage("seg.pyramid_rois"):
+            contours, _ = cv2.findContours(coarse_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            pad = 2 * morph_reach(p) + 2 * f
+            # ((x0, y0, x1, y1) coarse box, ROI) per component
+            candidates = []
+            enclosures = []
+            for cnt in contours:
+                x, y, bw, bh = (v * f for v in cv2.boundingRect(cnt))
+                # Coarse boxes are off by up to 'f' px per side
+                if min(bw, bh) + 2 * f < p["min_box_size"]:
+                    continue
+                x0, y0 = max(x - pad, 0), max(y - pad, 0)
+                x1, y1 = min(x + bw + pad, w), min(y + bh + pad, h)
+                entry = ((x, y, x + bw, y + bh), (x0, y0, x1 - x0, y1 - y0))
+                (enclosures if max(bw, bh) - 2 * f > p["max_box_size"] else candidates).append(entry)
+
+            rois = []
+            for (ex0, ey0, ex1, ey1), roi in enclosures:
+                inside = [c for c in candidates
+                          if ex0 <= c[0][0] and ey0 <= c[0][1] and c[0][2] <= ex1 and c[0][3] <= ey1]
+                if inside:
+                    rois.append(roi)
+                    candidates = [c for c in candidates if c not in inside]
+            rois += [roi for _, roi in candidates]
+            return merge_rois(rois), self.coarse.last_hue_thresh
+
+    def segment(self, bgr_img, debug=None):
+        p = self.params
+        bgr_eq = self.fine.equalize(bgr_img)
+        self.last_rois, hue_thresh = self.rois(bgr_eq, debug=debug)
+
+        h, w = bgr_eq.shape[:2]
+        reach = morph_reach(p) + 1  # +1: a blob's outline pixels must be trusted too
+        boxes = set()
+        for rx, ry, rw, rh in self.last_rois:
+            mask = self.fine.mask(bgr_eq[ry:ry+rh, rx:rx+rw], hue_thresh=hue_thresh)
+            for x, y, bw, bh in boxes_from_mask(mask, p["min_box_size"], p["max_box_size"]):
+                if ((x < reach and rx > 0) or (y < reach and ry > 0)
+                        or (x + bw > rw - reach and rx + rw < w) or (y + bh > rh - reach and ry + rh < h)):
+                    continue
+                boxes.add((x + rx, y + ry, bw, bh))
+        return bgr_eq, sorted(boxes, key=lambda b: (b[1], b[0]))
+
+def segment_joints_pyramid(bgr_img, factor=2, **params):
+    """One-shot PyramidSegmenter call; returns (bgr_eq, boxes) like segment_joints()."""
+    return PyramidSegmenter(factor, **params).segment(bgr_img)
+
+def select_joint_method_pyramid(image_path, factor=2, **params):
+    """Path-based wrapper around segment_joints_pyramid()."""
+    return segment_joints_pyramid(load_image(image_path), factor=factor, **params)
+
+def compare_with_full(bgr_img, factor=2, iou_match=0.5, **params):
+    """
+    Accuracy of the pyramid mode against the full-resolution pipeline on one
+    image: boxes are matched by IoU >= iou_match. Returns recall, precision
+    and the mean IoU of the matched pairs, with both box counts.
+    """
+    _, full = JointSegmenter(**params).segment(bgr_img)
+    _, pyramid = PyramidSegmenter(factor, **params).segment(bgr_img)
+    pairs = match_boxes(full, pyramid, iou_match)
+    return {
+        "full_boxes": len(full),
+        "pyramid_boxes": len(pyramid),
+        "recall": len(pairs) / len(full) if full else 1.0,
+        "precision": len(pairs) / len(pyramid) if pyramid else 1.0,
+        "mean_iou": float(np.mean([iou for _, _, iou in pairs])) if pairs else 0.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Pyramid segmentation: speed and box agreement with the full pass.")
+    parser.add_argument("inputs", nargs="+", help="image files, folders or glob patterns")
+    parser.add_argument("--factors", default="2,4", help="comma-separated downscale factors")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    from inference_test import SEG_PARAMS
+
+    factors = [int(f) for f in args.factors.split(",")]
+    for image_path in iter_image_paths(args.inputs):
+        bgr_img = load_image(image_path)
+        segmenters = [("full", JointSegmenter(**SEG_PARAMS))]
+        segmenters += [(f"pyramid x{f}", PyramidSegmenter(f, **SEG_PARAMS)) for f in factors]
+        print(f"{image_path} ({bgr_img.shape[1]}x{bgr_img.shape[0]}):")
+        for name, segmenter in segmenters:
+            segmenter.segment(bgr_img)
+            times = []
+            for _ in range(args.repeats):
+                t0 = time.perf_counter()
+                segmenter.segment(bgr_img)
+                times.append(time.perf_counter() - t0)
+            line = f"  {name:<11} {min(times)*1000:8.1f} ms"
+            if isinstance(segmenter, PyramidSegmenter):
+                acc = compare_with_full(bgr_img, segmenter.factor, **SEG_PARAMS)
+                line += (f"  recall {acc['recall']:6.1%}  precision {acc['precision']:6.1%}  "
+                         f"IoU {acc['mean_iou']:.3f}  ({len(segmenter.last_rois)} ROIs)")
+            print(line)
+
+if __name__ == "__main__":
+    main()
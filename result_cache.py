@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# Bits set per byte value, for Hamming distances between packed hashes
+_POPCOUNT = np.array([bin(v).count("1") for v in range(256)], dtype=np.uint8)
+
+# Longest key stored as its own file name (with ".npy", under the usual 255-byte limit)
+_MAX_NAME = 200
+
+def patch_key(patch, hash_size=32, hash_bits=8, color_grid=2):
+    """
+    Perceptual key of a BGR patch (or frame), "<phash>-<color>" in hex:
+      - phash: DCT hash of the luma, area-downscaled to hash_size x hash_size;
+        the hash_bits x hash_bits lowest frequencies (DC excluded) give one
+        bit each, set when the coefficient is above their median;
+      - color: mean B, G, R of each cell of a color_grid x color_grid grid,
+        so joints that differ mainly in color (what the classifier sees)
+        do not share a key.
+    Recaptures of the same content give nearby, not identical, keys: compare
+    them with key_distance() and a tolerance (ResultCache does).
+    """
+    patch = np.ascontiguousarray(patch)
+    gray = cv2.cvtColor(patch, cv2.COLOR_BGR2GRAY) if patch.ndim == 3 else patch
+    small = cv2.resize(gray, (hash_size, hash_size), interpolation=cv2.INTER_AREA).astype(np.float32)
+    coeffs = cv2.dct(small)[:hash_bits, :hash_bits].ravel()[1:]
+    bits = np.packbits(coeffs > np.median(coeffs))
+    color = cv2.resize(patch, (color_grid, color_grid), interpolation=cv2.INTER_AREA)
+    return f"{bits.tobytes().hex()}-{color.tobytes().hex()}"
+
+def parse_key(key):
+    """patch_key() string -> (packed hash bits, color signature) as uint8 arrays."""
+    phash, color = key.split("-")
+    return np.frombuffer(bytes.fromhex(phash), dtype=np.uint8), np.frombuffer(bytes.fromhex(color), dtype=np.uint8)
+
+def key_distance(a, b):
+    """(Hamming distance of the hashes, largest color difference) between two patch_key() strings."""
+    (ha, ca), (hb, cb) = parse_key(a), parse_key(b)
+    return int(_POPCOUNT[ha ^ hb].sum()), int(np.abs(ca.astype(np.int16) - cb).max())
+
+class _KeyIndex:
+    """Parsed keys in growable arrays (swap-remove), for a vectorized nearest-key search."""
+
+    def __init__(self):
+        self._keys = []
+        self._pos = {}
+        self._hashes = None
+        self._colors = None
+
+    def __contains__(self, key):
+        return key in self._pos
+
+    def add(self, key):
+        if key in self._pos:
+            return
+        try:
+            h, c = parse_key(key)
+        except ValueError:
+            return  # not a patch_key() (e.g. a file of an older cache format)
+        if self._hashes is None:
+            self._hashes = np.empty((64, len(h)), dtype=np.uint8)
+            self._colors = np.empty((64, len(c)), dtype=np.int16)
+        if len(h) != self._hashes.shape[1] or len(c) != self._colors.shape[1]:
+            return
+        n = len(self._keys)
+        if n == len(self._hashes):
+            self._hashes = np.concatenate([self._hashes, np.empty_like(self._hashes)])
+            self._colors = np.concatenate([self._colors, np.empty_like(self._colors)])
+        self._hashes[n], self._colors[n] = h, c
+        self._keys.append(key)
+        self._pos[key] = n
+
+    def remove(self, key):
+        i = self._pos.pop(key, None)
+        if i is None:
+            return
+        last = len(self._keys) - 1
+        if i != last:
+            moved = self._keys[last]
+            self._keys[i] = moved
+            self._hashes[i], self._colors[i] = self._hashes[last], self._colors[last]
+            self._pos[moved] = i
+        self._keys.pop()
+
+    def nearest(self, key, max_distance, color_tolerance):
+        """Closest indexed key within both tolerances, or None."""
+        n = len(self._keys)
+        if not n:
+            return None
+        h, c = parse_key(key)
+        if len(h) != self._hashes.shape[1] or len(c) != self._colors.shape[1]:
+            return None
+        dist = _POPCOUNT[self._hashes[:n] ^ h].sum(axis=1, dtype=np.int32)
+        dist[np.abs(self._colors[:n] - c).max(axis=1) > color_tolerance] = max_distance + 1
+        best = int(np.argmin(dist))
+        return self._keys[best] if dist[best] <= max_distance else None
+
+def model_identity(model_path, *extra):
+    """
+    Cache namespace of a model: its path, size and modification time (so a
+    retrained model never hits results of the old one) plus any 'extra'
+    settings that change the output, e.g. backend or class names.
+    """
+    parts = [os.path.abspath(model_path)]
+    if os.path.exists(model_path):
+        st = os.stat(model_path)
+        parts += [str(st.st_size), str(int(st.st_mtime))]
+    parts += [str(e) for e in extra]
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:16]
+
+def model_version(model_path, *extra):
+    """Human-readable model version for logs: file name plus a short model_identity()."""
+    return f"{os.path.basename(model_path)}@{model_identity(model_path, *extra)[:8]}"
+
+class ResultCache:
+    """
+    Two-level cache of per-patch model outputs (numpy arrays) keyed by
+    patch_key() within one model_identity() namespace:
+      - an in-memory LRU of 'capacity' entries;
+      - optionally <disk_dir>/<model_id>/<key>.npy, evicted least-recently-used
+        first (by file mtime, refreshed on every hit) once the directory
+        exceeds 'disk_max_bytes'. Keys too long for a file name (large
+        color_grid, e.g. whole frames) are stored under their SHA-1 instead
+        and only hit exactly on disk; near matches of those come from memory.
+
+    A lookup hits an exact key first, else the stored key closest in Hamming
+    distance that is within 'max_distance' bits and whose color signature
+    differs by at most 'color_tolerance' levels. Defaults (64-bit hash,
+    max_distance=10): on synthetic joint patches with sigma=2 sensor noise
+    recaptures flip at most 10 bits, while joints with a different label are
+    16+ bits apart. Lower max_distance for a stricter cache.
+    Thread-safe; 'stats' counts memory hits, disk hits, how many of those
+    were near (non-exact) matches, and misses.
+    """
+
+    def __init__(self, model_id, capacity=4096, disk_dir=None, disk_max_bytes=256 << 20,
+                 hash_size=32, hash_bits=8, color_grid=2, max_distance=10, color_tolerance=8):
+        self.model_id = model_id
+        self.capacity = capacity
+        self.hash_size = hash_size
+        self.hash_bits = hash_bits
+        self.color_grid = color_grid
+        self.max_distance = max_distance
+        self.color_tolerance = color_tolerance
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()
+        self._index = _KeyIndex()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "near_hits": 0, "misses": 0, "disk_evictions": 0}
+
+        self.disk_path = None
+        self._disk_sizes = {}
+        self._disk_bytes = 0
+        if disk_dir is not None:
+            self.disk_path = os.path.join(disk_dir, model_id)
+            os.makedirs(self.disk_path, exist_ok=True)
+            for entry in os.scandir(self.disk_path):
+                if entry.name.endswith(".npy"):
+                    self._disk_sizes[entry.name[:-4]] = entry.stat().st_size
+            self._disk_bytes = sum(self._disk_sizes.values())
+            for name in self._disk_sizes:
+                self._index.add(name)  # digest names do not parse and are skipped
+
+    def key(self, patch):
+        return patch_key(patch, self.hash_size, self.hash_bits, self.color_grid)
+
+    @staticmethod
+    def _disk_name(key):
+        return key if len(key) <= _MAX_NAME else hashlib.sha1(key.encode()).hexdigest()
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        self._index.add(key)
+        while len(self._memory) > self.capacity:
+            old, _ = self._memory.popitem(last=False)
+            if old not in self._disk_sizes:
+                self._index.remove(old)
+
+    def get(self, key):
+        """
+        Cached value for 'key' (or the nearest key within tolerance) or None;
+        a disk hit is promoted to memory.
+        """
+        with self._lock:
+            near = False
+            if key not in self._memory and self._disk_name(key) not in self._disk_sizes:
+                nearest = self._index.nearest(key, self.max_distance, self.color_tolerance)
+                if nearest is not None:
+                    key, near = nearest, True
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                self.stats["near_hits"] += near
+                return value
+            name = self._disk_name(key)
+            if name in self._disk_sizes:
+                path = os.path.join(self.disk_path, name + ".npy")
+                try:
+                    value = np.load(path)
+                    os.utime(path)
+                except (OSError, ValueError):
+                    self._forget_disk(name)
+                else:
+                    self._remember(key, value)
+                    self.stats["disk_hits"] += 1
+                    self.stats["near_hits"] += near
+                    return value
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key, value):
+        value = np.asarray(value)
+        with self._lock:
+            self._remember(key, value)
+            name = self._disk_name(key)
+            if self.disk_path is None or name in self._disk_sizes:
+                return
+            path = os.path.join(self.disk_path, name + ".npy")
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, value)
+            os.replace(tmp, path)
+            self._disk_sizes[name] = os.path.getsize(path)
+            self._disk_bytes += self._disk_sizes[name]
+            if self._disk_bytes > self.disk_max_bytes:
+                self._evict_disk()
+
+    def _forget_disk(self, name):
+        self._disk_bytes -= self._disk_sizes.pop(name, 0)
+        if name not in self._memory:
+            self._index.remove(name)
+        try:
+            os.remove(os.path.join(self.disk_path, name + ".npy"))
+        except OSError:
+            pass
+
+    def _evict_disk(self):
+        """Drops least recently used files until the directory is at 90% of its budget."""
+        def mtime(name):
+            try:
+                return os.path.getmtime(os.path.join(self.disk_path, name + ".npy"))
+            except OSError:
+                return 0.0
+
+        for name in sorted(self._disk_sizes, key=mtime):
+            if self._disk_bytes <= 0.9 * self.disk_max_bytes:
+                break
+            self._forget_disk(name)
+            self.stats["disk_evictions"] += 1
+
+    def hit_rate(self):
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def summary(self):
+        s = self.stats
+        return (f"cache: {s['memory_hits']} memory hits, {s['disk_hits']} disk hits "
+                f"({s['near_hits']} near matches), {s['misses']} misses ({self.hit_rate()*100:.1f}% hit rate)")
+
+def cached_classify(cache, patches, classify, num_classes):
+    """
+    classify(patches) -> (N, num_classes) probabilities with 'cache' in front:
+    only patches without an exact or near cached key reach 'classify' (as one
+    batch, each distinct key once), the rest are filled in from the cache.
+    """
+    probs = np.empty((len(patches), num_classes), dtype=np.float32)
+    pending = OrderedDict()  # key -> indices of the uncached patches with that key
+    for i, patch in enumerate(patches):
+        key = cache.key(patch)
+        if key in pending:
+            pending[key].append(i)
+            continue
+        cached = cache.get(key)
+        if cached is None:
+            pending[key] = [i]
+        else:
+            probs[i] = cached
+    if pending:
+        fresh = classify(patches[[idx[0] for idx in pending.values()]])
+        for (key, idx), p in zip(pending.items(), fresh):
+            probs[idx] = p
+            cache.put(key, p)
+    return probs
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+import csv
+import os
+import queue
+import threading
+import time
+
+COLUMNS = ("board_id", "timestamp", "joint", "x", "y", "w", "h", "label", "confidence",
+           "model_version", "latency_ms")
+
+def iso_time(t):
+    """Local ISO-8601 timestamp with milliseconds."""
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(t)) + f".{int(t % 1 * 1000):03d}"
+
+class _CsvFile:
+    def __init__(self, path):
+        self.path = path
+        self._f = open(path, "w", newline="")
+        self._writer = csv.writer(self._f)
+        self._writer.writerow(COLUMNS)
+
+    def write(self, rows):
+        self._writer.writerows(
+            (r[0], iso_time(r[1]), *r[2:8], f"{r[8]:.5f}", r[9], f"{r[10]:.2f}") for r in rows)
+        self._f.flush()
+
+    def size(self):
+        return self._f.tell()
+
+    def close(self):
+        self._f.close()
+
+class _ParquetFile:
+    """One row group per write(); pyarrow is only needed when this format is chosen."""
+
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.path = path
+        self._pa = pa
+        self._schema = pa.schema([
+            ("board_id", pa.string()), ("timestamp", pa.timestamp("ms")), ("joint", pa.int32()),
+            ("x", pa.int32()), ("y", pa.int32()), ("w", pa.int32()), ("h", pa.int32()),
+            ("label", pa.dictionary(pa.int8(), pa.string())), ("confidence", pa.float32()),
+            ("model_version", pa.dictionary(pa.int8(), pa.string())), ("latency_ms", pa.float32()),
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema, compression="zstd")
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        columns[1] = [int(t * 1000) for t in columns[1]]
+        self._writer.write_table(self._pa.Table.from_arrays(
+            [self._pa.array(c).cast(f.type) if f.name in ("label", "model_version")
+             else self._pa.array(c, type=f.type) for c, f in zip(columns, self._schema)],
+            schema=self._schema))
+
+    def size(self):
+        return os.path.getsize(self.path)
+
+    def close(self):
+        self._writer.close()
+
+FORMATS = {"csv": (_CsvFile, ".csv"), "parquet": (_ParquetFile, ".parquet")}
+
+class JointResultLog:
+    """
+    Append-only per-joint result log, one row per joint:
+        board_id, timestamp, joint, x, y, w, h, label, confidence, model_version, latency_ms
+
+    log_board() only enqueues one item per board and never blocks: if the
+    background writer falls more than 'max_queue' boards behind, the board is
+    counted in 'dropped' instead. The writer thread expands boards into rows,
+    writes them in blocks (every 'flush_rows' rows or 'flush_interval'
+    seconds) and rotates to a new file <log_dir>/<prefix>-<start time>.<ext>
+    once the current one exceeds 'max_bytes' or is older than 'max_seconds'.
+    format: "csv", or "parquet" (needs pyarrow; one zstd row group per block).
+    """
+
+    def __init__(self, log_dir="inspection_logs", prefix="joints", format="csv", max_bytes=64 << 20,
+                 max_seconds=3600, flush_rows=1024, flush_interval=1.0, max_queue=10000):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown log format '{format}', expected one of {sorted(FORMATS)}")
+        if format == "parquet":
+            import pyarrow  # noqa: F401  (fail here, not on the writer thread)
+        if not os.path.exists(log_dir):
+            os.makedirs(log_dir)
+        self.log_dir = log_dir
+        self.prefix = prefix
+        self.format = format
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.rows_written = 0
+        self.paths = []
+        self.error = None
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._file = None
+        self._opened_at = 0.0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def log_board(self, board_id, results, model_version=None, latency=None, timestamp=None):
+        """
+        Queues one board's joint results (dicts with "box", "label",
+        "confidence", as returned by the engines). latency in seconds.
+        """
+        item = (str(board_id), time.time() if timestamp is None else timestamp, results,
+                model_version or "", (latency or 0.0) * 1000)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def _open(self):
+        cls, ext = FORMATS[self.format]
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.log_dir, f"{self.prefix}-{stamp}{ext}")
+        n = 1
+        while os.path.exists(path):
+            path = os.path.join(self.log_dir, f"{self.prefix}-{stamp}-{n}{ext}")
+            n += 1
+        self._file = cls(path)
+        self._opened_at = time.time()
+        self.paths.append(path)
+
+    def _write(self, rows):
+        if self._file is not None and (self._file.size() >= self.max_bytes
+                                       or time.time() - self._opened_at >= self.max_seconds):
+            self._file.close()
+            self._file = None
+        if self._file is None:
+            self._open()
+        self._file.write(rows)
+        self.rows_written += len(rows)
+
+    def _run(self):
+        rows = []
+        last_flush = time.perf_counter()
+        stop = False
+        while not stop:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = False
+            if item is None:
+                stop = True
+            elif item:
+                board_id, t, results, model_version, latency_ms = item
+                for i, res in enumerate(results):
+                    x, y, w, h = res["box"]
+                    rows.append((board_id, t, res.get("index", i), int(x), int(y), int(w), int(h),
+                                 res["label"], float(res["confidence"]), model_version, latency_ms))
+            if rows and (stop or len(rows) >= self.flush_rows
+                         or time.perf_counter() - last_flush >= self.flush_interval):
+                try:
+                    self._write(rows)
+                except Exception as e:  # keep draining so log_board never backs up
+                    self.error = e
+                rows = []
+                last_flush = time.perf_counter()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        """Writes everything still queued and closes the current file."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self.error is not None:
+            print(f"Result log error: {self.error}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
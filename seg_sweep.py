@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import itertools
+import json
+import os
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from image_seg import DEFAULT_SEG_PARAMS, JointSegmenter, iter_image_paths, load_image, match_boxes
+
+# Pipeline stages in order, with the parameters each one adds to its cache key.
+# A stage's result depends on its own parameters and on those of every stage before it.
+STAGES = (
+    ("equalize", ("do_hist_eq",)),
+    ("hue_mask", ("otsu_invert",)),
+    ("value_mask", ("value_low_thresh",)),
+    ("close", ("morph_close_ksize",)),
+    ("open", ("morph_open_ksize",)),
+    ("median", ("median_ksize",)),
+    ("dilate", ("morph_dilate_ksize", "morph_dilate_iterations")),
+    ("filter", ("min_box_size", "max_box_size")),
+)
+PARAM_ORDER = tuple(name for _, names in STAGES for name in names)
+# Stage -> length of its PARAM_ORDER key prefix
+STAGE_KEY_LEN = {name: PARAM_ORDER.index(names[-1]) + 1 for name, names in STAGES}
+
+# Default search space; parameters not listed stay at their base value
+DEFAULT_GRID = dict(
+    do_hist_eq=[False, True],
+    otsu_invert=[True],
+    value_low_thresh=[50, 65, 80, 95, 110],
+    morph_close_ksize=[0, 3, 5, 7],
+    morph_open_ksize=[0, 3, 4, 5],
+    median_ksize=[3, 5],
+    morph_dilate_ksize=[5, 9, 13],
+    morph_dilate_iterations=[1, 2],
+    min_box_size=[10, 15, 20],
+    max_box_size=[300, 500],
+)
+
+def _is_number(text):
+    try:
+        float(text)
+    except ValueError:
+        return False
+    return True
+
+def load_reference_boxes(path, image_shape=None):
+    """
+    Reference joint boxes as (x, y, w, h) from an annotation file:
+      - Pascal VOC .xml (LabelImg);
+      - YOLO .txt (LabelImg): "<class id> <cx> <cy> <w> <h>", normalized to
+        [0, 1]; needs 'image_shape';
+      - synthetic_pcb .txt: "<label> <x> <y> <w> <h>" in pixels.
+    Raises ValueError on a .txt line that matches neither format, or on a
+    file mixing them.
+    """
+    if path.lower().endswith(".xml"):
+        boxes = []
+        for bb in ET.parse(path).getroot().iter("bndbox"):
+            x0, y0, x1, y1 = (int(round(float(bb.find(k).text))) for k in ("xmin", "ymin", "xmax", "ymax"))
+            boxes.append((x0, y0, x1 - x0, y1 - y0))
+        return boxes
+
+    boxes = []
+    kinds = set()
+    with open(path) as f:
+        for n, line in enumerate(f, 1):
+            parts = line.split()
+            if not parts:
+                continue
+            try:
+                if len(parts) != 5:
+                    raise ValueError
+                coords = [float(v) for v in parts[1:]]
+            except ValueError:
+                raise ValueError(f"{path}:{n}: expected '<class> <x> <y> <w> <h>', got {line.strip()!r}") from None
+            if parts[0].isdigit() and all(0.0 <= v <= 1.0 for v in coords):
+                if image_shape is None:
+                    raise ValueError(f"YOLO annotation {path} needs the image size")
+                h, w = image_shape[:2]
+                cx, cy, bw, bh = coords
+                boxes.append((int(round((cx - bw / 2) * w)), int(round((cy - bh / 2) * h)),
+                              int(round(bw * w)), int(round(bh * h))))
+                kinds.add("yolo")
+            elif not _is_number(parts[0]) and all(v.is_integer() for v in coords):
+                boxes.append(tuple(int(v) for v in coords))
+                kinds.add("pixels")
+            else:
+                raise ValueError(f"{path}:{n}: neither YOLO (integer class id, coordinates in [0, 1]) "
+                                 f"nor synthetic_pcb (label, pixel coordinates): {line.strip()!r}")
+    if len(kinds) > 1:
+        raise ValueError(f"{path} mixes YOLO and pixel boxes")
+    return boxes
+
+def find_annotation(image_path, ref_dir=None):
+    """<stem>.xml or <stem>.txt next to the image (or in 'ref_dir'); None if there is none."""
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    folder = ref_dir if ref_dir is not None else os.path.dirname(image_path)
+    for ext in (".xml", ".txt"):
+        path = os.path.join(folder, stem + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+class StagedImage:
+    """
+    One image with every pipeline stage memoized on the parameters it depends
+    on (a prefix of PARAM_ORDER). Only the latest result per stage is kept:
+    when parameter sets are visited in PARAM_ORDER product order, consecutive
+    sets share their upstream stages, so equalization, HSV and Otsu run once
+    per image and only the stages after the first changed parameter rerun.
+    Steps and results are the same as JointSegmenter.segment().
+    """
+
+    def __init__(self, bgr_img):
+        self.bgr_img = bgr_img
+        self._memo = {}
+        self.computed = 0
+        self.reused = 0
+
+    def _stage(self, name, params, compute):
+        key = tuple(params[p] for p in PARAM_ORDER[:STAGE_KEY_LEN[name]])
+        cached = self._memo.get(name)
+        if cached is not None and cached[0] == key:
+            self.reused += 1
+            return cached[1]
+        value = compute()
+        self._memo[name] = (key, value)
+        self.computed += 1
+        return value
+
+    @staticmethod
+    def _kernel(ksize):
+        return cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (ksize, ksize))
+
+    def equalized(self, p):
+        """(hue, value) channels of the optionally equalized image."""
+        def compute():
+            bgr_eq = JointSegmenter(do_hist_eq=p["do_hist_eq"]).equalize(self.bgr_img)
+            hsv = cv2.cvtColor(bgr_eq, cv2.COLOR_BGR2HSV)
+            return cv2.extractChannel(hsv, 0), cv2.extractChannel(hsv, 2)
+        return self._stage("equalize", p, compute)
+
+    def hue_mask(self, p):
+        def compute():
+            otsu_flag = cv2.THRESH_BINARY_INV if p["otsu_invert"] else cv2.THRESH_BINARY
+            return cv2.threshold(self.equalized(p)[0], 0, 255, otsu_flag + cv2.THRESH_OTSU)[1]
+        return self._stage("hue_mask", p, compute)
+
+    def merged(self, p):
+        def compute():
+            value_mask = cv2.threshold(self.equalized(p)[1], p["value_low_thresh"], 255, cv2.THRESH_BINARY)[1]
+            return cv2.bitwise_and(self.hue_mask(p), value_mask)
+        return self._stage("value_mask", p, compute)
+
+    def closed(self, p):
+        def compute():
+            if p["morph_close_ksize"] <= 0:
+                return self.merged(p)
+            return cv2.morphologyEx(self.merged(p), cv2.MORPH_CLOSE, self._kernel(p["morph_close_ksize"]))
+        return self._stage("close", p, compute)
+
+    def opened(self, p):
+        def compute():
+            if p["morph_open_ksize"] <= 0:
+                return self.closed(p)
+            return cv2.morphologyEx(self.closed(p), cv2.MORPH_OPEN, self._kernel(p["morph_open_ksize"]))
+        return self._stage("open", p, compute)
+
+    def filtered(self, p):
+        return self._stage("median", p, lambda: cv2.medianBlur(self.opened(p), p["median_ksize"]))
+
+    def candidate_boxes(self, p):
+        """All contour boxes of the dilated mask as an (N, 4) array, before the size filter."""
+        def compute():
+            mask = self.filtered(p)
+            if p["morph_dilate_ksize"] > 0 and p["morph_dilate_iterations"] > 0:
+                mask = cv2.dilate(mask, self._kernel(p["morph_dilate_ksize"]),
+                                  iterations=p["morph_dilate_iterations"])
+            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            return np.array([cv2.boundingRect(c) for c in contours], dtype=np.int32).reshape(-1, 4)
+        return self._stage("dilate", p, compute)
+
+    def boxes(self, p):
+        """Same boxes as boxes_from_mask() on the final mask."""
+        b = self.candidate_boxes(p)
+        wh = b[:, 2:]
+        keep = (wh >= p["min_box_size"]).all(axis=1) & (wh <= p["max_box_size"]).all(axis=1)
+        return b[keep]
+
+def score_boxes(pred, reference, iou_match=0.5):
+    """(true positives, false positives, false negatives, sum of matched IoU) of one image."""
+    pairs = match_boxes(reference, pred, iou_match)
+    tp = len(pairs)
+    return tp, len(pred) - tp, len(reference) - tp, sum(iou for _, _, iou in pairs)
+
+def expand_grid(grid, base=None):
+    """
+    Every combination of 'grid' (name -> list of values) on top of 'base',
+    ordered so that upstream parameters change slowest (see StagedImage).
+    Combinations that are invalid for OpenCV (even median size) are dropped.
+    """
+    base = dict(DEFAULT_SEG_PARAMS, **(base or {}))
+    unknown = set(grid) - set(PARAM_ORDER)
+    if unknown:
+        raise TypeError(f"Unknown segmentation parameter(s): {sorted(unknown)}")
+    axes = [grid.get(name, [base[name]]) for name in PARAM_ORDER]
+    combos = []
+    for values in itertools.product(*axes):
+        p = dict(zip(PARAM_ORDER, values))
+        if p["median_ksize"] % 2 == 0 or p["median_ksize"] < 1 or p["min_box_size"] > p["max_box_size"]:
+            continue
+        combos.append(p)
+    return combos
+
+# Per-process state of the sweep workers: the current image path -> (StagedImage, reference boxes).
+# Only one image is kept: a StagedImage of a 12 MP capture holds 100+ MB of stage buffers.
+_WORKER_IMAGES = {}
+
+def _init_worker():
+    cv2.setNumThreads(1)  # parallelism comes from the process pool
+
+def _score_chunk(image_path, ref_path, combos, iou_match):
+    """
+    Worker: scores a run of parameter sets on one image; returns an (n, 4)
+    array of score_boxes() rows. Top-level so it can be pickled for a process pool.
+    """
+    entry = _WORKER_IMAGES.get(image_path)
+    if entry is None:
+        _WORKER_IMAGES.clear()
+        bgr_img = load_image(image_path)
+        entry = _WORKER_IMAGES[image_path] = (StagedImage(bgr_img),
+                                              load_reference_boxes(ref_path, bgr_img.shape))
+    staged, reference = entry
+    return np.array([score_boxes(staged.boxes(p), reference, iou_match) for p in combos],
+                    dtype=np.float64).reshape(-1, 4)
+
+def sweep(samples, combos, workers=None, iou_match=0.5, chunks_per_worker=4):
+    """
+    Scores every parameter set in 'combos' on every (image_path, annotation_path)
+    sample. Work is split into contiguous chunks of combos per image, so each
+    worker keeps its stage cache warm within a chunk.
+    Returns one dict per combo: params + tp/fp/fn, precision, recall, f1, mean_iou
+    (micro-averaged over all images), best F1 first.
+    """
+    workers = workers or os.cpu_count()
+    n_chunks = max(1, -(-workers * chunks_per_worker // max(len(samples), 1)))
+    bounds = [int(b) for b in np.linspace(0, len(combos), min(n_chunks, len(combos)) + 1)]
+    totals = np.zeros((len(combos), 4))
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = [(a, pool.submit(_score_chunk, image_path, ref_path, combos[a:b], iou_match))
+                   for image_path, ref_path in samples for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+        for start, future in futures:
+            scores = future.result()
+            totals[start:start + len(scores)] += scores
+
+    results = []
+    for p, (tp, fp, fn, iou_sum) in zip(combos, totals):
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        results.append(dict(p, tp=int(tp), fp=int(fp), fn=int(fn), precision=precision, recall=recall,
+                            f1=f1, mean_iou=iou_sum / tp if tp else 0.0))
+    results.sort(key=lambda r: (-r["f1"], -r["mean_iou"]))
+    return results
+
+def parse_grid_option(items):
+    """["value_low_thresh=60,80", "do_hist_eq=true"] -> {"value_low_thresh": [60, 80], "do_hist_eq": [True]}"""
+    grid = {}
+    for item in items:
+        name, _, values = item.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_SEG_PARAMS:
+            raise SystemExit(f"Unknown segmentation parameter '{name}'")
+        kind = type(DEFAULT_SEG_PARAMS[name])
+        if kind is bool:
+            grid[name] = [v.strip().lower() in ("1", "true", "yes") for v in values.split(",")]
+        else:
+            grid[name] = [kind(v) for v in values.split(",")]
+    return grid
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune the Select Joint parameters against LabelImg reference boxes.")
+    parser.add_argument("inputs", nargs="+", help="annotated images: files, folders or glob patterns")
+    parser.add_argument("--refs", default=None, help="folder with the .xml/.txt annotations (default: next to images)")
+    parser.add_argument("--grid", action="append", default=[], metavar="NAME=V1,V2",
+                        help="values to try for one parameter (repeatable; replaces its default grid)")
+    parser.add_argument("--only", action="store_true", help="sweep only the --grid parameters, keep the rest at base")
+    parser.add_argument("--base", default=None, help="JSON file with base parameters (default: DEFAULT_SEG_PARAMS)")
+    parser.add_argument("--iou", type=float, default=0.5, help="IoU needed for a box to match a reference box")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--out", default="seg_sweep.csv", help="CSV with the score of every parameter set")
+    parser.add_argument("--save-best", default=None, help="write the best parameter set as JSON (usable as --base)")
+    args = parser.parse_args()
+
+    samples = []
+    for path in iter_image_paths(args.inputs):
+        ref = find_annotation(path, args.refs)
+        if ref is None:
+            print(f"Skipping {path}: no annotation")
+        else:
+            samples.append((path, ref))
+    if not samples:
+        raise SystemExit("No annotated images found.")
+
+    base = None
+    if args.base:
+        with open(args.base) as f:
+            base = json.load(f)
+    overrides = parse_grid_option(args.grid)
+    grid = overrides if args.only else dict(DEFAULT_GRID, **overrides)
+    combos = expand_grid(grid, base)
+    print(f"{len(combos)} parameter sets x {len(samples)} images")
+
+    t0 = time.perf_counter()
+    results = sweep(samples, combos, workers=args.workers, iou_match=args.iou)
+    elapsed = time.perf_counter() - t0
+    if results[0]["tp"] + results[0]["fn"] == 0:
+        raise SystemExit("The annotations hold no reference boxes; nothing to tune against.")
+    print(f"Scored {len(combos) * len(samples)} set/image pairs in {elapsed:.1f} s "
+          f"({len(combos) * len(samples) / elapsed:.0f}/s)")
+
+    columns = list(PARAM_ORDER) + ["tp", "fp", "fn", "precision", "recall", "f1", "mean_iou"]
+    with open(args.out, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"Saved {args.out}")
+
+    print(f"{'f1':>6} {'prec':>6} {'recall':>6} {'iou':>5}  params")
+    for r in results[:args.top]:
+        changed = {k: r[k] for k in PARAM_ORDER if r[k] != DEFAULT_SEG_PARAMS[k]}
+        print(f"{r['f1']:6.3f} {r['precision']:6.3f} {r['recall']:6.3f} {r['mean_iou']:5.2f}  {changed}")
+    best = {k: results[0][k] for k in PARAM_ORDER}
+    print("Best parameters:")
+    print(json.dumps(best, indent=4))
+    if args.save_best:
+        with open(args.save_best, "w") as f:
+            json.dump(best, f, indent=4)
+
+if __name__ == "__main__":
+    main()
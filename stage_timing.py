@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+import argparse
+import atexit
+import bisect
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# Histogram bucket upper bounds in seconds (Prometheus 'le' labels); +Inf is implicit
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+class StageStats:
+    """Count, sum, cumulative-bucket histogram and a bounded window of recent samples of one stage."""
+
+    def __init__(self, window=10000):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.samples = deque(maxlen=window)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.samples.append(seconds)
+
+    def percentiles(self, qs=(50, 95)):
+        if not self.samples:
+            return [float("nan")] * len(qs)
+        return [float(v) for v in np.percentile(np.fromiter(self.samples, dtype=np.float64), qs)]
+
+class StageMetrics:
+    """
+    Process-wide stage timer registry. Disabled by default: stage() then
+    returns a shared no-op context manager, so the instrumented hot paths pay
+    one attribute check per stage. enable() switches timing on at runtime
+    (also done at import when PCB_STAGE_TIMING=1 is set).
+
+    Every sample updates the per-stage histogram; with a JSONL sink it is
+    also buffered as {"t", "stage", "ms"} and written in blocks of
+    'flush_every' lines (and at exit).
+    """
+
+    def __init__(self, window=10000, flush_every=512):
+        self.enabled = False
+        self.window = window
+        self.flush_every = flush_every
+        self.stages = {}
+        self._lock = threading.Lock()
+        self._jsonl = None
+        self._jsonl_path = None
+        self._pending = []
+
+    def enable(self, jsonl_path=None):
+        """Switches timing on; a new 'jsonl_path' replaces (and closes) the previous sink."""
+        if jsonl_path is not None and os.path.abspath(jsonl_path) != self._jsonl_path:
+            with self._lock:
+                if self._jsonl is not None:
+                    if self._pending:
+                        self._write_pending()
+                    self._jsonl.close()
+                self._jsonl = open(jsonl_path, "a")
+                self._jsonl_path = os.path.abspath(jsonl_path)
+        self.enabled = True
+        return self
+
+    def disable(self):
+        self.enabled = False
+        self.flush()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+
+    def record(self, name, seconds):
+        with self._lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = StageStats(self.window)
+            stats.add(seconds)
+            if self._jsonl is not None:
+                self._pending.append(f'{{"t": {time.time():.6f}, "stage": "{name}", "ms": {seconds*1000:.4f}}}\n')
+                if len(self._pending) >= self.flush_every:
+                    self._write_pending()
+
+    def _write_pending(self):
+        self._jsonl.writelines(self._pending)
+        self._jsonl.flush()
+        self._pending = []
+
+    def flush(self):
+        with self._lock:
+            if self._jsonl is not None and self._pending:
+                self._write_pending()
+
+    def summary(self):
+        """{stage: {"count", "total_ms", "mean_ms", "p50_ms", "p95_ms"}}"""
+        with self._lock:
+            items = list(self.stages.items())
+        out = {}
+        for name, s in items:
+            p50, p95 = s.percentiles((50, 95))
+            out[name] = {"count": s.count, "total_ms": s.total * 1000, "mean_ms": s.total * 1000 / s.count,
+                         "p50_ms": p50 * 1000, "p95_ms": p95 * 1000}
+        return out
+
+    def prometheus_text(self, metric="pcb_stage_seconds"):
+        """Prometheus text exposition format: one histogram labelled by stage."""
+        lines = [f"# HELP {metric} Time spent per inspection stage.", f"# TYPE {metric} histogram"]
+        with self._lock:
+            items = sorted((name, list(s.buckets), s.total, s.count) for name, s in self.stages.items())
+        for name, buckets, total, count in items:
+            cumulative = 0
+            for le, n in zip(BUCKETS + ("+Inf",), buckets):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{stage="{name}"}} {total:.6f}')
+            lines.append(f'{metric}_count{{stage="{name}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Writes prometheus_text() atomically, e.g. for node_exporter's textfile collector."""
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp, path)
+
+    def serve_prometheus(self, port=9108, host="0.0.0.0"):
+        """Serves prometheus_text() on http://host:port/metrics from a daemon thread; returns the server."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class _Stage:
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        METRICS.record(self.name, time.perf_counter() - self.t0)
+        return False
+
+_NULL_STAGE = _NullStage()
+METRICS = StageMetrics()
+atexit.register(METRICS.flush)
+if os.environ.get("PCB_STAGE_TIMING", "") not in ("", "0"):
+    METRICS.enable(os.environ.get("PCB_STAGE_TIMING_JSONL") or None)
+
+def stage(name):
+    """with stage("seg.hsv"): ...  -- times the block into METRICS when timing is enabled."""
+    if not METRICS.enabled:
+        return _NULL_STAGE
+    return _Stage(name)
+
+def print_summary(summary=None):
+    """Per-stage count / p50 / p95 / mean / total table (METRICS.summary() by default)."""
+    summary = METRICS.summary() if summary is None else summary
+    if not summary:
+        print("No stage timings recorded.")
+        return
+    print(f"{'stage':<24} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9} {'total ms':>10}")
+    for name, s in sorted(summary.items(), key=lambda kv: -kv[1]["total_ms"]):
+        print(f"{name:<24} {s['count']:>7} {s['p50_ms']:>9.3f} {s['p95_ms']:>9.3f} "
+              f"{s['mean_ms']:>9.3f} {s['total_ms']:>10.1f}")
+
+def add_metrics_arguments(parser):
+    """Adds the shared --timings / --metrics-* options to a CLI's ArgumentParser."""
+    parser.add_argument("--timings", action="store_true", help="record per-stage timings, print p50/p95 at the end")
+    parser.add_argument("--metrics-jsonl", default=None, help="append every stage sample to this JSONL file")
+    parser.add_argument("--metrics-prom", default=None, help="write a Prometheus text file at the end")
+    parser.add_argument("--metrics-port", type=int, default=None, help="serve Prometheus /metrics on this port")
+
+def start_metrics(args):
+    """Enables METRICS if any of the add_metrics_arguments() options is set."""
+    if args.timings or args.metrics_jsonl or args.metrics_prom or args.metrics_port:
+        METRICS.enable(args.metrics_jsonl)
+    if args.metrics_port:
+        METRICS.serve_prometheus(args.metrics_port)
+
+def finish_metrics(args):
+    """Prints the summary and writes the Prometheus file requested on the command line."""
+    if not METRICS.enabled:
+        return
+    METRICS.flush()
+    if args.metrics_prom:
+        METRICS.write_prometheus(args.metrics_prom)
+    print_summary()
+
+def summarize_jsonl(path):
+    """Rebuilds the per-stage summary of a run from its JSONL sample log."""
+    samples = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                rec = json.loads(line)
+                samples.setdefault(rec["stage"], []).append(rec["ms"])
+    summary = {}
+    for name, ms in samples.items():
+        ms = np.asarray(ms)
+        p50, p95 = np.percentile(ms, (50, 95))
+        summary[name] = {"count": len(ms), "total_ms": float(ms.sum()), "mean_ms": float(ms.mean()),
+                         "p50_ms": float(p50), "p95_ms": float(p95)}
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage p50/p95 summary of a stage timing JSONL log.")
+    parser.add_argument("jsonl")
+    args = parser.parse_args()
+    print_summary(summarize_jsonl(args.jsonl))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+import argparse
+import os
+
+import cv2
+import numpy as np
+
+JOINT_LABELS = ("bad", "good", "missing")
+
+def render_board(size=(1920, 1080), pad_density=0.08, joint_fill=0.9, bad_fraction=0.1,
+                 pad_size=(14, 22), lighting=0.35, noise=4.0, traces=40, seed=0):
+    """
+    Renders a synthetic top-down capture of a green solder-mask PCB.
+
+    size:          (width, height) in pixels.
+    pad_density:   fraction of the board area covered by pads (0.08 ~ 100 pads).
+                   Pads scale with the resolution, so the same density renders
+                   the same board at every size. Pads come in short rows/columns
+                   like IC and header footprints; a board that runs out of room
+                   gets fewer.
+    joint_fill:    fraction of pads that carry a solder joint; the rest stay bare
+                   copper ("missing").
+    bad_fraction:  fraction of joints drawn as cold/insufficient (dull, flat).
+    pad_size:      (min, max) pad edge length in px at 640x480, scaled with the image.
+    lighting:      strength of the smooth illumination gradient / vignette (0 = flat).
+    noise:         std-dev of the Gaussian sensor noise in gray levels.
+    traces:        number of copper traces under the mask.
+
+    Returns (bgr_img, joints) where joints is a list of {"box": (x, y, w, h),
+    "label": "good"|"bad"|"missing"} ground-truth dicts.
+    """
+    rng = np.random.default_rng(seed)
+    width, height = size
+    scale = np.sqrt(width * height / (640 * 480))
+
+    # Solder mask
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    img[:] = (45, 115, 35)
+
+    # Traces (slightly lighter green where copper sits under the mask)
+    thickness = max(int(2 * scale), 1)
+    for _ in range(traces):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        for _ in range(int(rng.integers(2, 5))):
+            if rng.random() < 0.5:
+                nx, ny = int(rng.integers(0, width)), y
+            else:
+                nx, ny = x, int(rng.integers(0, height))
+            cv2.line(img, (x, y), (nx, ny), (60, 150, 55), thickness)
+            x, y = nx, ny
+
+    # Silkscreen outlines
+    for _ in range(max(int(traces / 4), 1)):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        w, h = (int(v * scale) for v in rng.integers(30, 120, size=2))
+        cv2.rectangle(img, (x, y), (x + w, y + h), (225, 230, 230), max(int(scale), 1))
+
+    # Pads in footprint-like rows
+    lo, hi = (max(int(v * scale), 3) for v in pad_size)
+    num_pads = int(pad_density * width * height / ((lo + hi) / 2) ** 2)
+    joints = []
+    occupied = np.zeros((height, width), dtype=bool)
+    misses = 0
+    while len(joints) < num_pads and misses < 200:
+        pad = int(rng.integers(lo, hi + 1))
+        pitch = int(pad * rng.uniform(1.6, 2.4))
+        count = int(min(rng.integers(2, 17), num_pads - len(joints)))
+        vertical = rng.random() < 0.5
+        span = pitch * (count - 1) + pad
+        x0 = int(rng.integers(0, max(width - (pad if vertical else span), 1)))
+        y0 = int(rng.integers(0, max(height - (span if vertical else pad), 1)))
+        x1, y1 = x0 + (pad if vertical else span), y0 + (span if vertical else pad)
+        if x1 > width or y1 > height or occupied[y0:y1, x0:x1].any():
+            misses += 1  # 200 failed placements in a row: the board is full
+            continue
+        misses = 0
+        occupied[max(y0 - pad, 0):y1 + pad, max(x0 - pad, 0):x1 + pad] = True
+
+        for i in range(count):
+            px = x0 + (0 if vertical else i * pitch)
+            py = y0 + (i * pitch if vertical else 0)
+            cv2.rectangle(img, (px, py), (px + pad - 1, py + pad - 1), (80, 150, 190), -1)  # bare copper
+            center, radius = (px + pad // 2, py + pad // 2), max(pad // 2 + 1, 2)
+            if rng.random() >= joint_fill:
+                label = "missing"
+            elif rng.random() < bad_fraction:
+                label = "bad"
+                cv2.ellipse(img, center, (radius, max(radius // 2, 1)), float(rng.uniform(0, 180)),
+                            0, 360, (140, 152, 170), -1)
+            else:
+                label = "good"
+                cv2.circle(img, center, radius, (170, 186, 210), -1)
+                cv2.circle(img, (center[0] - radius // 3, center[1] - radius // 3),
+                           max(radius // 3, 1), (232, 240, 252), -1)  # specular highlight
+            joints.append({"box": (px, py, pad, pad), "label": label})
+
+    # Lighting gradient + vignette and low-frequency mask texture are smooth,
+    # so both are computed on a coarse grid and upsampled
+    gh, gw = max(height // 32, 2), max(width // 32, 2)
+    yy, xx = np.mgrid[0:gh, 0:gw].astype(np.float32)
+    yy, xx = yy / (gh - 1) - 0.5, xx / (gw - 1) - 0.5
+    angle = rng.uniform(0, 2 * np.pi)
+    gain = 1.0 + lighting * (np.cos(angle) * xx + np.sin(angle) * yy - (xx ** 2 + yy ** 2))
+    texture = rng.normal(0, 6, size=(gh, gw)).astype(np.float32)
+    gain = cv2.resize(gain, (width, height), interpolation=cv2.INTER_LINEAR)
+    texture = cv2.resize(texture, (width, height), interpolation=cv2.INTER_CUBIC)
+
+    out = img.astype(np.float32)
+    out *= gain[..., None]
+    out += texture[..., None]
+    if noise > 0:
+        out += noise * rng.standard_normal(size=out.shape, dtype=np.float32)
+    return np.clip(out, 0, 255, out=out).astype(np.uint8), joints
+
+def main():
+    parser = argparse.ArgumentParser(description="Render synthetic PCB captures (+ ground-truth boxes).")
+    parser.add_argument("out_dir")
+    parser.add_argument("--count", type=int, default=10)
+    parser.add_argument("--size", default="1920x1080", help="WxH")
+    parser.add_argument("--pad-density", type=float, default=0.08)
+    parser.add_argument("--joint-fill", type=float, default=0.9)
+    parser.add_argument("--lighting", type=float, default=0.35)
+    parser.add_argument("--noise", type=float, default=4.0)
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    if not os.path.exists(args.out_dir):
+        os.makedirs(args.out_dir)
+    for i in range(args.count):
+        img, joints = render_board((width, height), pad_density=args.pad_density, joint_fill=args.joint_fill,
+                                   lighting=args.lighting, noise=args.noise, seed=i)
+        cv2.imwrite(os.path.join(args.out_dir, f"board_{i:04d}.png"), img)
+        with open(os.path.join(args.out_dir, f"board_{i:04d}.txt"), "w") as f:
+            for j in joints:
+                f.write("{} {} {} {} {}\n".format(j["label"], *j["box"]))
+    print(f"Wrote {args.count} boards to {args.out_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from image_seg import DEFAULT_SEG_PARAMS, JointSegmenter, boxes_from_mask, load_image
+
+def morph_margin(params):
+    """
+    How far (in px) a mask pixel can be influenced by its neighbours through
+    close -> open -> median -> dilate. Tiles are padded by this much so their
+    core region comes out exactly as in a single full-image pass.
+    """
+    p = dict(DEFAULT_SEG_PARAMS, **params)
+    margin = 0
+    if p["morph_close_ksize"] > 0:
+        margin += 2 * p["morph_close_ksize"]
+    if p["morph_open_ksize"] > 0:
+        margin += 2 * p["morph_open_ksize"]
+    margin += p["median_ksize"]
+    if p["morph_dilate_ksize"] > 0:
+        margin += p["morph_dilate_ksize"] * p["morph_dilate_iterations"]
+    return margin + 2
+
+def global_hue_threshold(bgr_eq, otsu_invert=True, downsample=4):
+    """
+    Otsu threshold on the Hue histogram of the whole image, computed on every
+    'downsample'-th pixel in each direction (1 = exact full-resolution value).
+    """
+    sample = np.ascontiguousarray(bgr_eq[::downsample, ::downsample])
+    hue = cv2.extractChannel(cv2.cvtColor(sample, cv2.COLOR_BGR2HSV), 0)
+    otsu_flag = cv2.THRESH_BINARY_INV if otsu_invert else cv2.THRESH_BINARY
+    thresh, _ = cv2.threshold(hue, 0, 255, otsu_flag + cv2.THRESH_OTSU)
+    return thresh
+
+def tile_grid(shape, tile_size, margin):
+    """
+    Yields (core, padded) tiles as (y0, y1, x0, x1) tuples covering an image of
+    'shape'; padded is the core grown by 'margin' and clipped to the image.
+    """
+    h, w = shape[:2]
+    for y0 in range(0, h, tile_size):
+        for x0 in range(0, w, tile_size):
+            y1, x1 = min(y0 + tile_size, h), min(x0 + tile_size, w)
+            padded = (max(y0 - margin, 0), min(y1 + margin, h),
+                      max(x0 - margin, 0), min(x1 + margin, w))
+            yield (y0, y1, x0, x1), padded
+
+def _segment_tile(tile, core, padded, hue_thresh, params):
+    """
+    Worker: runs steps 2-8 on one padded tile and returns the mask of its core.
+    Top-level so it can be pickled for a process pool.
+    """
+    segmenter = JointSegmenter(**dict(params, do_hist_eq=False))
+    mask = segmenter.mask(tile, hue_thresh=hue_thresh)
+    cy0, cx0 = core[0] - padded[0], core[2] - padded[2]
+    return mask[cy0:cy0 + core[1] - core[0], cx0:cx0 + core[3] - core[2]].copy()
+
+def segment_joints_tiled(bgr_img, tile_size=1024, workers=None, executor="thread",
+                         otsu_mode="global", otsu_downsample=4, **params):
+    """
+    Tiled, multi-core version of segment_joints() for large captures.
+      1) Histogram eq (optional) on the full image
+      2) Hue threshold: one global Otsu value from a downsampled histogram
+         (otsu_mode="global"), or Otsu per tile (otsu_mode="tile")
+      3) Steps 2-8 of the pipeline on overlapping tiles in a thread or process pool
+      4) Tile cores are stitched into one full-size mask and contours are found
+         once on it, so joints crossing tile seams come out as a single box
+
+    With otsu_mode="global" and otsu_downsample=1 the boxes are identical to the
+    single-pass result; a larger downsample only moves the Hue threshold slightly.
+    Returns (bgr_eq, boxes) like segment_joints().
+    """
+    if otsu_mode not in ("global", "tile"):
+        raise ValueError(f"Unknown otsu_mode '{otsu_mode}', expected 'global' or 'tile'")
+    params = dict(DEFAULT_SEG_PARAMS, **params)
+    if workers is None:
+        workers = os.cpu_count()
+
+    bgr_eq = JointSegmenter(**params).equalize(bgr_img)
+
+    hue_thresh = None
+    if otsu_mode == "global":
+        hue_thresh = global_hue_threshold(bgr_eq, params["otsu_invert"], otsu_downsample)
+
+    margin = morph_margin(params)
+    full_mask = np.empty(bgr_eq.shape[:2], dtype=np.uint8)
+
+    pool_class = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+    with pool_class(max_workers=workers) as pool:
+        futures = []
+        for core, padded in tile_grid(bgr_eq.shape, tile_size, margin):
+            tile = bgr_eq[padded[0]:padded[1], padded[2]:padded[3]]
+            futures.append((core, pool.submit(_segment_tile, tile, core, padded, hue_thresh, params)))
+
+        for (y0, y1, x0, x1), future in futures:
+            full_mask[y0:y1, x0:x1] = future.result()
+
+    return bgr_eq, boxes_from_mask(full_mask, params["min_box_size"], params["max_box_size"])
+
+def select_joint_method_tiled(image_path, **kwargs):
+    """Path-based wrapper around segment_joints_tiled()."""
+    return segment_joints_tiled(load_image(image_path), **kwargs)
+
+def main():
+    image_path = "newtest3.jpeg"
+    bgr_img, boxes = select_joint_method_tiled(image_path, tile_size=1024, otsu_mode="global")
+    print(f"Found {len(boxes)} bounding boxes (tiled).")
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,139 @@
 #!/usr/bin/env python3
 import tensorflow as tf
 import os
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
+import time
+import zlib
 from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2, preprocess_input
 from tensorflow.keras.layers import GlobalAveragePooling2D, Dense, Dropout
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.optimizers import Adam
-from tensorflow.keras.callbacks import EarlyStopping
+from tensorflow.keras.callbacks import Callback, EarlyStopping
 
-def train_two_phase_finetuning(data_dir, batch_size=8, img_size=(224,224), epochs1=5, epochs2=5):
+from batch_augment import AugmentPolicy, augment_batch
+from feature_cache import FeatureStore, dataset_fingerprint, split_backbone
+from image_seg import IMAGE_EXTENSIONS
+from patch_shards import PatchShards, is_shard_dir
+
+def list_labeled_files(data_dir):
     """
-    Example code for a two-phase fine-tuning approach.
-    1) Phase 1: Freeze partial network from layer 0..fine_tune_at, train at LR=1e-4
-    2) Phase 2: Unfreeze more layers (or all), reduce LR to e.g. 1e-5, train more.
+    Lists data_dir/<class>/* like flow_from_directory: classes are the
+    subfolders in alphabetical order. Returns (paths, labels, class_names).
     """
+    class_names = sorted(d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d)))
+    paths, labels = [], []
+    for class_idx, cls in enumerate(class_names):
+        class_folder = os.path.join(data_dir, cls)
+        for f in sorted(os.listdir(class_folder)):
+            if f.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(class_folder, f))
+                labels.append(class_idx)
+    return paths, labels, class_names
+
+def open_labeled_data(data_dir):
+    """
+    Accepts either the labeled_data/<class>/ folder layout or a packed shard
+    directory (patch_shards.py). Returns (items, labels, class_names, shards):
+    items are file paths for folders, '<class>/<file>' source names for shards
+    (shards is the PatchShards reader, or None for folders).
+    """
+    if is_shard_dir(data_dir):
+        shards = PatchShards(data_dir)
+        return list(shards.sources), [int(y) for y in shards.labels], shards.class_names, shards
+    paths, labels, class_names = list_labeled_files(data_dir)
+    return paths, labels, class_names, None
 
-    train_datagen = ImageDataGenerator(
-        preprocessing_function=preprocess_input,
-        validation_split=0.2
-    )
-
-    train_generator = train_datagen.flow_from_directory(
-        data_dir,
-        target_size=img_size,
-        batch_size=batch_size,
-        class_mode='categorical',
-        subset='training'
-    )
-
-    val_generator = train_datagen.flow_from_directory(
-        data_dir,
-        target_size=img_size,
-        batch_size=batch_size,
-        class_mode='categorical',
-        subset='validation'
-    )
-
-    base_model = MobileNetV2(weights='imagenet', include_top=False,
+def split_train_val(paths, labels, validation_split=0.2):
+    """
+    Deterministic split: a file goes to validation iff the CRC32 of its
+    <class>/<name> falls in the first 'validation_split' of the range, so the
+    split never changes between runs and adding files never moves old ones.
+    """
+    train, val = ([], []), ([], [])
+    for path, label in zip(paths, labels):
+        key = "/".join(path.replace(os.sep, "/").split("/")[-2:])
+        bucket = val if zlib.crc32(key.encode()) / 2**32 < validation_split else train
+        bucket[0].append(path)
+        bucket[1].append(label)
+    return train, val
+
+def decode_patch(path, img_size):
+    """Reads + decodes one patch (RGB, like flow_from_directory) and resizes it to uint8 img_size."""
+    img = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+    img = tf.image.resize(img, img_size, method="nearest")
+    return tf.cast(img, tf.uint8)
+
+def decoded_dataset(file_paths, file_labels, img_size=(224,224), cache=True, shards=None):
+    """
+    (uint8 patch, int label) dataset with parallel decode + resize.
+    cache: True caches in memory after the first pass, a path caches to disk, False doesn't cache.
+    shards: read 'file_paths' (source names) from packed shards instead; they are
+            already decoded and memory-mapped, so no cache is added.
+    """
+    if shards is not None:
+        indices = [shards.index_of[s] for s in file_paths]
+        return shards.tf_dataset(indices, img_size=img_size, rgb=True)
+
+    ds = tf.data.Dataset.from_tensor_slices((file_paths, file_labels))
+    ds = ds.map(lambda p, y: (decode_patch(p, img_size), y), num_parallel_calls=tf.data.AUTOTUNE)
+    if cache is True:
+        ds = ds.cache()
+    elif cache:
+        ds = ds.cache(cache)
+    return ds
+
+def make_datasets(data_dir, batch_size=32, img_size=(224,224), validation_split=0.2,
+                  augment=True, augment_policy=None, augment_seed=0, expansion=1, cache=True):
+    """
+    tf.data input pipeline ('data_dir' may also be a packed shard directory):
+      list files -> deterministic train/val split -> parallel decode + resize
+      -> cache() (in memory, or to the file path given as 'cache') -> shuffle -> batch
+      -> batched augmentation (train only) -> preprocess_input -> prefetch
+
+    The training set repeats forever so the augmentation seed (augment_seed, step)
+    keeps advancing across epochs; use the returned steps_per_epoch with fit().
+    Returns (train_ds, val_ds, steps_per_epoch, class_names).
+    """
+    paths, labels, class_names, shards = open_labeled_data(data_dir)
+    (train_paths, train_labels), (val_paths, val_labels) = split_train_val(paths, labels, validation_split)
+    num_classes = len(class_names)
+    print(f"Found {len(train_paths)} training and {len(val_paths)} validation images "
+          f"belonging to {num_classes} classes.")
+
+    def preprocess(x, y):
+        return preprocess_input(tf.cast(x, tf.float32)), tf.one_hot(y, num_classes)
+
+    if augment and augment_policy is None:
+        augment_policy = AugmentPolicy()
+
+    train_ds = decoded_dataset(train_paths, train_labels, img_size,
+                               f"{cache}_train" if isinstance(cache, str) else cache, shards)
+    train_ds = train_ds.shuffle(max(len(train_paths), 1), seed=augment_seed, reshuffle_each_iteration=True)
+    train_ds = train_ds.repeat().batch(batch_size)
+    if augment:
+        train_ds = tf.data.Dataset.zip((train_ds, tf.data.Dataset.counter()))
+        train_ds = train_ds.map(
+            lambda batch, step: (augment_batch(tf.cast(batch[0], tf.float32),
+                                               tf.stack([tf.constant(augment_seed, tf.int64), step]),
+                                               augment_policy), batch[1]),
+            num_parallel_calls=tf.data.AUTOTUNE, deterministic=True)
+    train_ds = train_ds.map(preprocess, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+    val_ds = decoded_dataset(val_paths, val_labels, img_size,
+                             f"{cache}_val" if isinstance(cache, str) else cache, shards).batch(batch_size)
+    val_ds = val_ds.map(preprocess, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+    steps_per_epoch = max(1, -(-len(train_paths) * expansion // batch_size))
+    return train_ds, val_ds, steps_per_epoch, class_names
+
+def build_model(num_classes, img_size=(224,224), fine_tune_at=100, weights='imagenet'):
+    """
+    MobileNetV2 backbone + classification head. Layers [:fine_tune_at] of the
+    backbone are frozen (phase 1). Returns (model, base_model).
+    """
+    base_model = MobileNetV2(weights=weights, include_top=False,
                              input_shape=(img_size[0], img_size[1], 3))
 
     # Phase 1: Partial freeze
-    fine_tune_at = 100
     for layer in base_model.layers[:fine_tune_at]:
         layer.trainable = False
     for layer in base_model.layers[fine_tune_at:]:
@@ -50,28 +143,149 @@ def train_two_phase_finetuning(data_dir, batch_size=8, img_size=(224,224), epoch
     model = Sequential([
         base_model,
         GlobalAveragePooling2D(),
-        # Dropout 
+        # Dropout
         Dropout(0.3),
         Dense(128, activation='relu'),
-        Dense(train_generator.num_classes, activation='softmax')
+        # Keep the softmax in float32 under mixed precision
+        Dense(num_classes, activation='softmax', dtype='float32')
     ])
+    return model, base_model
+
+def cached_phase1_datasets(model, base_model, data_dir, cache_dir, fine_tune_at=100, batch_size=32,
+                           img_size=(224,224), validation_split=0.2, views=1,
+                           augment_policy=None, augment_seed=0, weights='imagenet'):
+    """
+    Phase-1 shortcut: the frozen layers [:fine_tune_at] are run once over the
+    data and their activations kept in memory-mapped FeatureStores under
+    'cache_dir'. Phase 1 then only trains the unfrozen suffix + head.
+    views=1 caches the un-augmented patches; views=k adds k-1 fixed, seeded
+    augmentations of every training patch.
+    The stores are rebuilt whenever the files, the cut point, the image size,
+    the views/seed or the backbone weights change.
+    Returns (suffix_model, train_ds, val_ds, steps_per_epoch); suffix_model
+    shares its layers with 'model'.
+    """
+    paths, labels, class_names, shards = open_labeled_data(data_dir)
+    (train_paths, train_labels), (val_paths, val_labels) = split_train_val(paths, labels, validation_split)
+    num_classes = len(class_names)
+    prefix_model, suffix_model = split_backbone(base_model, fine_tune_at, head_layers=model.layers[1:])
+    if augment_policy is None:
+        augment_policy = AugmentPolicy()
+
+    def store_for(name, file_paths, file_labels, num_views):
+        key_info = {
+            "data": shards.fingerprint(file_paths) if shards is not None else dataset_fingerprint(file_paths),
+            "cut": fine_tune_at,
+            "img_size": list(img_size),
+            "views": num_views,
+            "seed": augment_seed,
+            "weights": str(weights),
+        }
+        store = FeatureStore(cache_dir, name, key_info)
+        if store.complete:
+            print(f"Reusing cached {name} features -> {store.path}")
+            return store.open()
+
+        images = decoded_dataset(file_paths, file_labels, img_size, cache=False, shards=shards).batch(batch_size)
+
+        def batches_for_view(view):
+            for step, (x, y) in enumerate(images):
+                x = tf.cast(x, tf.float32)
+                if view > 0:
+                    seed = tf.constant([augment_seed, view * 1000000 + step], dtype=tf.int64)
+                    x = augment_batch(x, seed, augment_policy)
+                yield preprocess_input(x), y
+
+        print(f"Caching {name} features for layers [:{fine_tune_at}] -> {store.path}")
+        return store.build(prefix_model, batches_for_view, len(file_paths), views=num_views)
+
+    train_store = store_for("train", train_paths, train_labels, views)
+    val_store = store_for("val", val_paths, val_labels, 1)
+
+    train_ds = train_store.dataset(batch_size, num_classes, shuffle=True, seed=augment_seed, repeat=True)
+    val_ds = val_store.dataset(batch_size, num_classes)
+    steps_per_epoch = max(1, -(-train_store.num_samples // batch_size))
+    return suffix_model, train_ds, val_ds, steps_per_epoch
+
+class EpochTimer(Callback):
+    """Records wall-clock seconds per epoch in self.times."""
+
+    def __init__(self):
+        super().__init__()
+        self.times = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._t0 = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.times.append(time.perf_counter() - self._t0)
+        print(f"Epoch {epoch + 1} took {self.times[-1]:.1f} s")
+
+def train_two_phase_finetuning(data_dir, batch_size=32, img_size=(224,224), epochs1=5, epochs2=5,
+                               augment=True, augment_policy=None, augment_seed=0, expansion=1,
+                               validation_split=0.2, cache=True, mixed_precision=None,
+                               callbacks=None, feature_cache_dir=None, feature_views=1):
+    """
+    Example code for a two-phase fine-tuning approach.
+    1) Phase 1: Freeze partial network from layer 0..fine_tune_at, train at LR=1e-4
+    2) Phase 2: Unfreeze more layers (or all), reduce LR to e.g. 1e-5, train more.
+
+    augment: augment training batches on the fly (batch_augment.py) instead of
+             relying on augmented copies written by augment_labels.py.
+    expansion: augmented views of each training patch per epoch (costs no storage).
+    cache: True caches decoded patches in memory after the first epoch, a path caches to disk.
+    mixed_precision: None, "mixed_float16" (GPU) or "mixed_bfloat16" (recent CPUs).
+    callbacks: extra Keras callbacks (e.g. an EpochTimer) added to both phases.
+    feature_cache_dir: if set, phase 1 trains the unfrozen suffix + head from cached
+                       frozen-prefix activations (see cached_phase1_datasets) instead
+                       of running the whole backbone every epoch.
+    feature_views: un-augmented (1) or 1 + fixed augmented views per patch in that cache.
+    Returns the trained model.
+    """
+    previous_policy = tf.keras.mixed_precision.global_policy()
+    if mixed_precision:
+        tf.keras.mixed_precision.set_global_policy(mixed_precision)
+
+    try:
+        train_ds, val_ds, steps_per_epoch, class_names = make_datasets(
+            data_dir, batch_size=batch_size, img_size=img_size,
+            validation_split=validation_split, augment=augment,
+            augment_policy=augment_policy, augment_seed=augment_seed,
+            expansion=expansion, cache=cache
+        )
+
+        fine_tune_at = 100
+        model, base_model = build_model(len(class_names), img_size, fine_tune_at=fine_tune_at)
+
+        if feature_cache_dir:
+            phase1_model, phase1_train, phase1_val, phase1_steps = cached_phase1_datasets(
+                model, base_model, data_dir, feature_cache_dir, fine_tune_at=fine_tune_at,
+                batch_size=batch_size, img_size=img_size, validation_split=validation_split,
+                views=feature_views, augment_policy=augment_policy, augment_seed=augment_seed
+            )
+        else:
+            phase1_model, phase1_train, phase1_val, phase1_steps = model, train_ds, val_ds, steps_per_epoch
+    finally:
+        tf.keras.mixed_precision.set_global_policy(previous_policy)
 
     # Phase 1 compile: LR=1e-4
     optimizer = Adam(learning_rate=1e-4)
-    model.compile(
+    phase1_model.compile(
         optimizer=optimizer,
         loss='categorical_crossentropy',
         metrics=['accuracy']
     )
 
     early_stop = EarlyStopping(monitor='val_loss', patience=3, restore_best_weights=True)
+    all_callbacks = [early_stop] + list(callbacks or [])
 
     print("------ Phase 1 training ------")
-    model.fit(
-        train_generator,
+    phase1_model.fit(
+        phase1_train,
+        steps_per_epoch=phase1_steps,
         epochs=epochs1,
-        validation_data=val_generator,
-        callbacks=[early_stop]
+        validation_data=phase1_val,
+        callbacks=all_callbacks
     )
 
     # Phase 2: Unfreeze more (or all) + lower LR
@@ -88,151 +302,29 @@ def train_two_phase_finetuning(data_dir, batch_size=8, img_size=(224,224), epoch
 
     print("------ Phase 2 fine-tuning ------")
     model.fit(
-        train_generator,
+        train_ds,
+        steps_per_epoch=steps_per_epoch,
         epochs=epochs2,
-        validation_data=val_generator,
-        callbacks=[early_stop]
+        validation_data=val_ds,
+        callbacks=all_callbacks
     )
 
     model.save("solder_classifier_two_phase.keras")
     print("Saved two-phase model -> 'solder_classifier_two_phase.keras'")
+    return model
 
 def main():
     data_dir = "labeled_data"
     train_two_phase_finetuning(
         data_dir,
-        batch_size=8,
+        batch_size=32,
         img_size=(224,224),
         epochs1=5,   # e.g. 5 epochs for phase 1
-        epochs2=5    # e.g. 5 epochs for phase 2
+        epochs2=5,   # e.g. 5 epochs for phase 2
+        augment=True,
+        expansion=8, # same patch count per epoch as the original + 7 augmented copies
+        callbacks=[EpochTimer()]
     )
 
 if __name__ == "__main__":
     main()
-
-
-import tkinter as tk
-from tkinter import ttk, filedialog
-import cv2
-from PIL import Image, ImageTk
-import numpy as np
-
-class SolderingApp(tk.Tk):
-    def __init__(self):
-        super().__init__()
-
-        self.title("PCB Soldering QA/QC App")
-        self.geometry("1000x600")
-
-        # ----- CAMERA CAPTURE -----
-        # is it device 0?
-        self.cap = cv2.VideoCapture(0, cv2.CAP_DSHOW) 
-        if not self.cap.isOpened():
-            raise RuntimeError("Could not open camera. Please check the camera connection.")
-
-        self.last_frame = None      # Will hold the most recent camera frame in OpenCV format
-        self.captured_image = None  # Holds the captured image (PIL format)
-
-        # ----- UI ELEMENTS -----
-        # Main frames for layout
-        self.left_frame = ttk.Frame(self)
-        self.left_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-
-        self.right_frame = ttk.Frame(self)
-        self.right_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
-
-        # Camera feed label
-        self.camera_label = ttk.Label(self.left_frame, text="Camera Feed")
-        self.camera_label.pack(padx=10, pady=10)
-
-        # Captured / Classified image label
-        self.image_label = ttk.Label(self.right_frame, text="Captured / Classified Image")
-        self.image_label.pack(padx=10, pady=10)
-
-        # Buttons
-        self.capture_button = ttk.Button(
-            self.left_frame, text="Capture Image", command=self.capture_image
-        )
-        self.capture_button.pack(padx=10, pady=5)
-
-        self.classify_button = ttk.Button(
-            self.left_frame, text="Classify", command=self.run_classification
-        )
-        self.classify_button.pack(padx=10, pady=5)
-
-        self.save_button = ttk.Button(
-            self.left_frame, text="Save Image", command=self.save_classified_image
-        )
-        self.save_button.pack(padx=10, pady=5)
-
-        # Start updating the camera feed
-        self.update_camera_feed()
-
-    def update_camera_feed(self):
-        """Continuously capture frames from the camera and display them in the GUI."""
-        ret, frame = self.cap.read()
-        if ret:
-            # Keep the latest frame in memory (OpenCV format)
-            self.last_frame = frame
-
-            # Convert the frame to a format Tkinter can display
-            cv2image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            pil_image = Image.fromarray(cv2image)
-            imgtk = ImageTk.PhotoImage(image=pil_image)
-
-            self.camera_label.imgtk = imgtk  # Keep a reference!
-            self.camera_label.configure(image=imgtk)
-
-        # Schedule the next update
-        self.after(10, self.update_camera_feed)
-
-    def capture_image(self):
-        """Captures the current frame and displays it in the image_label."""
-        if self.last_frame is not None:
-            # Convert the last OpenCV frame to a PIL Image
-            cv2image = cv2.cvtColor(self.last_frame, cv2.COLOR_BGR2RGB)
-            self.captured_image = Image.fromarray(cv2image)
-
-            # Display it in the right panel
-            imgtk = ImageTk.PhotoImage(image=self.captured_image)
-            self.image_label.imgtk = imgtk
-            self.image_label.configure(image=imgtk)
-
-    def run_classification(self):
-        """
-       you would run inference model with yolo here,
-        detect components/defects, and draw bounding boxes, etc.
-        """
-        if self.captured_image is not None:
-
-
-            # Display the classified image in the UI
-            imgtk = ImageTk.PhotoImage(image=?)
-            self.image_label.imgtk = imgtk
-            self.image_label.configure(image=imgtk)
-
-    def save_classified_image(self):
-        """
-        Saves the classified image to a folder chosen by the user.
-         specify a default directory, or let them choose any path.
-        """
-        if self.captured_image is not None:
-            file_path = filedialog.asksaveasfilename(
-                defaultextension=".png",
-                filetypes=[("PNG files", "*.png"), ("JPEG files", "*.jpg"), ("All Files", "*.*")]
-            )
-            if file_path:
-                self.captured_image.save(file_path)
-
-    def on_closing(self):
-        """Release the camera and destroy the window properly."""
-        self.cap.release()
-        self.destroy()
-
-def main():
-    app = SolderingApp()
-    app.protocol("WM_DELETE_WINDOW", app.on_closing)
-    app.mainloop()
-
-if __name__ == "__main__":
-    main()
\ No newline at end of file
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from image_seg import JointSegmenter, iter_image_paths, load_image
+from stage_timing import add_metrics_arguments, finish_metrics, stage, start_metrics
+
+# Labels that make a board fail the batch assessment
+FAIL_LABELS = ("bad", "missing")
+
+def find_boards(bgr_img, min_area_frac=0.02, work_size=800, hue_range=(35, 95), min_saturation=60):
+    """
+    Board regions of a tray capture: solder mask pixels (green hue, saturated)
+    on a downscaled copy, closed into solid blobs; every blob of at least
+    'min_area_frac' of the image becomes one (x, y, w, h) region.
+    Regions are returned in reading order (rows top to bottom, then left to right).
+    """
+    h, w = bgr_img.shape[:2]
+    scale = min(1.0, work_size / max(h, w))
+    small = cv2.resize(bgr_img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else bgr_img
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+    mask = cv2.inRange(hsv, (hue_range[0], min_saturation, 40), (hue_range[1], 255, 255))
+    ksize = max(int(min(small.shape[:2]) * 0.03) | 1, 3)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (ksize, ksize))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    min_area = min_area_frac * small.shape[0] * small.shape[1]
+    regions = []
+    for cnt in contours:
+        x, y, bw, bh = cv2.boundingRect(cnt)
+        if bw * bh < min_area:
+            continue
+        x0, y0 = int(x / scale), int(y / scale)
+        regions.append((x0, y0, min(int(np.ceil((x + bw) / scale)), w) - x0,
+                        min(int(np.ceil((y + bh) / scale)), h) - y0))
+    return sort_reading_order(regions)
+
+def sort_reading_order(regions):
+    """Groups regions into rows (overlapping vertical extent), then sorts each row left to right."""
+    rows = []
+    for r in sorted(regions, key=lambda r: r[1]):
+        if rows and r[1] < rows[-1][0] + rows[-1][1][0][3] / 2:
+            rows[-1][1].append(r)
+        else:
+            rows.append((r[1], [r]))
+    return [r for _, row in rows for r in sorted(row, key=lambda r: r[0])]
+
+def grid_boards(bgr_img, rows, cols, margin=0):
+    """Fixed tray layout: 'rows' x 'cols' equal cells, shrunk by 'margin' px on every side."""
+    h, w = bgr_img.shape[:2]
+    regions = []
+    for r in range(rows):
+        for c in range(cols):
+            x0, x1 = c * w // cols + margin, (c + 1) * w // cols - margin
+            y0, y1 = r * h // rows + margin, (r + 1) * h // rows - margin
+            regions.append((x0, y0, x1 - x0, y1 - y0))
+    return regions
+
+class TrayInspector:
+    """
+    Batch assessment of many boards per capture (README Fig. 13):
+      1) the capture is split into board regions (find_boards or a fixed grid);
+      2) every board is segmented on its own region in a thread pool (Otsu sees
+         one board's histogram, not the tray) with one JointSegmenter per thread;
+      3) the joints of all boards are cropped straight into one shared patch
+         array and classified in pooled chunks of up to 'pool_size' joints, so a
+         tray pays for a few full batches instead of one partial batch per board;
+      4) results are fanned back out into one report per board.
+    """
+
+    def __init__(self, engine, seg_params=None, grid=None, grid_margin=0, workers=None, pool_size=512,
+                 result_log=None):
+        from inference_test import SEG_PARAMS
+
+        self.engine = engine
+        self.seg_params = dict(seg_params or SEG_PARAMS)
+        self.grid = grid
+        self.grid_margin = grid_margin
+        self.workers = workers or os.cpu_count()
+        self.pool_size = pool_size
+        self.result_log = result_log
+        self._local = threading.local()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers)
+
+    def regions(self, bgr_img):
+        with stage("tray.split"):
+            if self.grid is not None:
+                regions = grid_boards(bgr_img, *self.grid, margin=self.grid_margin)
+            else:
+                regions = find_boards(bgr_img)
+        # No board found: treat the whole capture as a single board
+        return regions or [(0, 0, bgr_img.shape[1], bgr_img.shape[0])]
+
+    def _segment(self, bgr_img, region):
+        segmenter = getattr(self._local, "segmenter", None)
+        if segmenter is None:
+            segmenter = self._local.segmenter = JointSegmenter(**self.seg_params)
+        x, y, w, h = region
+        board = bgr_img[y:y+h, x:x+w]
+        bgr_eq, boxes = segmenter.segment(board)
+        if bgr_eq is not board:
+            bgr_eq = bgr_eq.copy()  # the segmenter's buffer is reused by this thread's next board
+        return bgr_eq, boxes
+
+    @staticmethod
+    def _crop(bgr_eq, boxes, out):
+        for i, (x, y, w, h) in enumerate(boxes):
+            cv2.resize(bgr_eq[y:y+h, x:x+w], (224, 224), dst=out[i])
+
+    def inspect(self, bgr_img, capture_id="tray"):
+        """Returns one report per board: {"board_id", "region", "results", "counts", "verdict"}."""
+        from inference_test import joint_results
+
+        t0 = time.perf_counter()
+        regions = self.regions(bgr_img)
+        with stage("tray.segment"):
+            segmented = list(self._pool.map(lambda r: self._segment(bgr_img, r), regions))
+
+        counts = [len(boxes) for _, boxes in segmented]
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(int)
+        patches = np.empty((offsets[-1], 224, 224, 3), dtype=np.uint8)
+        with stage("tray.crop"):
+            list(self._pool.map(lambda i: self._crop(*segmented[i], patches[offsets[i]:offsets[i + 1]]),
+                                range(len(segmented))))
+
+        probs = np.empty((len(patches), len(self.engine.class_names)), dtype=np.float32)
+        with stage("tray.classify"):
+            for start in range(0, len(patches), self.pool_size):
+                probs[start:start + self.pool_size] = self.engine.classify_patches(
+                    patches[start:start + self.pool_size])
+        latency = time.perf_counter() - t0
+
+        reports = []
+        for i, (region, (_, boxes)) in enumerate(zip(regions, segmented)):
+            rx, ry = region[:2]
+            tray_boxes = [(x + rx, y + ry, w, h) for (x, y, w, h) in boxes]
+            results = joint_results(tray_boxes, probs[offsets[i]:offsets[i + 1]], self.engine.class_names)
+            label_counts = {name: 0 for name in self.engine.class_names}
+            for res in results:
+                label_counts[res["label"]] += 1
+            verdict = "fail" if any(label_counts.get(lbl, 0) for lbl in FAIL_LABELS) else "pass"
+            board_id = f"{capture_id}#{i}"
+            reports.append({"board_id": board_id, "region": region, "results": results,
+                            "counts": label_counts, "verdict": verdict})
+            if self.result_log is not None:
+                self.result_log.log_board(board_id, results, self.engine.model_version, latency)
+        return reports
+
+    def inspect_paths(self, inputs, overlay_dir=None):
+        """
+        Inspects every capture (files, folders, globs); the next capture is
+        decoded in the background while the current one is processed.
+        Returns (reports, stats) with throughput numbers.
+        """
+        if overlay_dir is not None and not os.path.exists(overlay_dir):
+            os.makedirs(overlay_dir)
+        paths = iter_image_paths(inputs)
+        reports = []
+        joints = 0
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=1) as reader:
+            pending = reader.submit(load_image, paths[0]) if paths else None
+            for n, path in enumerate(paths):
+                bgr_img = pending.result()
+                if n + 1 < len(paths):
+                    pending = reader.submit(load_image, paths[n + 1])
+                capture_id = os.path.splitext(os.path.basename(path))[0]
+                board_reports = self.inspect(bgr_img, capture_id)
+                for r in board_reports:
+                    r["capture"] = path
+                    joints += len(r["results"])
+                    print(f"{r['board_id']}: {r['verdict']:<4} " +
+                          ", ".join(f"{k} {v}" for k, v in r["counts"].items()))
+                if overlay_dir is not None:
+                    cv2.imwrite(os.path.join(overlay_dir, f"{capture_id}_tray.png"),
+                                draw_tray(bgr_img, board_reports))
+                reports.extend(board_reports)
+        elapsed = time.perf_counter() - t0
+        stats = {"captures": len(paths), "boards": len(reports), "joints": joints, "seconds": elapsed,
+                 "boards_per_s": len(reports) / elapsed if elapsed else 0.0,
+                 "joints_per_s": joints / elapsed if elapsed else 0.0,
+                 "failed_boards": sum(r["verdict"] == "fail" for r in reports)}
+        return reports, stats
+
+    def close(self):
+        self._pool.shutdown()
+
+def draw_tray(bgr_img, reports):
+    """Per-joint overlay plus every board's outline (green pass / red fail) and ID."""
+    from inference_test import draw_results
+
+    overlay = draw_results(bgr_img, [res for r in reports for res in r["results"]])
+    for r in reports:
+        x, y, w, h = r["region"]
+        color = (0, 200, 0) if r["verdict"] == "pass" else (0, 0, 255)
+        cv2.rectangle(overlay, (x, y), (x+w, y+h), color, 4)
+        cv2.putText(overlay, f"{r['board_id']} {r['verdict']}", (x + 8, y + 28),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.9, color, 2)
+    return overlay
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch-assess every board on tray captures.")
+    parser.add_argument("inputs", nargs="+", help="tray captures: files, folders or glob patterns")
+    parser.add_argument("--model", default="solder_classifier_two_phase.keras", help=".keras or .tflite")
+    parser.add_argument("--grid", default=None, help="fixed tray layout RxC (default: find boards by color)")
+    parser.add_argument("--grid-margin", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="segmentation threads (default: all cores)")
+    parser.add_argument("--batch-sizes", default="8,32,64", help="fixed classifier batch shapes")
+    parser.add_argument("--pool-size", type=int, default=512, help="max joints per pooled classify call")
+    parser.add_argument("--overlay-dir", default=None)
+    parser.add_argument("--log-dir", default=None, help="write one row per joint to a result log here")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    start_metrics(args)
+
+    from inference_test import ClassifierEngine
+
+    backend = "tflite" if args.model.endswith(".tflite") else "keras"
+    engine = ClassifierEngine(args.model, backend=backend,
+                              batch_sizes=tuple(int(b) for b in args.batch_sizes.split(",")))
+    grid = tuple(int(v) for v in args.grid.lower().split("x")) if args.grid else None
+    result_log = None
+    if args.log_dir is not None:
+        from result_log import JointResultLog
+
+        result_log = JointResultLog(args.log_dir)
+
+    inspector = TrayInspector(engine, grid=grid, grid_margin=args.grid_margin, workers=args.workers,
+                              pool_size=args.pool_size, result_log=result_log)
+    _, stats = inspector.inspect_paths(args.inputs, overlay_dir=args.overlay_dir)
+    inspector.close()
+    if result_log is not None:
+        result_log.close()
+    print(f"{stats['captures']} captures, {stats['boards']} boards ({stats['failed_boards']} failed), "
+          f"{stats['joints']} joints in {stats['seconds']:.2f} s: "
+          f"{stats['boards_per_s']:.1f} boards/s, {stats['joints_per_s']:.0f} joints/s")
+    finish_metrics(args)
+
+if __name__ == "__main__":
+    main()
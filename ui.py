@@ -3,36 +3,84 @@ from tkinter import ttk, filedialog
 import cv2
 from PIL import Image, ImageTk
 import numpy as np
+import argparse
+import queue
+import time
 
-from ultralytics import YOLO
-from picamera2 import Picamera2
+from frame_pipeline import CaptureThread, FrameRing, InferenceWorker
+from frame_sources import Picamera2Source, open_source
+from inspection_engine import ENGINE_KINDS, EngineAnnotator, make_engine
+from result_log import JointResultLog
+from stage_timing import METRICS, print_summary, stage
 
 class SolderingApp(tk.Tk):
-    def __init__(self, model_path="best.pt", confidence_threshold=0.5):
+    def __init__(self, model_path=None, confidence_threshold=0.5, source=None,
+                 use_cache=False, cache_dir=None, log_dir="inspection_logs", engine="yolo", annotator=None,
+                 incremental=False):
         """
-        model_path: Path to the YOLO model (e.g. 'best.pt' if in the same directory).
-        confidence_threshold: Minimum confidence to draw bounding boxes.
+        model_path: Path to the model (e.g. 'best.pt' if in the same directory);
+                    None uses the engine's default (inspection_engine.DEFAULT_MODELS).
+        confidence_threshold: Minimum confidence to draw bounding boxes (YOLO).
+        source: FrameSource for the live feed (frame_sources.py); defaults to the Pi Camera 2.
+        use_cache: reuse detections of near-identical frames (result_cache.py;
+                   off by default: a cached result can hide a change on the
+                   board, check the hit rate and tolerances on the line first);
+                   cache_dir additionally keeps them on disk across sessions.
+        log_dir: every classified frame's joints are logged as CSV rows here
+                 (result_log.JointResultLog); None disables logging.
+        engine: "yolo", "seg" or "tflite" (built with inspection_engine.make_engine)
+                or an InspectionEngine instance.
+        annotator: any callable RGB frame -> BGR overlay with an 'engine' attribute
+                   (e.g. incremental_inspect.IncrementalInspector); replaces 'engine'.
+        incremental: re-classify only the joints that changed since the last frame
+                     (incremental_inspect.IncrementalInspector; "seg"/"tflite" engines).
         """
         super().__init__()
 
-        self.title("PCB Soldering QA/QC App (YOLO Inference)")
-        self.geometry("1000x600")
+        # --- Load the inspection engine ---
+        self.result_log = JointResultLog(log_dir) if log_dir is not None else None
+        if annotator is None:
+            if isinstance(engine, str):
+                engine = make_engine(engine, model_path, confidence_threshold=confidence_threshold)
+            if incremental:
+                from incremental_inspect import IncrementalInspector
+
+                if not hasattr(engine, "segmenter"):
+                    raise ValueError(f"incremental inspection needs a segmentation engine, got '{engine.name}'")
+                annotator = IncrementalInspector(engine.classifier, segmenter=engine.segmenter,
+                                                 result_log=self.result_log)
+            else:
+                annotator = EngineAnnotator(engine, result_log=self.result_log)
+        self.annotator = annotator
+        self.engine = annotator.engine
+        self.model = getattr(self.engine, "model", None)
+        self.cache = self.engine.enable_cache(disk_dir=cache_dir) if use_cache or cache_dir else None
 
-        # --- Load YOLO model ---
-        self.model = YOLO(model_path)
+        # IncrementalInspector's engine is the ClassifierEngine, named by its backend
+        name = getattr(self.engine, "name", None) or getattr(self.engine, "backend", "custom")
+        mode = name + (", incremental" if incremental else "")
+        self.title(f"PCB Soldering QA/QC App ({mode} inference)")
+        self.geometry("1000x600")
         self.confidence_threshold = confidence_threshold
 
-        # --- Set up Pi Camera 2 ---
-        self.picam2 = Picamera2()
-        config = self.picam2.create_preview_configuration(
-            main={"format": "RGB888", "size": (640, 480)}
-        )
-        self.picam2.configure(config)
-        self.picam2.start()
+        # --- Set up the camera (Pi Camera 2 unless another source is given) ---
+        self.source = source if source is not None else Picamera2Source(size=(640, 480))
 
         self.last_frame = None      # Stores the most recent camera frame (NumPy array, RGB)
         self.captured_image = None  # Stores the captured image (PIL format)
 
+        # --- Capture and inference threads ---
+        # The camera is read on its own thread into a drop-oldest ring buffer; the
+        # model runs on a worker thread and hands annotated frames back through a queue,
+        # so the Tk main thread only ever displays images.
+        self.frame_ring = FrameRing(size=3)
+        self.capture_thread = CaptureThread(self.source.read, self.frame_ring)
+        self.results = queue.Queue()
+        self.inference_worker = InferenceWorker(self.classify_frame, self.frame_ring, results=self.results)
+        self._last_seq = 0
+        self.auto_inspect = tk.BooleanVar(value=False)
+        self.stage_timing = tk.BooleanVar(value=METRICS.enabled)
+
         # --- Define UI Layout ---
         # Left frame holds live camera feed and buttons.
         self.left_frame = ttk.Frame(self)
@@ -63,6 +111,18 @@ class SolderingApp(tk.Tk):
         )
         self.classify_button.pack(side=tk.LEFT, padx=10, pady=5)
 
+        self.auto_check = ttk.Checkbutton(
+            self.button_frame, text="Auto-inspect", variable=self.auto_inspect,
+            command=self.toggle_auto_inspect
+        )
+        self.auto_check.pack(side=tk.LEFT, padx=10, pady=5)
+
+        self.timing_check = ttk.Checkbutton(
+            self.button_frame, text="Stage timings", variable=self.stage_timing,
+            command=self.toggle_stage_timing
+        )
+        self.timing_check.pack(side=tk.LEFT, padx=10, pady=5)
+
         self.save_button = ttk.Button(
             self.button_frame, text="Save Image", command=self.save_classified_image
         )
@@ -77,82 +137,102 @@ class SolderingApp(tk.Tk):
         self.image_label = ttk.Label(self.right_frame, text="Captured / Classified Image")
         self.image_label.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
 
-        # Start updating the camera feed.
+        self.status_label = ttk.Label(self.right_frame, text="")
+        self.status_label.pack(padx=10, pady=(0, 10))
+
+        # Start the threads, then the (display-only) feed and result polling.
+        self.capture_thread.start()
+        self.inference_worker.start()
         self.update_camera_feed()
+        self.poll_results()
 
     def update_camera_feed(self):
         """
-        Continuously capture frames from the Pi Camera 2 and display them in the GUI.
+        Shows the newest frame from the capture thread. Never blocks: if no new
+        frame arrived since the last tick, the display is left as is. Once the
+        capture thread has stopped (camera error or end of a recording), the
+        reason goes to the status line and the feed stops updating.
         """
-        frame = self.picam2.capture_array()  # returns an RGB NumPy array
-        if frame is not None:
+        item = self.frame_ring.latest(after=self._last_seq, timeout=0)
+        if item is not None:
+            self._last_seq, _, frame = item  # frame is an RGB NumPy array
             self.last_frame = frame  # Update last_frame for capture
-            pil_image = Image.fromarray(frame)
-            imgtk = ImageTk.PhotoImage(image=pil_image)
-            self.camera_label.imgtk = imgtk  # Prevent garbage collection.
-            self.camera_label.configure(image=imgtk)
+            with stage("ui.feed"):
+                pil_image = Image.fromarray(frame)
+                imgtk = ImageTk.PhotoImage(image=pil_image)
+                self.camera_label.imgtk = imgtk  # Prevent garbage collection.
+                self.camera_label.configure(image=imgtk)
+        elif not self.capture_thread.is_alive():
+            error = self.capture_thread.error
+            self.status_label.configure(text=f"Camera failed: {error}" if error is not None
+                                        else "Camera feed ended")
+            return
         # Update again after 30 ms.
         self.after(30, self.update_camera_feed)
 
+    def show_image(self, pil_image):
+        """Displays a PIL image in the right-hand panel."""
+        self.captured_image = pil_image
+        with stage("ui.show"):
+            imgtk = ImageTk.PhotoImage(image=pil_image)
+            self.image_label.imgtk = imgtk
+            self.image_label.configure(image=imgtk)
+
     def capture_image(self):
         """
         Captures the current frame (self.last_frame) and displays it on the right.
         """
         if self.last_frame is not None:
-            self.captured_image = Image.fromarray(self.last_frame)
-            imgtk = ImageTk.PhotoImage(image=self.captured_image)
-            self.image_label.imgtk = imgtk
-            self.image_label.configure(image=imgtk)
+            self.show_image(Image.fromarray(self.last_frame))
+
+    def classify_frame(self, rgb_frame):
+        """
+        Runs inference on an RGB frame and returns a BGR copy with colored
+        bounding boxes based on class name (the annotator, same contract as
+        the headless runner's). Called on the inference thread.
+        """
+        return self.annotator(rgb_frame)
 
     def run_classification(self):
         """
-        Runs YOLO inference on the captured image, draws colored bounding boxes
-        based on class name, and updates the display.
+        Queues the captured image for inference; the annotated result is shown
+        by poll_results() when the worker is done, so the GUI never freezes.
         """
         if self.captured_image is not None:
-            # Convert from PIL (RGB) to OpenCV format (BGR).
-            open_cv_image = cv2.cvtColor(np.array(self.captured_image), cv2.COLOR_RGB2BGR)
+            self.status_label.configure(text="Classifying...")
+            self.inference_worker.submit(np.array(self.captured_image))
 
-            # YOLO Inference.
-            results = self.model(open_cv_image, verbose=False)
-            detections = results[0].boxes  # Get detections from the first result.
+    def toggle_auto_inspect(self):
+        """Continuously classify the newest camera frame while checked."""
+        self.inference_worker.set_auto(self.auto_inspect.get())
 
-            for box in detections:
-                conf = float(box.conf[0].item())
-                if conf < self.confidence_threshold:
-                    continue
+    def toggle_stage_timing(self):
+        """Switches stage_timing on/off; turning it off prints the per-stage summary so far."""
+        if self.stage_timing.get():
+            METRICS.enable()
+        else:
+            METRICS.disable()
+            print_summary()
 
-                cls_id = int(box.cls[0].item())
-                xyxy = box.xyxy[0].cpu().numpy().astype(int)
-                xmin, ymin, xmax, ymax = xyxy
-
-                # Get class name.
-                class_name = self.model.names.get(cls_id, f"CLS_{cls_id}")
-
-                # Determine bounding box color based on class name.
-                if class_name.lower() == "good":
-                    color = (0, 255, 0)        # Green.
-                elif class_name.lower() == "missing":
-                    color = (0, 0, 255)        # red.
-                elif class_name.lower() == "red":
-                    color = (0, 165, 255)      # Orange.
-                else:
-                    color = (255, 255, 255)    # White as default.
-
-                # Draw bounding box.
-                cv2.rectangle(open_cv_image, (xmin, ymin), (xmax, ymax), color, 2)
-                label = f"{class_name}: {conf:.2f}"
-                cv2.putText(
-                    open_cv_image, label, (xmin, max(ymin - 5, 15)),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1
-                )
-
-            # Convert back to PIL for display.
-            classified_pil = Image.fromarray(cv2.cvtColor(open_cv_image, cv2.COLOR_BGR2RGB))
-            self.captured_image = classified_pil
-            imgtk = ImageTk.PhotoImage(image=classified_pil)
-            self.image_label.imgtk = imgtk
-            self.image_label.configure(image=imgtk)
+    def poll_results(self):
+        """Moves finished inference results from the worker queue onto the display."""
+        try:
+            while True:
+                seq, frame, output, seconds, captured_at = self.results.get_nowait()
+                if isinstance(output, Exception):
+                    self.status_label.configure(text=f"Inference failed: {output}")
+                    continue
+                # Convert back to PIL for display.
+                self.show_image(Image.fromarray(cv2.cvtColor(output, cv2.COLOR_BGR2RGB)))
+                mode = "auto" if seq else "captured"
+                cache_info = "" if self.cache is None else f", {self.cache.hit_rate() * 100:.0f}% cache hits"
+                self.status_label.configure(
+                    text=f"{mode}: inference {seconds * 1000:.0f} ms, "
+                         f"capture-to-result {(time.perf_counter() - captured_at) * 1000:.0f} ms, "
+                         f"{self.frame_ring.dropped} frames dropped{cache_info}")
+        except queue.Empty:
+            pass
+        self.after(30, self.poll_results)
 
     def save_classified_image(self):
         """
@@ -167,12 +247,35 @@ class SolderingApp(tk.Tk):
                 self.captured_image.save(file_path)
 
     def on_closing(self):
-        """Stop the camera and close the application."""
-        self.picam2.stop()
+        """Stop the threads and the camera, then close the application."""
+        self.inference_worker.stop()
+        self.capture_thread.stop()
+        self.source.close()
+        if self.result_log is not None:
+            self.result_log.close()
+        if METRICS.enabled:
+            print_summary()
         self.destroy()
 
 def main():
-    app = SolderingApp(model_path="best.pt", confidence_threshold=0.5)
+    parser = argparse.ArgumentParser(description="PCB soldering QA/QC GUI.")
+    parser.add_argument("source", nargs="?", default=None,
+                        help="frame source (see frame_sources.open_source), e.g. a recorded video; "
+                             "default: the Pi Camera 2")
+    parser.add_argument("--engine", choices=ENGINE_KINDS, default="yolo")
+    parser.add_argument("--model", default=None, help="model file (default: the engine's default model)")
+    parser.add_argument("--confidence", type=float, default=0.5, help="YOLO confidence threshold")
+    parser.add_argument("--incremental", action="store_true",
+                        help="seg/tflite: only re-classify joints that changed (incremental_inspect.py)")
+    parser.add_argument("--cache", action="store_true", help="reuse results of near-identical frames/patches")
+    parser.add_argument("--cache-dir", default=None, help="also keep cached results on disk here")
+    parser.add_argument("--log-dir", default="inspection_logs")
+    args = parser.parse_args()
+
+    source = open_source(args.source) if args.source is not None else None
+    app = SolderingApp(model_path=args.model, confidence_threshold=args.confidence, source=source,
+                       use_cache=args.cache, cache_dir=args.cache_dir, log_dir=args.log_dir, engine=args.engine,
+                       incremental=args.incremental)
     app.protocol("WM_DELETE_WINDOW", app.on_closing)
     app.mainloop()
 